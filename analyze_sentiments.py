@@ -1,16 +1,303 @@
 import sqlite3
 import os
-from transformers import pipeline
+import re
+import time
+import argparse
+from collections import Counter
 from tqdm import tqdm
+from db_streaming import iter_keyset_chunks, CheckpointedWriter
+from inference_cache import InferenceCache
+from database_setup import migrate_schema, bump_draft_generations, bump_comment_drafts, BUSY_TIMEOUT_SECONDS
+from inference_service import load_pipeline
+from near_duplicates import fan_out_to_members
 
 # --- Configuration ---
 DATABASE_FILE = "econsultation.db"
 MODEL_NAME = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+# Pin this to a commit hash to make cached results tied to an exact model version.
+MODEL_REVISION = "main"
+# Batched inference settings. A batch is closed when it reaches BATCH_SIZE rows or
+# when (rows x longest row) would exceed MAX_BATCH_TOKENS, so short comments are
+# packed densely and a single long comment doesn't pad out a whole batch.
+BATCH_SIZE = 32
+MAX_BATCH_TOKENS = 8192
+MAX_SEQUENCE_LENGTH = 512
+# Part of the inference cache key; change it if the pipeline call changes.
+SENTIMENT_PARAMS = {"top_k": None, "truncation": True, "max_length": MAX_SEQUENCE_LENGTH}
 
-def analyze_and_update_sentiments_v2():
+# --- Cascade ---
+# Each comment is labelled by the cheapest tier that is confident enough, and
+# comments.sentiment_tier records which one it was:
+#   rule       action_type alone decides (RULES, applied in SQL)
+#   lexicon    a short text with an unambiguous cue word (lexicon_label)
+#   distilled  CASCADE_MODEL_NAME, a small distilled 3-class classifier
+#   full       MODEL_NAME, for everything the cheaper tiers are unsure of
+# sentiment_calibration.py measures each tier's agreement with the full model;
+# check it before moving CONFIDENCE_THRESHOLD.
+CASCADE_ENABLED = True
+CASCADE_MODEL_NAME = "lxyuan/distilbert-base-multilingual-cased-sentiments-student"
+CASCADE_MODEL_REVISION = "main"
+# The lexicon and distilled tiers keep a label only at or above this confidence.
+CONFIDENCE_THRESHOLD = 0.85
+
+# (label, condition) pairs applied in order to every unlabelled comment; the
+# first matching rule wins.
+RULES = [
+    # 'Suggest removal' is always Negative
+    ("Negative", "action_type = 'Suggest removal'"),
+    # Agreement with no text is always Positive
+    ("Positive", "action_type IN ('In Agreement', 'Implicit Agreement') AND (comment_text IS NULL OR comment_text = '')"),
+    # Anything else with no text has nothing to be positive or negative about
+    ("Neutral", "comment_text IS NULL OR comment_text = ''"),
+]
+
+# The lexicon tier only looks at comments of at most this many words; longer
+# ones can qualify their cue words in ways a word list cannot see.
+SHORT_TEXT_MAX_WORDS = 8
+POSITIVE_CUES = {
+    "agree", "agreed", "support", "supported", "supports", "welcome", "welcomed", "good", "great",
+    "excellent", "appreciate", "appreciated", "commend", "approve", "approved", "endorse", "thanks", "thank",
+}
+NEGATIVE_CUES = {
+    "disagree", "disagreed", "oppose", "opposed", "object", "objection", "reject", "rejected", "remove",
+    "delete", "scrap", "withdraw", "unfair", "bad", "poor", "unacceptable", "unworkable", "arbitrary", "harmful",
+}
+NEGATORS = {"not", "no", "never", "nor", "cannot", "can't", "don't", "doesn't", "isn't", "won't", "without", "hardly"}
+NEUTRAL_TEXTS = {"nil", "na", "n a", "none", "no comment", "no comments", "nothing to add", "noted", "ok", "okay"}
+# The label an action_type implies. A cue agreeing with it is near-certain; one
+# contradicting it is left to the models.
+ACTION_TYPE_PRIORS = {"In Agreement": "Positive", "Implicit Agreement": "Positive"}
+LEXICON_CONFIDENCE = 0.9
+LEXICON_CONFIDENCE_WITH_PRIOR = 0.97
+
+_WORD = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+def to_sentiment_label(scores):
+    """
+    Maps the raw pipeline output for one comment (a list of label/score dicts)
+    to our (sentiment_label, sentiment_score) pair.
+    """
+    top_result = max(scores, key=lambda r: r['score'])
+    label = top_result['label'].capitalize()
+
+    sentiment_label = 'Neutral' # Default
+    if label == 'Negative':
+        sentiment_label = 'Negative'
+    elif label == 'Positive':
+        sentiment_label = 'Positive'
+    return sentiment_label, top_result['score']
+
+
+def lexicon_label(action_type, text):
+    """
+    Returns (sentiment_label, confidence) for a short comment whose words leave
+    no doubt, or None. Negated, mixed or absent cues are left to the models.
+    """
+    words = _WORD.findall((text or "").lower().replace("’", "'"))
+    if not words or len(words) > SHORT_TEXT_MAX_WORDS:
+        return None
+    if " ".join(words) in NEUTRAL_TEXTS:
+        return 'Neutral', LEXICON_CONFIDENCE
+    if NEGATORS.intersection(words):
+        return None
+    positive, negative = POSITIVE_CUES.intersection(words), NEGATIVE_CUES.intersection(words)
+    if bool(positive) == bool(negative):
+        return None
+    label = 'Positive' if positive else 'Negative'
+    prior = ACTION_TYPE_PRIORS.get(action_type)
+    if prior is None:
+        return label, LEXICON_CONFIDENCE
+    return (label, LEXICON_CONFIDENCE_WITH_PRIOR) if prior == label else None
+
+
+def build_length_sorted_batches(rows, tokenizer, batch_size=BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS):
+    """
+    Groups (comment_id, comment_text) rows into padding-aware batches.
+    Rows are sorted by token length so each batch holds comments of similar size,
+    and a batch is cut as soon as its padded size (rows x longest) would go over
+    the token budget.
+    """
+    texts = [text for _, text in rows]
+    encoded = tokenizer(texts, truncation=True, max_length=MAX_SEQUENCE_LENGTH)
+    lengths = [len(ids) for ids in encoded['input_ids']]
+    ordered = sorted(zip(rows, lengths), key=lambda pair: pair[1])
+
+    batches = []
+    batch, longest = [], 0
+    for row, length in ordered:
+        padded_size = (len(batch) + 1) * max(longest, length)
+        if batch and (len(batch) >= batch_size or padded_size > max_batch_tokens):
+            batches.append(batch)
+            batch, longest = [], 0
+        batch.append(row)
+        longest = max(longest, length)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def classify_batch(sentiment_pipeline, batch):
+    """
+    Runs one batch through the model and returns (sentiment_label, score, comment_id)
+    tuples. If the batch fails, it is split in half and retried so that only the
+    offending comment ends up marked as 'Error'.
+    """
+    texts = [text for _, text in batch]
+    try:
+        results = sentiment_pipeline(
+            texts, batch_size=len(texts), truncation=True, max_length=MAX_SEQUENCE_LENGTH
+        )
+        return [(*to_sentiment_label(scores), comment_id) for (comment_id, _), scores in zip(batch, results)]
+    except Exception as e:
+        if len(batch) == 1:
+            comment_id = batch[0][0]
+            print(f"\nCould not process comment_id {comment_id}. Error: {e}")
+            return [('Error', 0.0, comment_id)]
+        middle = len(batch) // 2
+        return classify_batch(sentiment_pipeline, batch[:middle]) + classify_batch(sentiment_pipeline, batch[middle:])
+
+
+class SentimentCascade:
+    """
+    The lexicon, distilled and full tiers. Each model has its own inference
+    cache and is only loaded once a comment actually needs it, so a run the
+    cheap tiers (or the caches) fully answer never loads RoBERTa.
+    """
+
+    MODELS = {
+        "distilled": (CASCADE_MODEL_NAME, CASCADE_MODEL_REVISION),
+        "full": (MODEL_NAME, MODEL_REVISION),
+    }
+
+    def __init__(self, confidence_threshold=CONFIDENCE_THRESHOLD, cascade=CASCADE_ENABLED,
+                 batch_size=BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS):
+        self.confidence_threshold = confidence_threshold
+        self.cascade = cascade
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.pipelines = {}
+        self.caches = {
+            tier: InferenceCache(model, "sentiment-analysis", revision)
+            for tier, (model, revision) in self.MODELS.items() if cascade or tier == "full"
+        }
+        self.tier_counts = Counter()
+
+    def pipeline(self, tier):
+        if tier not in self.pipelines:
+            model, revision = self.MODELS[tier]
+            print(f"\nLoading the {tier} sentiment model: '{model}'...")
+            # Served by inference_service.py when it is running, otherwise loaded here.
+            self.pipelines[tier] = load_pipeline("sentiment-analysis", model, revision, top_k=None)
+            # From here on the tier's outputs are keyed on the backend the model runs on.
+            self.caches[tier].pipeline = self.pipelines[tier]
+        return self.pipelines[tier]
+
+    def cached(self, tier, rows):
+        """{comment_id: (label, score)} for the (comment_id, text) rows in the tier's cache."""
+        found = self.caches[tier].get_many([text for _, text in rows], SENTIMENT_PARAMS)
+        return {comment_id: tuple(found[text]) for comment_id, text in rows if text in found}
+
+    def classify(self, tier, rows, use_cache=True):
+        """{comment_id: (label, score)} for (comment_id, text) rows, from the cache or the tier's model."""
+        results = self.cached(tier, rows) if use_cache else {}
+        to_classify = [(comment_id, text) for comment_id, text in rows if comment_id not in results]
+        if not to_classify:
+            return results
+        sentiment_pipeline = self.pipeline(tier)
+        for batch in build_length_sorted_batches(to_classify, sentiment_pipeline.tokenizer, self.batch_size, self.max_batch_tokens):
+            batch_results = classify_batch(sentiment_pipeline, batch)
+            texts_by_id = dict(batch)
+            self.caches[tier].put_many(
+                [(texts_by_id[comment_id], [label, score]) for label, score, comment_id in batch_results if label != 'Error'],
+                SENTIMENT_PARAMS
+            )
+            results.update((comment_id, (label, score)) for label, score, comment_id in batch_results)
+        return results
+
+    def label_chunk(self, chunk):
+        """
+        Labels (comment_id, comment_text, action_type) rows, each by the
+        cheapest confident tier. Returns (label, score, tier, comment_id) tuples.
+        """
+        labelled, remaining = [], []
+        for comment_id, text, action_type in chunk:
+            guess = lexicon_label(action_type, text) if self.cascade else None
+            if guess and guess[1] >= self.confidence_threshold:
+                labelled.append((*guess, "lexicon", comment_id))
+            else:
+                remaining.append((comment_id, text))
+
+        if remaining and self.cascade:
+            # A label the full model already produced for the same text is free and final.
+            full_cached = self.cached("full", remaining)
+            labelled += [(label, score, "full", comment_id) for comment_id, (label, score) in full_cached.items()]
+            remaining = [row for row in remaining if row[0] not in full_cached]
+            distilled = self.classify("distilled", remaining) if remaining else {}
+            escalate = []
+            for comment_id, text in remaining:
+                label, score = distilled[comment_id]
+                if label != 'Error' and score >= self.confidence_threshold:
+                    labelled.append((label, score, "distilled", comment_id))
+                else:
+                    escalate.append((comment_id, text))
+            remaining = escalate
+
+        if remaining:
+            # With the cascade on, the full model's cache was already checked above.
+            full = self.classify("full", remaining, use_cache=not self.cascade)
+            labelled += [(label, score, "full", comment_id) for comment_id, (label, score) in full.items()]
+
+        self.tier_counts.update(tier for _, _, tier, _ in labelled)
+        return labelled
+
+    def report(self):
+        total = sum(self.tier_counts.values())
+        if total:
+            shares = ", ".join(f"{tier} {count} ({100.0 * count / total:.1f}%)" for tier, count in self.tier_counts.most_common())
+            print(f"Labelled by tier: {shares}.")
+        for cache in self.caches.values():
+            cache.report()
+
+    def close(self):
+        for cache in self.caches.values():
+            cache.close()
+
+
+def apply_rules(conn):
+    """Labels every unlabelled comment a rule covers. Returns the number labelled per rule."""
+    counts = []
+    for label, condition in RULES:
+        cursor = conn.execute(f"""
+            UPDATE comments SET sentiment_label = ?, sentiment_score = 1.0, sentiment_tier = 'rule'
+            WHERE sentiment_label IS NULL AND ({condition})
+        """, (label,))
+        counts.append(cursor.rowcount)
+    conn.commit()
+    return counts
+
+
+def fan_out_sentiments(conn):
+    """Copies each canonical comment's label to its unlabelled near-duplicates."""
+    copied = fan_out_to_members(
+        conn, ["sentiment_label", "sentiment_score", "sentiment_tier"],
+        "comments.sentiment_label IS NULL",
+        "canonical.sentiment_label IS NOT NULL AND canonical.sentiment_label != 'Error'"
+    )
+    if copied:
+        bump_comment_drafts(conn, copied)
+        print(f"Copied labels to {len(copied)} near-duplicate comments.")
+
+
+def analyze_and_update_sentiments_v2(batch_size=BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS,
+                                     confidence_threshold=CONFIDENCE_THRESHOLD, cascade=CASCADE_ENABLED):
     """
     V2: Connects to the database, first handles simple rule-based sentiments,
     then analyzes the rest with the AI model, ensuring all comments are processed.
+    Comments are classified in length-sorted batches; batch_size=1 gives the
+    old one-comment-at-a-time behaviour. With 'cascade', comments go through the
+    lexicon and distilled tiers first and only reach the full model when those
+    are less confident than 'confidence_threshold'.
     """
     if not os.path.exists(DATABASE_FILE):
         print(f"Error: Database file '{DATABASE_FILE}' not found.")
@@ -18,89 +305,78 @@ def analyze_and_update_sentiments_v2():
         return
 
     conn = None
+    cascade_tiers = None
     try:
         # --- 1. Connect to the Database ---
-        conn = sqlite3.connect(DATABASE_FILE)
+        conn = sqlite3.connect(DATABASE_FILE, timeout=BUSY_TIMEOUT_SECONDS)
         cursor = conn.cursor()
         print("Successfully connected to the database.")
+        # Makes sure the worklist index exists on databases created before it.
+        migrate_schema(conn)
 
         # --- PRELIMINARY STEP: Handle Rule-Based Sentiments ---
         print("Processing simple rule-based sentiments first...")
-        
-        # Rule 1: 'Suggest removal' is always Negative
-        cursor.execute("""
-            UPDATE comments
-            SET sentiment_label = 'Negative', sentiment_score = 1.0
-            WHERE action_type = 'Suggest removal' AND sentiment_label IS NULL
-        """)
-        removed_count = cursor.rowcount
-
-        # Rule 2: 'In Agreement' with no text is always Positive
-        cursor.execute("""
-            UPDATE comments
-            SET sentiment_label = 'Positive', sentiment_score = 1.0
-            WHERE action_type = 'In Agreement' AND (comment_text IS NULL OR comment_text = '') AND sentiment_label IS NULL
-        """)
-        agreed_count = cursor.rowcount
-
-        conn.commit()
-        
-        if (removed_count + agreed_count) > 0:
-            print(f"Updated {removed_count} 'Suggest removal' and {agreed_count} 'In Agreement' comments based on rules.")
-
-        # --- 2. Fetch Remaining Unprocessed Comments with Text ---
-        cursor.execute("SELECT comment_id, comment_text FROM comments WHERE sentiment_label IS NULL AND comment_text IS NOT NULL AND comment_text != ''")
-        comments_to_process = cursor.fetchall()
-        
-        if not comments_to_process:
+        rule_counts = apply_rules(conn)
+        if sum(rule_counts) > 0:
+            bump_draft_generations(conn)
+            print("Labelled by rules: " + ", ".join(
+                f"{count} {label} ({condition})" for (label, condition), count in zip(RULES, rule_counts) if count
+            ) + ".")
+
+        # --- 2. Count Remaining Unprocessed Comments with Text ---
+        # Near-duplicates (see near_duplicates.py) are not classified themselves;
+        # they get their cluster's canonical label afterwards.
+        pending_filter = (
+            "FROM comments WHERE sentiment_label IS NULL AND comment_text IS NOT NULL AND comment_text != '' "
+            "AND (cluster_id IS NULL OR cluster_id = comment_id)"
+        )
+        pending_count = cursor.execute(f"SELECT COUNT(*) {pending_filter}").fetchone()[0]
+
+        if not pending_count:
+            fan_out_sentiments(conn)
             print("No new comments to analyze with AI. All comments have been processed.")
             return
 
-        print(f"Found {len(comments_to_process)} comments that require AI analysis.")
-
-        # --- 3. Load the AI Model ---
-        print(f"Loading sentiment analysis model: '{MODEL_NAME}'...")
-        sentiment_pipeline = pipeline("sentiment-analysis", model=MODEL_NAME, top_k=None)
-        print("Model loaded successfully.")
-        
-        # --- 4. Process with AI and Prepare for Update ---
-        updates_to_make = []
-        print("Analyzing sentiments with AI...")
-        
-        for comment_id, comment_text in tqdm(comments_to_process, desc="Processing Comments"):
-            try:
-                results = sentiment_pipeline(comment_text)
-                top_result = results[0][0] 
-                label = top_result['label'].capitalize()
-                score = top_result['score']
-                
-                sentiment_label = 'Neutral' # Default
-                if label == 'Negative':
-                    sentiment_label = 'Negative'
-                elif label == 'Positive':
-                    sentiment_label = 'Positive'
-                    
-                updates_to_make.append((sentiment_label, score, comment_id))
-            
-            except Exception as e:
-                print(f"\nCould not process comment_id {comment_id}. Error: {e}")
-                updates_to_make.append(('Error', 0.0, comment_id))
-
-        # --- 5. Update the Database ---
-        if updates_to_make:
-            print("\nAI Analysis complete. Updating the database...")
-            update_query = "UPDATE comments SET sentiment_label = ?, sentiment_score = ? WHERE comment_id = ?"
-            cursor.executemany(update_query, updates_to_make)
-            conn.commit()
-            print(f"Successfully updated {len(updates_to_make)} records in the database with AI results.")
+        print(f"Found {pending_count} comments that require AI analysis.")
+
+        # --- 3. Set Up the Tiers (models load on first use) ---
+        cascade_tiers = SentimentCascade(confidence_threshold, cascade, batch_size, max_batch_tokens)
+
+        # --- 4. Stream Chunks Through the Cascade, Committing as We Go ---
+        print(f"Analyzing sentiments (cascade={'on, threshold ' + str(confidence_threshold) if cascade else 'off'}, "
+              f"batch_size={batch_size}, max_batch_tokens={max_batch_tokens})...")
+        update_query = "UPDATE comments SET sentiment_label = ?, sentiment_score = ?, sentiment_tier = ? WHERE comment_id = ?"
+        start_time = time.perf_counter()
+        # Each checkpoint invalidates the API's cached responses for the drafts it
+        # wrote to, so dashboards see new labels. comment_id is each row's last value.
+        on_commit = lambda rows: bump_comment_drafts(conn, [row[-1] for row in rows])
+        with CheckpointedWriter(conn, update_query, on_commit=on_commit) as writer, tqdm(total=pending_count, desc="Processing Comments") as progress:
+            for chunk in iter_keyset_chunks(conn, f"SELECT comment_id, comment_text, action_type {pending_filter}"):
+                writer.add(cascade_tiers.label_chunk(chunk))
+                progress.update(len(chunk))
+
+        elapsed = time.perf_counter() - start_time
+        rate = writer.written / elapsed if elapsed > 0 else 0.0
+        print(f"\nClassified {writer.written} comments in {elapsed:.1f}s ({rate:.1f} comments/sec).")
+        print(f"Successfully updated {writer.written} records in the database with AI results.")
+        fan_out_sentiments(conn)
+        cascade_tiers.report()
 
     except sqlite3.Error as e:
         print(f"Database error: {e}")
+        raise
     finally:
+        if cascade_tiers:
+            cascade_tiers.close()
         if conn:
             conn.close()
             print("Database connection closed.")
 
 
 if __name__ == '__main__':
-    analyze_and_update_sentiments_v2()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Label comment sentiment with the rule, lexicon, distilled and full-model tiers.")
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD,
+                        help="Confidence below which the cheap tiers escalate to the full model.")
+    parser.add_argument("--no-cascade", action="store_true", help="Send every comment with text to the full model.")
+    args = parser.parse_args()
+    analyze_and_update_sentiments_v2(confidence_threshold=args.threshold, cascade=not args.no_cascade)
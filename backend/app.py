@@ -1,22 +1,142 @@
 import sqlite3
+import re
 import time
-from flask import Flask, jsonify, send_from_directory
+import json
+import html
+import itertools
+import functools
+import heapq
+from flask import Flask, jsonify, send_from_directory, g, request, Response, stream_with_context
 from flask_cors import CORS
 import os
+import threading
+from db_pool import ConnectionPool
+from response_cache import ResponseCache, make_etag, choose_encoding
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
 CORS(app) # Allow all origins for simplicity in the hackathon
 DATABASE_FILE = 'econsultation.db'
 
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    Returns this worker process's connection pool. Under gunicorn the pool is
+    created after the fork, so every worker gets its own connections.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(DATABASE_FILE)
+        return _pool
+
 def get_db_connection():
-    """Creates a database connection with dictionary-like row access."""
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """
+    Returns a pooled, read-only database connection with dictionary-like row
+    access. The connection is held for the rest of the request and handed
+    back to the pool on teardown.
+    """
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+# --- Schema Checks ---
+# The tables and columns the analysis jobs read and write are added by
+# database_setup.py (migrate_schema). The backend only reads, so on a database
+# that predates them the endpoints that need them answer 503 with the fix.
+
+def missing_schema(conn, required):
+    """Returns the 'table' and 'table.column' names in 'required' the database lacks."""
+    missing = []
+    for name in required:
+        table, _, column = name.partition('.')
+        columns = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if not columns or (column and column not in columns):
+            missing.append(name)
+    return missing
+
+def requires_schema(*required):
+    """Answers 503 instead of running the view while any of 'required' is missing."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            missing = missing_schema(get_db_connection(), required)
+            if missing:
+                return jsonify({"error": f"The database has no {', '.join(missing)} yet; run "
+                                         f"'python database_setup.py --db {os.path.abspath(DATABASE_FILE)}' to migrate it."}), 503
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --- Response Caching ---
+# Responses are cached per (URL, generation), where the generation is the
+# draft's counter in draft_generations, bumped by every analysis job after it
+# writes. Clients get strong ETags and 304s until a job touches their draft.
+
+response_cache = ResponseCache()
+
+def get_generation(draft_id):
+    """
+    Returns the current generation for a draft, or for all drafts when
+    draft_id is None. Returns None if the database predates draft_generations.
+    """
+    conn = get_db_connection()
+    if missing_schema(conn, ['draft_generations']):
+        return None
+    if draft_id is None:
+        return tuple(conn.execute(
+            "SELECT (SELECT COUNT(*) FROM drafts), COUNT(*), COALESCE(SUM(generation), 0) FROM draft_generations"
+        ).fetchone())
+    row = conn.execute("SELECT generation FROM draft_generations WHERE draft_id = ?", (draft_id,)).fetchone()
+    return row[0] if row else 0
+
+def cached_by_generation(view):
+    """
+    Serves a view from the response cache, answering conditional GETs with 304
+    and pre-compressed (gzip, and brotli if installed) bodies otherwise.
+    Views taking a draft_id are keyed on that draft; others on all drafts.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        generation = get_generation(kwargs.get('draft_id'))
+        if generation is None:
+            return view(*args, **kwargs)
+
+        cache_key = (request.full_path, generation)
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        etag = make_etag(cache_key, encoding)
+        if etag in request.if_none_match:
+            response_cache.record_not_modified()
+            response = Response(status=304)
+        else:
+            entry = response_cache.get(cache_key)
+            if entry is None:
+                response = app.make_response(view(*args, **kwargs))
+                # Errors and streamed bodies are passed through uncached.
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = response_cache.put(cache_key, response.get_data(), response.mimetype)
+            response = Response(entry.encodings[encoding], mimetype=entry.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+    return wrapper
 
 # --- API Endpoints ---
 
 @app.route('/api/drafts', methods=['GET'])
+@cached_by_generation
 def get_drafts():
     """
     UPGRADED: Returns a list of all drafts, now including all AI analysis columns.
@@ -25,10 +145,10 @@ def get_drafts():
     conn = get_db_connection()
     # Using SELECT * is the easiest way to include all the new columns
     drafts = conn.execute('SELECT * FROM drafts').fetchall()
-    conn.close()
     return jsonify([dict(row) for row in drafts])
 
 @app.route('/api/sections/<int:draft_id>')
+@cached_by_generation
 def get_sections_for_draft(draft_id):
     """
     UPGRADED: Returns all sections for a specific draft, including all new AI analysis columns.
@@ -40,68 +160,474 @@ def get_sections_for_draft(draft_id):
         'SELECT * FROM sections WHERE draft_id = ?', 
         (draft_id,)
     ).fetchall()
-    conn.close()
     return jsonify([dict(row) for row in sections])
     
+# Fields the dashboard can ask for with ?fields=, mapped to their SQL expressions.
+INDUSTRY_SQL = "CASE WHEN u.industry IS NULL OR u.industry = '' THEN 'Individual' ELSE u.industry END"
+COMMENT_FIELDS = {
+    'comment_id': 'c.comment_id',
+    'submission_id': 'c.submission_id',
+    'section_id': 'c.section_id',
+    'action_type': 'c.action_type',
+    'comment_text': 'c.comment_text',
+    'created_at': 'c.created_at',
+    'updated_at': 'c.updated_at',
+    'sentiment_label': 'c.sentiment_label',
+    'sentiment_score': 'c.sentiment_score',
+    # rule, lexicon, distilled or full (see analyze_sentiments.py)
+    'sentiment_tier': 'c.sentiment_tier',
+    # Per-class scores (see SCHEMA_MIGRATIONS in database_setup.py)
+    'score_positive': 'c.score_positive',
+    'score_neutral': 'c.score_neutral',
+    'score_negative': 'c.score_negative',
+    'ai_summary': 'c.ai_summary',
+    'word_cloud_image_path': 'c.word_cloud_image_path',
+    # comment_id of the comment's near-duplicate cluster (see near_duplicates.py)
+    'cluster_id': 'c.cluster_id',
+    'section_title': 'sec.section_title',
+    'state': 'u.state',
+    'industry': INDUSTRY_SQL,
+    'is_organization': 'u.is_organization',
+}
+
+def available_comment_fields(conn):
+    """
+    COMMENT_FIELDS without the comment columns this database doesn't have yet
+    (see SCHEMA_MIGRATIONS in database_setup.py).
+    """
+    columns = {row['name'] for row in conn.execute("PRAGMA table_info(comments)")}
+    return {field: sql for field, sql in COMMENT_FIELDS.items()
+            if not sql.startswith('c.') or sql[2:] in columns}
+
+# Server-side filters, mirroring the dashboard's filterStore. Each accepts one
+# value or a comma-separated list.
+COMMENT_FILTERS = {
+    'sentiment': 'c.sentiment_label',
+    'section': 'c.section_id',
+    'state': 'u.state',
+    'industry': INDUSTRY_SQL,
+    'action_type': 'c.action_type',
+}
+
+MAX_PAGE_SIZE = 5000
+
+def build_comment_filters(args):
+    """Turns the filter query parameters into SQL conditions and their parameters."""
+    conditions, params = [], []
+    for name, column in COMMENT_FILTERS.items():
+        if args.get(name):
+            values = args[name].split(',')
+            conditions.append(f"{column} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+    return conditions, params
+
 @app.route('/api/comments/<int:draft_id>')
+@cached_by_generation
 def get_comments_for_draft(draft_id):
     """
     UPGRADED: Returns all comments for a specific draft, joined with user and section data.
     This is the primary endpoint for the interactive dashboard.
+
+    Optional query parameters:
+      fields=a,b,c    only return these columns (see COMMENT_FIELDS; columns the
+                      database doesn't have yet are unknown)
+      sentiment, section, state, industry, action_type
+                      filter server-side (comma-separated values are OR-ed)
+      limit=N         paginate; the response becomes {"comments": [...], "next_cursor": "..."}
+      cursor=...      continue from the next_cursor of the previous page
+    A draft's comments are those of its submissions (s.draft_id), as the
+    dashboard has always grouped them. Pages are ordered by (section_id,
+    comment_id).
     """
-    
     conn = get_db_connection()
-    comments = conn.execute("""
-        SELECT 
+    if request.args.get('fields'):
+        fields = request.args['fields'].split(',')
+        available = available_comment_fields(conn)
+        unknown = [field for field in fields if field not in available]
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+        select_list = ", ".join(f"{available[field]} AS {field}" for field in fields)
+    else:
+        fields = None
+        select_list = f"""
             c.*, -- Selects all comment data, including new score columns
             sec.section_title,
             u.state,
-            CASE 
-                WHEN u.industry IS NULL OR u.industry = '' THEN 'Individual'
-                ELSE u.industry
-            END as industry,
+            {INDUSTRY_SQL} as industry,
             u.is_organization
+        """
+
+    conditions, params = build_comment_filters(request.args)
+    paginated = 'limit' in request.args
+    if paginated:
+        try:
+            limit = min(max(int(request.args['limit']), 1), MAX_PAGE_SIZE)
+            cursor_section_id, cursor_comment_id = map(int, request.args.get('cursor', '0:0').split(':'))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer and cursor a next_cursor value"}), 400
+        select_list += ", c.section_id AS _cursor_section_id, c.comment_id AS _cursor_comment_id"
+        conditions.append("(c.section_id, c.comment_id) > (?, ?)")
+        params.extend([cursor_section_id, cursor_comment_id])
+
+    where = " AND ".join(["s.draft_id = ?"] + conditions)
+    query = f"""
+        SELECT {select_list}
         FROM comments c
         JOIN submissions s ON c.submission_id = s.submission_id
         JOIN sections sec ON c.section_id = sec.section_id
         JOIN users u ON s.user_id = u.user_id
-        WHERE s.draft_id = ?
+        WHERE {where}
+    """
+    if paginated:
+        query += " ORDER BY c.section_id, c.comment_id LIMIT ?"
+        params.append(limit)
+
+    comments = [dict(row) for row in conn.execute(query, [draft_id] + params)]
+    if not paginated:
+        return jsonify(comments)
+
+    next_cursor = None
+    if len(comments) == limit:
+        next_cursor = f"{comments[-1]['_cursor_section_id']}:{comments[-1]['_cursor_comment_id']}"
+    for comment in comments:
+        del comment['_cursor_section_id'], comment['_cursor_comment_id']
+    return jsonify({"comments": comments, "next_cursor": next_cursor})
+
+# --- Precomputed Aggregates ---
+# Served from the comment_sentiment_cube table (see database_setup.py), so a
+# chart costs a GROUP BY over a few hundred cube rows instead of the corpus.
+
+AGGREGATE_DIMENSIONS = ['section_id', 'state', 'industry', 'action_type', 'sentiment_label']
+
+AGGREGATE_VIEWS = {
+    'sentiment-by-section': ['section_id', 'sentiment_label'],
+    'sentiment-by-state': ['state', 'sentiment_label'],
+    'sentiment-by-industry': ['industry', 'sentiment_label'],
+    'industry-by-section': ['industry', 'section_id', 'sentiment_label'],
+    'action-type-mix': ['action_type'],
+}
+
+def query_aggregates(conn, draft_id, dimensions):
+    """Returns [{dimension: value, ..., 'count': n}] for one draft, grouped by 'dimensions'."""
+    columns = ", ".join(dimensions)
+    rows = conn.execute(f"""
+        SELECT {columns}, SUM(comment_count) AS count
+        FROM comment_sentiment_cube
+        WHERE draft_id = ?
+        GROUP BY {columns}
+        HAVING SUM(comment_count) > 0
+        ORDER BY {columns}
     """, (draft_id,)).fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in comments])
+    return [dict(row) for row in rows]
+
+@app.route('/api/aggregates/<int:draft_id>')
+@cached_by_generation
+@requires_schema('comment_sentiment_cube')
+def get_aggregates(draft_id):
+    """
+    Returns comment counts for a draft grouped by the dimensions in ?by=
+    (any of section_id, state, industry, action_type, sentiment_label).
+    """
+    dimensions = request.args.get('by', 'sentiment_label').split(',')
+    unknown = [dimension for dimension in dimensions if dimension not in AGGREGATE_DIMENSIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown dimensions: {', '.join(unknown)}"}), 400
+    return jsonify(query_aggregates(get_db_connection(), draft_id, dimensions))
+
+@app.route('/api/aggregates/<int:draft_id>/<view>')
+@cached_by_generation
+@requires_schema('comment_sentiment_cube')
+def get_aggregate_view(draft_id, view):
+    """Named aggregate views for the dashboard charts (see AGGREGATE_VIEWS)."""
+    if view not in AGGREGATE_VIEWS:
+        return jsonify({"error": f"Unknown view '{view}'"}), 404
+    return jsonify(query_aggregates(get_db_connection(), draft_id, AGGREGATE_VIEWS[view]))
+
+@app.route('/api/map-data/<int:draft_id>')
+@cached_by_generation
+@requires_schema('comment_sentiment_cube')
+def get_map_data(draft_id):
+    """
+    Per-state sentiment counts in the shape Map.svelte expects:
+    [{state, total, positive, neutral, negative}]. The map falls back to its
+    own state centroids for lat/lon.
+    """
+    by_state = {}
+    for row in query_aggregates(get_db_connection(), draft_id, ['state', 'sentiment_label']):
+        if not row['state']:
+            continue
+        entry = by_state.setdefault(row['state'], {'state': row['state'], 'total': 0, 'positive': 0, 'neutral': 0, 'negative': 0})
+        entry['total'] += row['count']
+        label = row['sentiment_label'].lower()
+        if label in entry:
+            entry[label] += row['count']
+    return jsonify(list(by_state.values()))
+
+# --- Term Frequencies ---
+# Served from the per-comment token index (comment_terms, built by
+# token_index.py), so a top-terms table is a sum over stored counts rather
+# than an NLP pass, and the frontend can draw its own clouds.
+
+DEFAULT_TOP_TERMS = 50
+MAX_TOP_TERMS = 500
+
+@app.route('/api/terms/<int:draft_id>')
+@cached_by_generation
+@requires_schema('comment_terms')
+def get_terms(draft_id):
+    """
+    Returns the top-k lemmas and lemma bigrams of a draft's comments:
+    {"unigrams": [{"term", "count"}], "bigrams": [...]}.
+
+    Optional query parameters:
+      k=N             terms per list (default 50, at most 500)
+      sentiment, section, state, industry, action_type
+                      restrict to matching comments, as in /api/comments
+    """
+    try:
+        k = min(max(int(request.args.get('k', DEFAULT_TOP_TERMS)), 1), MAX_TOP_TERMS)
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+
+    conditions, params = build_comment_filters(request.args)
+    where = " AND ".join(["s.draft_id = ?"] + conditions)
+    rows = get_db_connection().execute(f"""
+        SELECT t.ngram, t.term, SUM(t.term_count) AS count
+        FROM comment_terms t
+        JOIN comments c ON c.comment_id = t.comment_id
+        JOIN submissions s ON c.submission_id = s.submission_id
+        JOIN sections sec ON c.section_id = sec.section_id
+        JOIN users u ON s.user_id = u.user_id
+        WHERE {where}
+        GROUP BY t.ngram, t.term
+    """, [draft_id] + params)
+
+    # A bounded heap per list keeps only the k largest totals, so picking
+    # them costs O(n log k) instead of sorting every term of the draft.
+    heaps = {1: [], 2: []}
+    for ngram, term, count in rows:
+        heap = heaps[ngram]
+        if len(heap) < k:
+            heapq.heappush(heap, (count, term))
+        elif count > heap[0][0]:
+            heapq.heapreplace(heap, (count, term))
+
+    def top_terms(heap):
+        return [{"term": term, "count": count} for count, term in sorted(heap, key=lambda item: (-item[0], item[1]))]
+
+    return jsonify({"unigrams": top_terms(heaps[1]), "bigrams": top_terms(heaps[2])})
+
+# --- Campaigns ---
+# Clusters of near-identical comments found by near_duplicates.py. A cluster's
+# size is a GROUP BY over comments.cluster_id, so campaign sizes cost no
+# extra bookkeeping.
+
+DEFAULT_MIN_CAMPAIGN_SIZE = 3
+DEFAULT_CAMPAIGNS = 50
+MAX_CAMPAIGNS = 500
+
+@app.route('/api/campaigns/<int:draft_id>')
+@cached_by_generation
+@requires_schema('comments.cluster_id')
+def get_campaigns(draft_id):
+    """
+    Returns a draft's largest clusters of near-duplicate comments, biggest
+    first: [{canonical_comment_id, size, section_id, section_title,
+    action_type, sentiment_label, ai_summary, comment_text}].
+
+    Optional query parameters:
+      min_size=N      smallest cluster reported (default 3)
+      limit=N         clusters returned (default 50, at most 500)
+    """
+    try:
+        min_size = max(int(request.args.get('min_size', DEFAULT_MIN_CAMPAIGN_SIZE)), 2)
+        limit = min(max(int(request.args.get('limit', DEFAULT_CAMPAIGNS)), 1), MAX_CAMPAIGNS)
+    except ValueError:
+        return jsonify({"error": "min_size and limit must be integers"}), 400
+
+    rows = get_db_connection().execute('''
+        SELECT campaign.cluster_id AS canonical_comment_id, campaign.size, canonical.section_id,
+               sec.section_title, canonical.action_type, canonical.sentiment_label,
+               canonical.ai_summary, canonical.comment_text
+        FROM (
+            SELECT c.cluster_id, COUNT(*) AS size
+            FROM comments c
+            JOIN submissions s ON c.submission_id = s.submission_id
+            WHERE s.draft_id = ? AND c.cluster_id IS NOT NULL
+            GROUP BY c.cluster_id
+            HAVING COUNT(*) >= ?
+            ORDER BY size DESC
+            LIMIT ?
+        ) AS campaign
+        JOIN comments canonical ON canonical.comment_id = campaign.cluster_id
+        JOIN sections sec ON canonical.section_id = sec.section_id
+        ORDER BY campaign.size DESC, campaign.cluster_id
+    ''', (draft_id, min_size, limit)).fetchall()
+    return jsonify([dict(row) for row in rows])
+
+# --- Full-Text Search ---
+# Served from the comment_search FTS5 index (see database_setup.py) over
+# comment text, AI summaries and section titles, ranked by BM25.
+
+DEFAULT_SEARCH_RESULTS = 20
+MAX_SEARCH_RESULTS = 100
+# Tokens around the best match in each snippet.
+SNIPPET_TOKENS = 16
+# Control characters mark the matched terms inside snippet(); they are turned
+# into <mark> tags after the snippet has been HTML-escaped.
+_MATCH_START, _MATCH_END = '\x02', '\x03'
+
+def build_match_query(text):
+    """
+    Turns a user's search box text into an FTS5 query: every word (or
+    "quoted phrase") must match, and a word ending in * matches as a prefix.
+    FTS5 operators in the text are treated as plain words. Returns None if
+    there is nothing to search for.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        prefix = not phrase and word.endswith('*')
+        term = (phrase or word).strip().rstrip('*').replace('"', '""')
+        if term:
+            terms.append(f'"{term}"' + ('*' if prefix else ''))
+    return " AND ".join(terms) or None
+
+@app.route('/api/search')
+@app.route('/api/search/<int:draft_id>')
+@cached_by_generation
+@requires_schema('comment_search', 'comments.cluster_id')
+def search_comments(draft_id=None):
+    """
+    Full-text search over comments, their AI summaries and section titles,
+    best match first: {"results": [{comment_id, draft_id, section_id,
+    section_title, action_type, sentiment_label, state, industry, cluster_id,
+    score, snippet}], "next_offset": ...}. Snippets are HTML with the matched
+    terms in <mark> tags; a higher score is a better match.
+
+    Query parameters:
+      q=...           the search text; words are AND-ed, "quoted phrases" and
+                      prefix* words are supported
+      sentiment, section, state, industry, action_type
+                      restrict to matching comments, as in /api/comments
+      limit=N         results per page (default 20, at most 100)
+      offset=N        continue from the next_offset of the previous page
+    /api/search/<draft_id> searches one draft.
+    """
+    match_query = build_match_query(request.args.get('q', ''))
+    if match_query is None:
+        return jsonify({"error": "q must contain at least one search term"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_SEARCH_RESULTS)), 1), MAX_SEARCH_RESULTS)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+
+    conditions, params = build_comment_filters(request.args)
+    if draft_id is not None:
+        conditions.insert(0, "s.draft_id = ?")
+        params.insert(0, draft_id)
+    where = " AND ".join(["comment_search MATCH ?"] + conditions)
+    rows = get_db_connection().execute(f"""
+        SELECT c.comment_id, s.draft_id, c.section_id, sec.section_title, c.action_type,
+               c.sentiment_label, u.state, {INDUSTRY_SQL} AS industry, c.cluster_id,
+               -comment_search.rank AS score,
+               snippet(comment_search, -1, ?, ?, '…', ?) AS snippet
+        FROM comment_search
+        JOIN comments c ON c.comment_id = comment_search.rowid
+        JOIN submissions s ON c.submission_id = s.submission_id
+        JOIN sections sec ON c.section_id = sec.section_id
+        JOIN users u ON s.user_id = u.user_id
+        WHERE {where}
+        ORDER BY comment_search.rank
+        LIMIT ? OFFSET ?
+    """, [_MATCH_START, _MATCH_END, SNIPPET_TOKENS, match_query] + params + [limit, offset]).fetchall()
+
+    results = []
+    for row in rows:
+        result = dict(row)
+        result['score'] = round(result['score'], 4)
+        result['snippet'] = (html.escape(result['snippet'] or '')
+                             .replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>'))
+        results.append(result)
+    next_offset = offset + limit if len(results) == limit else None
+    return jsonify({"results": results, "next_offset": next_offset})
 
 # --- RESTORED & MAINTAINED from your original code ---
 
+# All comments of a draft in one pass, ordered so they can be grouped by section
+# while streaming. Joined on c.submission_id = s.submission_id (not section_id).
+# Unlike /api/comments this follows the draft's sections, as this view always
+# has: it nests each comment under its section.
+DRAFT_COMMENTS_QUERY = '''
+    SELECT c.*, u.first_name, u.last_name, u.organization_name FROM comments c
+    JOIN sections sec ON c.section_id = sec.section_id
+    JOIN submissions s ON c.submission_id = s.submission_id
+    JOIN users u ON s.user_id = u.user_id
+    WHERE sec.draft_id = ?
+    ORDER BY sec.section_id
+'''
+
+def iter_draft_sections(conn, draft_id):
+    """
+    Yields each section of a draft as a dict with its 'comments' list, using
+    two queries in total: one for the sections and one for all their comments,
+    walked side by side in section_id order.
+    """
+    sections = conn.execute('SELECT * FROM sections WHERE draft_id = ? ORDER BY section_id', (draft_id,))
+    comment_groups = itertools.groupby(
+        conn.execute(DRAFT_COMMENTS_QUERY, (draft_id,)), key=lambda row: row['section_id']
+    )
+    group_section_id, group_rows = next(comment_groups, (None, None))
+    for section in sections:
+        section_dict = dict(section)
+        section_dict['comments'] = []
+        if group_section_id == section['section_id']:
+            section_dict['comments'] = [dict(comment) for comment in group_rows]
+            group_section_id, group_rows = next(comment_groups, (None, None))
+        yield section_dict
+
+def stream_draft_json(draft, sections):
+    """Yields the draft details JSON document piece by piece, one section at a time."""
+    yield json.dumps(dict(draft))[:-1] + ', "sections": ['
+    for index, section in enumerate(sections):
+        yield (',' if index else '') + json.dumps(section)
+    yield ']}'
+
 @app.route('/api/drafts/<int:draft_id>', methods=['GET'])
+@cached_by_generation
 def get_draft_details(draft_id):
     """
     RESTORED: Provides a deeply nested JSON object for a single draft,
     including all its sections and their respective comments.
+    Pass ?stream=1 to stream the response section by section, so large
+    drafts start rendering before the whole payload is built.
     """
     
     conn = get_db_connection()
     draft = conn.execute('SELECT * FROM drafts WHERE draft_id = ?', (draft_id,)).fetchone()
     if draft is None: return jsonify({"error": "Draft not found"}), 404
 
-    sections = conn.execute('SELECT * FROM sections WHERE draft_id = ? ORDER BY section_id', (draft_id,)).fetchall()
-    sections_list = []
-    for section in sections:
-        section_dict = dict(section)
-        # Your original query had a slight bug in the JOIN condition, I've corrected it.
-        # It should join on c.submission_id = s.submission_id, not section_id.
-        comments = conn.execute('''
-            SELECT c.*, u.first_name, u.last_name, u.organization_name FROM comments c
-            JOIN submissions s ON c.submission_id = s.submission_id
-            JOIN users u ON s.user_id = u.user_id WHERE c.section_id = ?
-        ''', (section['section_id'],)).fetchall()
-        section_dict['comments'] = [dict(comment) for comment in comments]
-        sections_list.append(section_dict)
-    
-    conn.close()
+    if request.args.get('stream') in ('1', 'true'):
+        # stream_with_context keeps the request (and its pooled connection) alive until the last chunk.
+        return Response(
+            stream_with_context(stream_draft_json(draft, iter_draft_sections(conn, draft_id))),
+            mimetype='application/json'
+        )
+
     result = dict(draft)
-    result['sections'] = sections_list
+    result['sections'] = list(iter_draft_sections(conn, draft_id))
     return jsonify(result)
 
+@app.route('/api/pool-stats')
+def get_pool_stats():
+    """Returns connection pool metrics for this worker process."""
+    return jsonify(get_pool().stats())
+
+@app.route('/api/cache-stats')
+def get_cache_stats():
+    """Returns response cache metrics for this worker process."""
+    return jsonify(response_cache.stats())
+
 @app.route('/wordclouds/<path:subfolder>/<path:filename>')
 def serve_wordcloud(subfolder, filename):
     """
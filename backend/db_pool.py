@@ -0,0 +1,121 @@
+import sqlite3
+import os
+import queue
+import threading
+import time
+
+# --- Configuration ---
+# Reader connections kept per worker process.
+POOL_SIZE = 8
+# How long a request waits for a free connection before giving up.
+ACQUIRE_TIMEOUT_SECONDS = 10.0
+
+# Applied once to the database file. WAL lets dashboard reads run while the
+# batch jobs write; NORMAL sync is safe under WAL and avoids an fsync per commit.
+DATABASE_PRAGMAS = [
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+]
+
+# Applied to every pooled reader connection.
+CONNECTION_PRAGMAS = [
+    "PRAGMA busy_timeout = 5000;",     # wait up to 5s on a lock instead of failing
+    "PRAGMA cache_size = -20000;",     # ~20 MB page cache per connection
+    "PRAGMA mmap_size = 268435456;",   # memory-map up to 256 MB of the file
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA query_only = ON;",
+]
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of read-only SQLite connections for one worker process.
+    Connections are created lazily up to 'size' and handed out LIFO so the
+    warmest page caches get reused.
+    """
+
+    def __init__(self, database_file, size=POOL_SIZE, timeout=ACQUIRE_TIMEOUT_SECONDS):
+        self.database_file = database_file
+        self.size = size
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._configure_database()
+
+    def _configure_database(self):
+        # journal_mode can only be changed from a writable connection; the
+        # setting is stored in the database file, so this is done once per pool.
+        try:
+            conn = sqlite3.connect(self.database_file)
+            for pragma in DATABASE_PRAGMAS:
+                conn.execute(pragma)
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Could not enable WAL mode on '{self.database_file}': {e}")
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            f"file:{self.database_file}?mode=ro", uri=True, check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            self._checkouts += 1
+            exhausted = self._idle.empty()
+            create = exhausted and self._created < self.size
+            if create:
+                self._created += 1
+
+        if create:
+            try:
+                conn = self._connect()
+            except sqlite3.Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+        else:
+            # Either reuse an idle connection or, if the pool is exhausted, wait
+            # for another request to hand one back.
+            started = time.perf_counter()
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise RuntimeError(f"No database connection became free within {self.timeout}s.")
+            if exhausted:
+                with self._lock:
+                    self._waits += 1
+                    self._wait_seconds += time.perf_counter() - started
+
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            self._in_use -= 1
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pid": self.pid,
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "total_wait_ms": round(self._wait_seconds * 1000, 2),
+            }
@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; without it responses are only pre-compressed with gzip.
+    brotli = None
+
+# --- Configuration ---
+# Upper bound on the bytes held by the cache (raw plus compressed bodies).
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def make_etag(cache_key, encoding):
+    """
+    A strong (unquoted) ETag for a (URL, generation) key in one content coding.
+    The same key always yields the same body, so the body itself isn't hashed.
+    """
+    return hashlib.sha1(repr((cache_key, encoding)).encode("utf-8")).hexdigest()
+
+
+def choose_encoding(accept_encoding):
+    """Picks the best pre-compressed encoding the client accepts."""
+    accepted = accept_encoding.lower()
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+class CachedBody:
+    """One cached response body with its pre-compressed variants."""
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        self.encodings = {"identity": body, "gzip": gzip.compress(body, GZIP_LEVEL)}
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+        self.size = sum(len(data) for data in self.encodings.values())
+
+
+class ResponseCache:
+    """
+    A thread-safe, size-bounded LRU cache of response bodies. Keys include the
+    draft generation, so a bumped generation simply stops matching old entries,
+    which then age out.
+    """
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry
+
+    def put(self, cache_key, body, mimetype):
+        entry = CachedBody(body, mimetype)
+        if entry.size > self.max_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop(cache_key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[cache_key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+        return entry
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "brotli": brotli is not None,
+            }
@@ -0,0 +1,177 @@
+import sqlite3
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+import statistics
+from synthetic_corpus import generate_corpus, SEED
+from pipeline import STAGES, Stage, run_pipeline, CPU_BUDGET
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(REPO_DIR, "backend"))
+
+# --- Configuration ---
+# Corpus sizes (comments) to benchmark. Corpora are generated once per size and
+# seed and reused by later runs.
+SCALES = [10_000, 100_000, 1_000_000]
+BENCH_FOLDER = "benchmarks"
+# Share of generated comments that already carry labels and summaries, so the
+# API has something to serve while the model stages still have pending work.
+LABELLED_SHARE = 0.5
+# The model stages need the transformer weights; pass --stages to include them.
+DEFAULT_STAGES = ["token_index", "word_clouds"]
+# Timed requests per endpoint, each with an empty and with a warm response cache.
+REPEATS = 5
+# '{draft_id}' is replaced with the draft that has the most comments.
+ENDPOINTS = [
+    "/api/drafts",
+    "/api/sections/{draft_id}",
+    "/api/drafts/{draft_id}",
+    "/api/comments/{draft_id}",
+    "/api/comments/{draft_id}?limit=100",
+    "/api/comments/{draft_id}?sentiment=Negative&limit=100",
+    "/api/aggregates/{draft_id}",
+    "/api/map-data/{draft_id}",
+    "/api/terms/{draft_id}",
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def prepare_corpus(scale, seed):
+    """Returns a fresh working copy of the corpus for 'scale', generating it on first use."""
+    corpus = os.path.join(BENCH_FOLDER, f"corpus-{scale}-{seed}.db")
+    if not os.path.exists(corpus):
+        print(f"\nGenerating a {scale}-comment corpus (seed {seed})...")
+        generate_corpus(corpus, scale, seed, LABELLED_SHARE)
+    work_dir = os.path.join(BENCH_FOLDER, f"run-{scale}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    work_db = os.path.join(work_dir, "econsultation.db")
+    shutil.copyfile(corpus, work_db)
+    return work_db
+
+
+def benchmark_stages(database_file, stage_names, cpus):
+    """Runs the chosen pipeline stages (dependencies outside the selection are dropped)."""
+    selected = [
+        Stage(stage.name, stage.module, stage.function, [name for name in stage.depends_on if name in stage_names],
+              stage.cpus, stage.pending_query, stage.cpu_setting)
+        for stage in STAGES if stage.name in stage_names
+    ]
+    # Stage outputs (word cloud images) land next to the working copy.
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(database_file)))
+    try:
+        report = run_pipeline(os.path.basename(database_file), cpus, selected)
+    finally:
+        os.chdir(cwd)
+    return [{"kind": "stage", "name": name, **entry} for name, entry in report.items()]
+
+
+def benchmark_endpoints(database_file, repeats=REPEATS):
+    """Times every endpoint through Flask's test client, with and without the response cache."""
+    import app as backend_app
+    from response_cache import ResponseCache
+    backend_app.DATABASE_FILE = os.path.abspath(database_file)
+    backend_app._pool = None
+    conn = sqlite3.connect(database_file)
+    draft_id = conn.execute("""
+        SELECT sec.draft_id FROM comments c JOIN sections sec ON c.section_id = sec.section_id
+        GROUP BY sec.draft_id ORDER BY COUNT(*) DESC LIMIT 1
+    """).fetchone()[0]
+    conn.close()
+
+    results = []
+    client = backend_app.app.test_client()
+    for endpoint in ENDPOINTS:
+        url = endpoint.format(draft_id=draft_id)
+        uncached, cached = [], []
+        size = 0
+        for timings, fresh_cache in ((uncached, True), (cached, False)):
+            for _ in range(repeats):
+                if fresh_cache:
+                    backend_app.response_cache = ResponseCache()
+                started = time.perf_counter()
+                response = client.get(url)
+                body = response.get_data()
+                timings.append(time.perf_counter() - started)
+                size = max(size, len(body))
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url} returned {response.status_code}: {body[:200]!r}")
+        results.append({
+            "kind": "endpoint", "name": endpoint,
+            "p50_ms": round(statistics.median(uncached) * 1000, 2),
+            "p95_ms": round(percentile(uncached, 0.95) * 1000, 2),
+            "cached_p50_ms": round(statistics.median(cached) * 1000, 2),
+            "bytes": size,
+        })
+        print(f"{url:<55}{results[-1]['p50_ms']:>10.1f} ms{results[-1]['cached_p50_ms']:>10.1f} ms cached")
+    return results
+
+
+def run_metadata(seed):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit, "seed": seed, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(), "cpu_count": os.cpu_count(),
+    }
+
+
+def compare_results(baseline, current):
+    """Prints the change of every timing present in both result sets."""
+    metrics = ("wall_seconds", "cpu_seconds", "p50_ms", "p95_ms", "cached_p50_ms")
+    def keyed(results):
+        return {(entry["scale"], entry["kind"], entry["name"]): entry for entry in results["results"]}
+    before, after = keyed(baseline), keyed(current)
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for key in sorted(before.keys() & after.keys(), key=str):
+        for metric in metrics:
+            old, new = before[key].get(metric), after[key].get(metric)
+            if old and new is not None:
+                print(f"{key[0]:>10} {key[2]:<55}{metric:<15}{old:>10.2f} -> {new:>10.2f} ({(new - old) / old:+.0%})")
+
+
+def run_benchmarks(scales=SCALES, seed=SEED, stage_names=DEFAULT_STAGES, cpus=CPU_BUDGET, repeats=REPEATS):
+    """Benchmarks the stages and then the endpoints at every scale. Returns the results document."""
+    os.makedirs(BENCH_FOLDER, exist_ok=True)
+    results = []
+    for scale in scales:
+        database_file = prepare_corpus(scale, seed)
+        print(f"\n=== {scale} comments ===")
+        for entry in benchmark_stages(database_file, stage_names, cpus) + benchmark_endpoints(database_file, repeats):
+            results.append({"scale": scale, **entry})
+    return {"meta": run_metadata(seed), "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages and API on synthetic corpora.")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES, help="Corpus sizes in comments.")
+    parser.add_argument("--seed", type=int, default=SEED, help="Corpus seed.")
+    parser.add_argument("--stages", nargs="+", default=DEFAULT_STAGES, choices=[stage.name for stage in STAGES],
+                        help="Pipeline stages to time.")
+    parser.add_argument("--cpus", type=int, default=CPU_BUDGET, help="Core budget for the pipeline stages.")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="Timed requests per endpoint.")
+    parser.add_argument("--out", help="Results file (default: benchmarks/results-<timestamp>.json).")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    document = run_benchmarks(args.scales, args.seed, args.stages, args.cpus, args.repeats)
+    out = args.out or os.path.join(BENCH_FOLDER, f"results-{time.strftime('%Y%m%dT%H%M%S')}.json")
+    with open(out, "w", encoding="utf-8") as results_file:
+        json.dump(document, results_file, indent=2)
+    print(f"\nResults written to '{out}'.")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            compare_results(json.load(baseline_file), document)
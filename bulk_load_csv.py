@@ -0,0 +1,347 @@
+import sqlite3
+import os
+import re
+import csv
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+from database_setup import (
+    CREATE_DRAFTS_TABLE, CREATE_SECTIONS_TABLE, CREATE_USERS_TABLE,
+    CREATE_SUBMISSIONS_TABLE, CREATE_COMMENTS_TABLE, CREATE_INDEXES,
+    migrate_schema, rebuild_sentiment_cube, rebuild_search_index, bump_draft_generations
+)
+
+# --- Configuration ---
+DATABASE_FILE = "econsultation.db"
+# Rows validated and written per transaction.
+CHUNK_ROWS = 50_000
+# Parents before children, so foreign keys can be checked as rows arrive.
+LOAD_ORDER = ["drafts", "sections", "users", "submissions", "comments"]
+# comment_text and ai_summary can be far longer than csv's default 128 KB field limit.
+csv.field_size_limit(sys.maxsize)
+
+# Applied for the duration of a load. Durability is traded for speed: a crash
+# mid-load can lose the last transaction, and the load is simply re-run.
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA synchronous = OFF;",
+    "PRAGMA cache_size = -262144;",   # ~256 MB page cache
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA foreign_keys = OFF;",     # checked by the loader itself, per row
+]
+RESTORE_PRAGMAS = ["PRAGMA synchronous = NORMAL;"]
+
+# The comment_sentiment_cube and full-text search triggers fire once per row;
+# during a load they are dropped, and the cube and the search index are rebuilt
+# in one pass each at the end.
+DEFERRED_TRIGGERS = [
+    "trg_cube_comment_insert", "trg_cube_comment_delete", "trg_cube_comment_update",
+    "trg_search_comment_insert", "trg_search_comment_delete", "trg_search_comment_update",
+    "trg_search_section_update", "trg_search_section_delete",
+]
+
+# Columns written by the analysis jobs. An upsert never blanks them out with an
+# empty CSV field; for comments whose text changed they are reset instead
+# (whether or not the file has the column), so the jobs pick the comment up
+# again. Columns missing from the database are skipped.
+DERIVED_COLUMNS = {
+    "drafts": ["draft_ai_summary", "draft_ai_summary_updated_at", "word_cloud_image_path"],
+    "sections": ["section_ai_summary", "section_ai_key_points", "section_ai_summary_updated_at",
+                 "section_summary_watermark", "word_cloud_image_path"],
+    "comments": ["sentiment_label", "sentiment_score", "sentiment_tier", "score_positive", "score_neutral",
+                 "score_negative", "ai_summary", "word_cloud_image_path", "cluster_id"],
+}
+
+# Layouts accepted in DATETIME columns besides ISO 8601: spreadsheet exports
+# write US dates ('9/29/2025 5:55'). Every timestamp is stored the way
+# CURRENT_TIMESTAMP writes them ('2025-09-29 05:55:00'), so they sort and
+# export as timestamps.
+DATETIME_FORMATS = ["%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%m/%d/%Y"]
+
+CHECK_IN_PATTERN = re.compile(r"CHECK\s*\(\s*(\w+)\s+IN\s*\(([^)]*)\)\s*\)", re.IGNORECASE)
+
+
+class TableSpec:
+    """
+    What the loader needs to know about one table, read from the live schema:
+    its columns and types, NOT NULL columns without a default, CHECK(... IN ...)
+    value lists and foreign keys.
+    """
+
+    def __init__(self, conn, table):
+        self.table = table
+        info = conn.execute(f"PRAGMA table_info({table});").fetchall()
+        self.columns = [row[1] for row in info]
+        self.types = {row[1]: (row[2] or "").upper() for row in info}
+        self.primary_key = next(row[1] for row in info if row[5] == 1)
+        self.required = {row[1] for row in info if row[3] and row[4] is None}
+        create_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+        self.allowed = {
+            column: {value.strip().strip("'") for value in values.split(",")}
+            for column, values in CHECK_IN_PATTERN.findall(create_sql)
+        }
+        self.foreign_keys = {row[3]: (row[2], row[4]) for row in conn.execute(f"PRAGMA foreign_key_list({table});")}
+
+
+def normalize_timestamp(value):
+    """Returns a timestamp as 'YYYY-MM-DD HH:MM:SS[.fff]' (UTC if it carries an offset). Raises ValueError."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        for layout in DATETIME_FORMATS:
+            try:
+                parsed = datetime.strptime(value, layout)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"not a timestamp: {value!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    text = parsed.strftime("%Y-%m-%d %H:%M:%S")
+    return f"{text}.{parsed.microsecond // 1000:03d}" if parsed.microsecond else text
+
+
+def coerce(value, column_type):
+    """Converts one CSV field to the column's type; '' becomes NULL. Raises ValueError."""
+    if value == "":
+        return None
+    if column_type == "DATETIME":
+        return normalize_timestamp(value.strip())
+    if column_type.startswith("INT"):
+        return int(value)
+    if column_type == "REAL":
+        return float(value)
+    if column_type == "BOOLEAN":
+        lowered = value.lower()
+        if lowered in ("1", "true", "yes"):
+            return 1
+        if lowered in ("0", "false", "no"):
+            return 0
+        raise ValueError(f"not a boolean: {value!r}")
+    return value
+
+
+def validate_row(spec, header, values, parent_keys):
+    """Returns (row tuple, None) for a valid CSV row or (None, reason) for a rejected one."""
+    row = []
+    for column, value in zip(header, values):
+        try:
+            value = coerce(value, spec.types[column])
+        except ValueError:
+            return None, f"{column}: {value!r} is not {spec.types[column]}"
+        if value is None:
+            if column in spec.required:
+                return None, f"{column} is required"
+        elif column in spec.allowed and value not in spec.allowed[column]:
+            return None, f"{column}: {value!r} is not one of {sorted(spec.allowed[column])}"
+        elif column in spec.foreign_keys and value not in parent_keys[spec.foreign_keys[column]]:
+            parent_table, parent_column = spec.foreign_keys[column]
+            return None, f"{column}: no {parent_table}.{parent_column} = {value}"
+        row.append(value)
+    return tuple(row), None
+
+
+def build_insert_query(spec, header, upsert):
+    """
+    INSERT OR IGNORE (duplicate keys are counted as skipped) or, in upsert mode,
+    an INSERT ... ON CONFLICT DO UPDATE that only touches rows whose values changed.
+    """
+    columns = ", ".join(header)
+    placeholders = ", ".join("?" * len(header))
+    if not upsert:
+        return f"INSERT OR IGNORE INTO {spec.table} ({columns}) VALUES ({placeholders})"
+
+    derived = [column for column in DERIVED_COLUMNS.get(spec.table, []) if column in spec.columns]
+    text_changed = "excluded.comment_text IS NOT comments.comment_text"
+    assignments = []
+    if spec.table == "comments" and "comment_text" in header:
+        # Derived columns describe the old text, including the file's own
+        # values, which were exported before the edit.
+        assignments.extend(
+            f"{column} = CASE WHEN {text_changed} THEN NULL ELSE {column} END"
+            for column in derived if column not in header
+        )
+    for column in header:
+        if column == spec.primary_key:
+            continue
+        if column in derived and spec.table == "comments" and "comment_text" in header:
+            assignments.append(f"{column} = CASE WHEN {text_changed} THEN NULL ELSE COALESCE(excluded.{column}, {column}) END")
+        elif column in derived:
+            assignments.append(f"{column} = COALESCE(excluded.{column}, {column})")
+        elif column == "updated_at" and spec.table == "comments" and "comment_text" in header:
+            assignments.append(f"{column} = CASE WHEN {text_changed} THEN strftime('%Y-%m-%d %H:%M:%f', 'now') ELSE COALESCE(excluded.{column}, {column}) END")
+        else:
+            assignments.append(f"{column} = excluded.{column}")
+    if spec.table == "comments" and "comment_text" in header and "updated_at" not in header:
+        # A changed text marks the comment as edited, which re-queues its section summary.
+        assignments.append(f"updated_at = CASE WHEN {text_changed} THEN strftime('%Y-%m-%d %H:%M:%f', 'now') ELSE updated_at END")
+    if not assignments:
+        return f"INSERT OR IGNORE INTO {spec.table} ({columns}) VALUES ({placeholders})"
+
+    # Rows whose delivered values all match (empty derived fields match anything)
+    # are left alone, so re-delivered files don't rewrite or re-queue anything.
+    unchanged = [
+        f"(excluded.{column} IS NULL OR excluded.{column} IS {spec.table}.{column})" if column in derived or column == "updated_at"
+        else f"excluded.{column} IS {spec.table}.{column}"
+        for column in header if column != spec.primary_key
+    ]
+    return f"""
+        INSERT INTO {spec.table} ({columns}) VALUES ({placeholders})
+        ON CONFLICT ({spec.primary_key}) DO UPDATE SET {", ".join(assignments)}
+        WHERE NOT ({" AND ".join(unchanged)})
+    """
+
+
+def load_table(conn, spec, csv_path, upsert, parent_keys, chunk_rows=CHUNK_ROWS):
+    """
+    Streams one CSV into its table in chunk_rows transactions. Rejected rows are
+    written to '<csv>.rejects.csv' with the reason. Returns (written, skipped, rejected).
+    """
+    rejects_path = f"{csv_path}.rejects.csv"
+    written = skipped = rejected = 0
+    started = time.perf_counter()
+    with open(csv_path, newline="", encoding="utf-8") as csv_file, \
+         open(rejects_path, "w", newline="", encoding="utf-8") as rejects_file:
+        reader = csv.reader(csv_file)
+        file_header = next(reader)
+        unknown = [column for column in file_header if column not in spec.columns]
+        if unknown:
+            print(f"    - Ignoring columns not in '{spec.table}': {', '.join(unknown)}")
+        keep = [index for index, column in enumerate(file_header) if column in spec.columns]
+        header = [file_header[index] for index in keep]
+        missing = spec.required - set(header) - {spec.primary_key}
+        if missing:
+            raise ValueError(f"'{csv_path}' is missing required columns: {', '.join(sorted(missing))}")
+        if upsert and spec.primary_key not in header:
+            raise ValueError(f"Upsert into '{spec.table}' needs the {spec.primary_key} column.")
+        insert_query = build_insert_query(spec, header, upsert)
+        key_index = header.index(spec.primary_key) if spec.primary_key in header else None
+        rejects = csv.writer(rejects_file)
+        rejects.writerow(file_header + ["reject_reason"])
+
+        def flush(rows):
+            nonlocal written, skipped
+            with conn:
+                # rowcount leaves out rows changed by triggers.
+                changed = conn.executemany(insert_query, rows).rowcount
+            written += changed
+            skipped += len(rows) - changed
+
+        chunk = []
+        for values in reader:
+            if len(values) != len(file_header):
+                row, reason = None, f"expected {len(file_header)} fields, got {len(values)}"
+            else:
+                row, reason = validate_row(spec, header, [values[index] for index in keep], parent_keys)
+            if reason:
+                rejects.writerow(values + [reason])
+                rejected += 1
+                continue
+            chunk.append(row)
+            if key_index is not None:
+                parent_keys.add(spec.table, spec.primary_key, row[key_index])
+            if len(chunk) >= chunk_rows:
+                flush(chunk)
+                chunk = []
+                rate = (written + skipped) / (time.perf_counter() - started)
+                print(f"    - {written + skipped + rejected} rows read ({rate:,.0f} rows/sec)")
+        if chunk:
+            flush(chunk)
+
+    if not rejected:
+        os.remove(rejects_path)
+    elapsed = time.perf_counter() - started
+    print(f"Loaded '{spec.table}': {written} written, {skipped} unchanged or duplicate, {rejected} rejected "
+          f"in {elapsed:.1f}s ({(written + skipped) / max(elapsed, 1e-9):,.0f} rows/sec).")
+    if rejected:
+        print(f"    - Rejected rows and reasons: {rejects_path}")
+    return written, skipped, rejected
+
+
+class ParentKeys:
+    """Sets of existing parent keys for foreign key checks, loaded on first use and extended as parents are loaded."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.keys = {}
+
+    def __getitem__(self, reference):
+        if reference not in self.keys:
+            table, column = reference
+            self.keys[reference] = {row[0] for row in self.conn.execute(f"SELECT {column} FROM {table}")}
+        return self.keys[reference]
+
+    def add(self, table, column, key):
+        if (table, column) in self.keys:
+            self.keys[(table, column)].add(key)
+
+
+def index_names(statements):
+    return [re.search(r"INDEX IF NOT EXISTS (\w+)", statement).group(1) for statement in statements]
+
+
+def bulk_load(csv_dir, database_file=DATABASE_FILE, upsert=False, defer_indexes=True, chunk_rows=CHUNK_ROWS):
+    """
+    Loads every '<table>.csv' found in csv_dir, in LOAD_ORDER. Secondary indexes
+    and the cube and search triggers are dropped for the load and rebuilt once at the end.
+    """
+    csv_paths = {table: os.path.join(csv_dir, f"{table}.csv") for table in LOAD_ORDER}
+    csv_paths = {table: path for table, path in csv_paths.items() if os.path.exists(path)}
+    if not csv_paths:
+        print(f"No {', '.join(f'{table}.csv' for table in LOAD_ORDER)} files found in '{csv_dir}'.")
+        return
+
+    conn = sqlite3.connect(database_file)
+    try:
+        for statement in (CREATE_DRAFTS_TABLE, CREATE_SECTIONS_TABLE, CREATE_USERS_TABLE,
+                          CREATE_SUBMISSIONS_TABLE, CREATE_COMMENTS_TABLE):
+            conn.execute(statement)
+        migrate_schema(conn)
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
+        for trigger in DEFERRED_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+        if defer_indexes:
+            for index_name in index_names(CREATE_INDEXES):
+                conn.execute(f"DROP INDEX IF EXISTS {index_name};")
+        conn.commit()
+
+        parent_keys = ParentKeys(conn)
+        totals = [0, 0, 0]
+        started = time.perf_counter()
+        try:
+            for table, csv_path in csv_paths.items():
+                print(f"\nLoading '{csv_path}' into '{table}' ({'upsert' if upsert else 'insert'} mode)...")
+                counts = load_table(conn, TableSpec(conn, table), csv_path, upsert, parent_keys, chunk_rows)
+                totals = [total + count for total, count in zip(totals, counts)]
+        finally:
+            # Whatever was committed is in the tables, so the derived state must
+            # be rebuilt even if a file failed halfway.
+            print("\nRebuilding indexes, triggers, the sentiment cube and the search index...")
+            rebuild_started = time.perf_counter()
+            rebuild_sentiment_cube(conn)
+            rebuild_search_index(conn)
+            migrate_schema(conn)
+            for pragma in RESTORE_PRAGMAS:
+                conn.execute(pragma)
+            bump_draft_generations(conn)
+            print(f"Rebuilt in {time.perf_counter() - rebuild_started:.1f}s.")
+
+        elapsed = time.perf_counter() - started
+        written, skipped, rejected = totals
+        print(f"\nBulk load complete: {written} rows written, {skipped} unchanged or duplicate, {rejected} rejected "
+              f"in {elapsed:.1f}s ({(written + skipped) / max(elapsed, 1e-9):,.0f} rows/sec).")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk-load consultation CSV exports into the database.")
+    parser.add_argument("csv_dir", nargs="?", default=".", help="Folder with drafts.csv, sections.csv, users.csv, submissions.csv and comments.csv.")
+    parser.add_argument("--db", default=DATABASE_FILE, help="Database file to load into.")
+    parser.add_argument("--upsert", action="store_true", help="Update rows whose key already exists instead of skipping them.")
+    parser.add_argument("--keep-indexes", action="store_true", help="Keep secondary indexes during the load (faster for small loads into large tables).")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows per transaction.")
+    args = parser.parse_args()
+    bulk_load(args.csv_dir, args.db, args.upsert, not args.keep_indexes, args.chunk_rows)
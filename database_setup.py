@@ -1,7 +1,12 @@
 import sqlite3
 import os
+import json
+import argparse
 
 DATABASE_FILE = "econsultation.db"
+# How long a job's connection waits for another job's write to finish before
+# failing with "database is locked"; pipeline.py runs several writers at once.
+BUSY_TIMEOUT_SECONDS = 60
 
 # --- Schema Definition based on your final PDF ---
 # Using multiline strings to hold the CREATE TABLE statements
@@ -12,6 +17,7 @@ CREATE TABLE IF NOT EXISTS drafts (
     description TEXT,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     draft_ai_summary TEXT,
+    draft_ai_summary_updated_at DATETIME,
     word_cloud_image_path TEXT
 );
 """
@@ -24,6 +30,8 @@ CREATE TABLE IF NOT EXISTS sections (
     section_content TEXT,
     section_ai_summary TEXT,
     section_ai_key_points TEXT,
+    section_ai_summary_updated_at DATETIME,
+    section_summary_watermark INTEGER,
     word_cloud_image_path TEXT,
     FOREIGN KEY (draft_id) REFERENCES drafts(draft_id)   
 );
@@ -70,13 +78,489 @@ CREATE TABLE IF NOT EXISTS comments (
     updated_at DATETIME,
     sentiment_label TEXT,
     sentiment_score REAL,
+    score_positive REAL,
+    score_negative REAL,
+    score_neutral REAL,
+    sentiment_tier TEXT,
     ai_summary TEXT,
     word_cloud_image_path TEXT,
+    cluster_id INTEGER,
     FOREIGN KEY (submission_id) REFERENCES submissions(submission_id),
     FOREIGN KEY (section_id) REFERENCES sections(section_id)   
 );
 """
 
+# --- Materialized Aggregates ---
+# One row per (draft, section, state, industry, action_type, sentiment) with its
+# comment count. The dashboard's charts are all small GROUP BYs over this table
+# instead of recounting every comment. Triggers on comments keep it current, so
+# every job that writes labels (or loads comments) refreshes it row by row.
+CREATE_SENTIMENT_CUBE_TABLE = """
+CREATE TABLE IF NOT EXISTS comment_sentiment_cube (
+    draft_id INTEGER NOT NULL,
+    section_id INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    industry TEXT NOT NULL,
+    action_type TEXT NOT NULL,
+    sentiment_label TEXT NOT NULL,
+    comment_count INTEGER NOT NULL,
+    PRIMARY KEY (draft_id, section_id, state, industry, action_type, sentiment_label)
+) WITHOUT ROWID;
+"""
+
+# The cube's dimensions for one comment row ('{row}' is NEW or OLD). A comment
+# counts for its submission's draft, as in /api/comments. Unknown states are
+# stored as '', missing industries as 'Individual' (as the dashboard shows them)
+# and unlabelled comments as 'Unlabelled'.
+SENTIMENT_CUBE_DIMENSIONS = """
+    SELECT s.draft_id, {row}.section_id, COALESCE(u.state, ''),
+           CASE WHEN u.industry IS NULL OR u.industry = '' THEN 'Individual' ELSE u.industry END,
+           {row}.action_type, COALESCE({row}.sentiment_label, 'Unlabelled')
+    FROM sections sec, submissions s JOIN users u ON s.user_id = u.user_id
+    WHERE sec.section_id = {row}.section_id AND s.submission_id = {row}.submission_id
+"""
+
+_CUBE_INCREMENT = """
+    INSERT INTO comment_sentiment_cube
+        (draft_id, section_id, state, industry, action_type, sentiment_label, comment_count)
+    SELECT dims.*, 1 FROM ({dimensions}) AS dims WHERE 1
+    ON CONFLICT (draft_id, section_id, state, industry, action_type, sentiment_label)
+    DO UPDATE SET comment_count = comment_count + 1;
+""".format(dimensions=SENTIMENT_CUBE_DIMENSIONS.format(row="NEW"))
+
+_CUBE_DECREMENT = """
+    UPDATE comment_sentiment_cube SET comment_count = comment_count - 1
+    WHERE (draft_id, section_id, state, industry, action_type, sentiment_label) IN ({dimensions});
+""".format(dimensions=SENTIMENT_CUBE_DIMENSIONS.format(row="OLD"))
+
+CREATE_SENTIMENT_CUBE_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS trg_cube_comment_insert AFTER INSERT ON comments
+        BEGIN {_CUBE_INCREMENT} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_cube_comment_delete AFTER DELETE ON comments
+        BEGIN {_CUBE_DECREMENT} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_cube_comment_update
+        AFTER UPDATE OF sentiment_label, action_type, section_id, submission_id ON comments
+        BEGIN {_CUBE_DECREMENT} {_CUBE_INCREMENT} END;""",
+]
+
+
+def rebuild_sentiment_cube(conn):
+    """Recomputes comment_sentiment_cube from scratch (e.g. after users are edited)."""
+    conn.execute("DELETE FROM comment_sentiment_cube;")
+    conn.execute(f"""
+        INSERT INTO comment_sentiment_cube
+            (draft_id, section_id, state, industry, action_type, sentiment_label, comment_count)
+        SELECT dims.*, COUNT(*) FROM (
+            {SENTIMENT_CUBE_DIMENSIONS.format(row="c")}
+        ) AS dims
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """.replace("FROM sections sec,", "FROM comments c, sections sec,"))
+    conn.commit()
+
+
+# --- Cache Invalidation ---
+# A per-draft counter that every job bumps after writing results for a draft.
+# The API keys its cached responses and ETags on it.
+CREATE_DRAFT_GENERATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS draft_generations (
+    draft_id INTEGER PRIMARY KEY,
+    generation INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def bump_draft_generations(conn, draft_ids=None):
+    """
+    Marks the given drafts (all drafts when None) as changed, which invalidates
+    the API's cached responses for them. Commits.
+    """
+    if draft_ids is None:
+        draft_ids = [row[0] for row in conn.execute("SELECT draft_id FROM drafts")]
+    conn.executemany("""
+        INSERT INTO draft_generations (draft_id, generation) VALUES (?, 1)
+        ON CONFLICT (draft_id) DO UPDATE SET generation = generation + 1
+    """, [(draft_id,) for draft_id in set(draft_ids)])
+    conn.commit()
+
+
+def bump_comment_drafts(conn, comment_ids):
+    """
+    Bumps the drafts the given comments belong to: their submission's draft,
+    which /api/comments groups by, and their section's draft, which
+    /api/drafts/<id> nests them under. Commits.
+    """
+    draft_ids = [row[0] for row in conn.execute("""
+        SELECT s.draft_id FROM comments c JOIN submissions s ON c.submission_id = s.submission_id
+        WHERE c.comment_id IN (SELECT value FROM json_each(?))
+        UNION
+        SELECT sec.draft_id FROM comments c JOIN sections sec ON c.section_id = sec.section_id
+        WHERE c.comment_id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(list(comment_ids)),) * 2)]
+    bump_draft_generations(conn, draft_ids)
+
+
+# --- Word Cloud Bookkeeping ---
+# The content hash each rendered word cloud ('draft_1', 'section_4', 'comment_17')
+# was built from, so word_clouds.py only re-renders clouds whose text changed.
+CREATE_WORD_CLOUD_STATE_TABLE = """
+CREATE TABLE IF NOT EXISTS word_cloud_state (
+    cloud_key TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    image_path TEXT,
+    rendered_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+# --- Token Index ---
+# Each comment's filtered lemmas (ngram = 1) and lemma bigrams (ngram = 2, the
+# two lemmas joined by a space) with their counts, built once per comment by
+# token_index.py. Draft and section term frequencies are sums over this table.
+CREATE_COMMENT_TERMS_TABLE = """
+CREATE TABLE IF NOT EXISTS comment_terms (
+    comment_id INTEGER NOT NULL,
+    ngram INTEGER NOT NULL CHECK(ngram IN (1, 2)),
+    term TEXT NOT NULL,
+    term_count INTEGER NOT NULL,
+    PRIMARY KEY (comment_id, ngram, term)
+) WITHOUT ROWID;
+"""
+
+# Which comments have been tokenized (including those with no terms left after
+# filtering), with their whitespace word count.
+CREATE_COMMENT_TERMS_INDEXED_TABLE = """
+CREATE TABLE IF NOT EXISTS comment_terms_indexed (
+    comment_id INTEGER PRIMARY KEY,
+    word_count INTEGER NOT NULL
+);
+"""
+
+# Editing or deleting a comment drops its index entries; the next
+# token_index.py run tokenizes it again.
+_TERMS_FORGET_COMMENT = """
+    DELETE FROM comment_terms WHERE comment_id = OLD.comment_id;
+    DELETE FROM comment_terms_indexed WHERE comment_id = OLD.comment_id;
+"""
+
+CREATE_COMMENT_TERMS_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS trg_terms_comment_delete AFTER DELETE ON comments
+        BEGIN {_TERMS_FORGET_COMMENT} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_terms_comment_update AFTER UPDATE OF comment_text ON comments
+        WHEN OLD.comment_text IS NOT NEW.comment_text
+        BEGIN {_TERMS_FORGET_COMMENT} END;""",
+]
+
+
+# --- Near-Duplicate Clusters ---
+# near_duplicates.py puts every comment with text into a cluster of
+# near-identical comments of the same section: comments.cluster_id is the
+# comment_id of the cluster's canonical comment (its own id for canonicals,
+# NULL until clustered). Only canonicals are sent through the models; their
+# results are copied to the other members. Canonical embeddings are kept
+# (float16) so later runs can match new comments against existing clusters.
+CREATE_COMMENT_EMBEDDINGS_TABLE = """
+CREATE TABLE IF NOT EXISTS comment_embeddings (
+    comment_id INTEGER PRIMARY KEY,
+    embedding BLOB NOT NULL
+);
+"""
+
+# Not in CREATE_INDEXES: the triggers below need it, so it is never dropped.
+CREATE_CLUSTER_INDEX = "CREATE INDEX IF NOT EXISTS idx_comments_cluster ON comments(cluster_id) WHERE cluster_id IS NOT NULL;"
+
+# Editing a comment's text or moving it to another section re-queues it, and
+# all members of its cluster if it was the canonical; so does deleting a canonical.
+_CLUSTER_FORGET_CANONICAL = """
+    UPDATE comments SET cluster_id = NULL WHERE cluster_id = OLD.comment_id;
+    DELETE FROM comment_embeddings WHERE comment_id = OLD.comment_id;
+"""
+
+CREATE_CLUSTER_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS trg_clusters_comment_delete AFTER DELETE ON comments
+        BEGIN {_CLUSTER_FORGET_CANONICAL} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_clusters_comment_update AFTER UPDATE OF comment_text, section_id ON comments
+        WHEN OLD.comment_text IS NOT NEW.comment_text OR OLD.section_id IS NOT NEW.section_id
+        BEGIN
+            UPDATE comments SET cluster_id = NULL WHERE comment_id = OLD.comment_id;
+            {_CLUSTER_FORGET_CANONICAL}
+        END;""",
+]
+
+
+# --- Full-Text Search ---
+# An FTS5 index over every comment's text, AI summary and section title, served
+# by /api/search. It is an external-content index over comment_search_source,
+# so the text is not stored twice, and triggers on comments and sections keep
+# it in step with every write. Porter stemming matches 'regulations' to
+# 'regulation'; the prefix indexes make 2- and 3-letter prefix queries cheap.
+SEARCH_INDEX_TABLE = "comment_search"
+# BM25 weights of comment_text, ai_summary and section_title: a hit in the
+# comment itself outranks one in its summary, which outranks the section title.
+SEARCH_COLUMN_WEIGHTS = (1.0, 0.5, 0.2)
+
+CREATE_SEARCH_SOURCE_VIEW = """
+CREATE VIEW IF NOT EXISTS comment_search_source AS
+SELECT c.comment_id, c.comment_text, c.ai_summary, sec.section_title
+FROM comments c LEFT JOIN sections sec ON sec.section_id = c.section_id;
+"""
+
+CREATE_SEARCH_INDEX_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} USING fts5(
+    comment_text, ai_summary, section_title,
+    content = 'comment_search_source', content_rowid = 'comment_id',
+    tokenize = 'porter unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+
+# An external-content index only forgets a row when given the exact values it
+# indexed, so every delete passes the old text, summary and section title.
+_SEARCH_ADD_COMMENT = """
+    INSERT INTO comment_search (rowid, comment_text, ai_summary, section_title)
+    VALUES (NEW.comment_id, NEW.comment_text, NEW.ai_summary,
+            (SELECT section_title FROM sections WHERE section_id = NEW.section_id));
+"""
+_SEARCH_FORGET_COMMENT = """
+    INSERT INTO comment_search (comment_search, rowid, comment_text, ai_summary, section_title)
+    VALUES ('delete', OLD.comment_id, OLD.comment_text, OLD.ai_summary,
+            (SELECT section_title FROM sections WHERE section_id = OLD.section_id));
+"""
+# Re-indexes a section's comments under its new title ('{title}' is NEW.section_title or NULL).
+_SEARCH_RETITLE_SECTION = """
+    INSERT INTO comment_search (comment_search, rowid, comment_text, ai_summary, section_title)
+    SELECT 'delete', comment_id, comment_text, ai_summary, OLD.section_title FROM comments WHERE section_id = OLD.section_id;
+    INSERT INTO comment_search (rowid, comment_text, ai_summary, section_title)
+    SELECT comment_id, comment_text, ai_summary, {title} FROM comments WHERE section_id = OLD.section_id;
+"""
+
+CREATE_SEARCH_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS trg_search_comment_insert AFTER INSERT ON comments
+        BEGIN {_SEARCH_ADD_COMMENT} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_search_comment_delete AFTER DELETE ON comments
+        BEGIN {_SEARCH_FORGET_COMMENT} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_search_comment_update AFTER UPDATE OF comment_text, ai_summary, section_id ON comments
+        WHEN OLD.comment_text IS NOT NEW.comment_text OR OLD.ai_summary IS NOT NEW.ai_summary
+          OR OLD.section_id IS NOT NEW.section_id
+        BEGIN {_SEARCH_FORGET_COMMENT} {_SEARCH_ADD_COMMENT} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_search_section_update AFTER UPDATE OF section_title ON sections
+        WHEN OLD.section_title IS NOT NEW.section_title
+        BEGIN {_SEARCH_RETITLE_SECTION.format(title="NEW.section_title")} END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_search_section_delete AFTER DELETE ON sections
+        BEGIN {_SEARCH_RETITLE_SECTION.format(title="NULL")} END;""",
+]
+
+
+def rebuild_search_index(conn):
+    """Re-indexes every comment from scratch (e.g. after a bulk load with the triggers off)."""
+    conn.execute(f"INSERT INTO {SEARCH_INDEX_TABLE} ({SEARCH_INDEX_TABLE}) VALUES ('rebuild');")
+    conn.commit()
+
+
+# --- Change Tracking ---
+# The last change to every row of the base tables, for incremental exports
+# (export_to_csv.py --incremental). change_seq only ever grows: it is assigned
+# inside the writing transaction and SQLite has one writer at a time, so a
+# reader that has seen sequence N has seen every change up to N.
+CHANGE_TRACKED_TABLES = ["drafts", "sections", "users", "submissions", "comments"]
+
+CREATE_ROW_CHANGES_TABLE = """
+CREATE TABLE IF NOT EXISTS row_changes (
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    change_seq INTEGER NOT NULL,
+    deleted BOOLEAN NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, row_id)
+) WITHOUT ROWID;
+"""
+
+# Not in CREATE_INDEXES: the triggers need them, so they are never dropped.
+CREATE_ROW_CHANGES_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_row_changes_seq ON row_changes(change_seq);",
+    "CREATE INDEX IF NOT EXISTS idx_row_changes_table_seq ON row_changes(table_name, change_seq);",
+]
+
+_RECORD_CHANGE = """
+    INSERT INTO row_changes (table_name, row_id, change_seq, deleted)
+    VALUES ('{table}', {row}.rowid, (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM row_changes), {deleted})
+    ON CONFLICT (table_name, row_id) DO UPDATE SET change_seq = excluded.change_seq, deleted = excluded.deleted;
+"""
+
+CREATE_ROW_CHANGES_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS trg_changes_{table}_{event.lower()} AFTER {event} ON {table}
+        BEGIN {_RECORD_CHANGE.format(table=table, row=row, deleted=deleted)} END;"""
+    for table in CHANGE_TRACKED_TABLES
+    for event, row, deleted in [("INSERT", "NEW", 0), ("UPDATE", "NEW", 0), ("DELETE", "OLD", 1)]
+]
+
+
+# --- Worklists ---
+# What each analysis job has left to do. Kept here, with the schema, so the
+# pipeline can count pending work without importing the jobs themselves.
+
+# Comments longer than 20 characters with no summary yet, or whose summary failed.
+PENDING_COMMENTS_FILTER = """
+    FROM comments c
+    JOIN sections s ON c.section_id = s.section_id
+    WHERE 
+        (c.ai_summary IS NULL OR c.ai_summary = 'Error generating summary.') AND
+        (c.comment_text IS NOT NULL AND LENGTH(c.comment_text) > 20)
+"""
+
+# Comments with text that have not been tokenized yet. Edits and deletes clear
+# a comment's entries (see CREATE_COMMENT_TERMS_TRIGGERS), which re-queues it.
+PENDING_TERMS_QUERY = """
+    SELECT c.comment_id, c.comment_text FROM comments c
+    WHERE c.comment_text IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM comment_terms_indexed i WHERE i.comment_id = c.comment_id)
+"""
+
+# A section is dirty when it has never been analyzed, has comments newer than its
+# watermark, or has comments edited after its summary was written.
+DIRTY_SECTIONS_QUERY = """
+    SELECT s.section_id FROM sections s
+    WHERE s.section_ai_key_points IS NULL
+       OR EXISTS (
+            SELECT 1 FROM comments c
+            WHERE c.section_id = s.section_id AND c.comment_id > COALESCE(s.section_summary_watermark, 0)
+       )
+       OR EXISTS (
+            SELECT 1 FROM comments c
+            WHERE c.section_id = s.section_id AND c.updated_at > s.section_ai_summary_updated_at
+       )
+"""
+
+# A draft is dirty when it has never been analyzed or one of its sections was
+# re-summarized after the draft summary was written.
+DIRTY_DRAFTS_QUERY = """
+    SELECT d.draft_id FROM drafts d
+    WHERE d.draft_ai_summary IS NULL
+       OR EXISTS (
+            SELECT 1 FROM sections s
+            WHERE s.draft_id = d.draft_id AND s.section_ai_summary_updated_at > d.draft_ai_summary_updated_at
+       )
+"""
+
+
+# --- Indexes ---
+# Secondary indexes for the hot read paths. query_plan_audit.py checks that the
+# registered hot queries keep using them.
+CREATE_INDEXES = [
+    # /api/comments/<draft_id>, word clouds: submissions of a draft (covering for the user join)
+    "CREATE INDEX IF NOT EXISTS idx_submissions_draft_id ON submissions(draft_id, user_id);",
+    # comments -> submissions join
+    "CREATE INDEX IF NOT EXISTS idx_comments_submission_id ON comments(submission_id);",
+    # comments of a section (get_draft_details, section analysis); kept in
+    # comment_id order within a section so /api/comments pages need no sort
+    "CREATE INDEX IF NOT EXISTS idx_comments_section ON comments(section_id);",
+    # /api/comments?sentiment= filter within a section
+    "CREATE INDEX IF NOT EXISTS idx_comments_section_sentiment ON comments(section_id, sentiment_label);",
+    # "edited since the last summary" check in executive_summarization.py
+    """CREATE INDEX IF NOT EXISTS idx_comments_section_updated ON comments(section_id, updated_at)
+       WHERE updated_at IS NOT NULL;""",
+    # /api/sections/<draft_id>, draft roll-ups
+    "CREATE INDEX IF NOT EXISTS idx_sections_draft_id ON sections(draft_id);",
+    # Worklist of analyze_sentiments.py; only pending rows are indexed
+    "CREATE INDEX IF NOT EXISTS idx_comments_pending_sentiment ON comments(comment_id) WHERE sentiment_label IS NULL;",
+    # Worklist of individual_summaries.py; only pending rows are indexed
+    """CREATE INDEX IF NOT EXISTS idx_comments_pending_summary ON comments(comment_id)
+       WHERE ai_summary IS NULL OR ai_summary = 'Error generating summary.';""",
+]
+
+
+def create_indexes(conn):
+    """Creates any missing secondary indexes and refreshes planner statistics."""
+    for statement in CREATE_INDEXES:
+        conn.execute(statement)
+    conn.execute("PRAGMA optimize;")
+    conn.commit()
+
+
+# --- Schema Migrations ---
+# Columns added after the original schema, for databases created before them.
+# Each entry is (table, column, column definition, backfill run once when the column is added).
+SCHEMA_MIGRATIONS = [
+    # Incremental executive analysis: a section summary covers comments up to the
+    # watermark and edits made before its timestamp; a draft summary covers section
+    # summaries written before its timestamp. Existing summaries count as current.
+    # Timestamps carry milliseconds so back-to-back runs still order correctly.
+    ("sections", "section_summary_watermark", "INTEGER", """
+        UPDATE sections SET section_summary_watermark = (
+            SELECT MAX(c.comment_id) FROM comments c WHERE c.section_id = sections.section_id
+        ) WHERE section_ai_key_points IS NOT NULL
+    """),
+    ("sections", "section_ai_summary_updated_at", "DATETIME",
+     "UPDATE sections SET section_ai_summary_updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE section_ai_key_points IS NOT NULL"),
+    ("drafts", "draft_ai_summary_updated_at", "DATETIME",
+     "UPDATE drafts SET draft_ai_summary_updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE draft_ai_summary IS NOT NULL"),
+    ("comments", "cluster_id", "INTEGER", None),
+    # Per-class sentiment probabilities, which the dashboard database carries
+    # and the frontend reads.
+    ("comments", "score_positive", "REAL", None),
+    ("comments", "score_negative", "REAL", None),
+    ("comments", "score_neutral", "REAL", None),
+    # Which tier of the sentiment cascade labelled the comment (see analyze_sentiments.py);
+    # NULL for labels written before it was recorded.
+    ("comments", "sentiment_tier", "TEXT", None),
+]
+
+
+def migrate_schema(conn):
+    """
+    Brings an existing database up to the current schema by adding any missing
+    columns, aggregate tables, triggers and indexes. Safe to run repeatedly.
+    """
+    for table, column, definition, backfill in SCHEMA_MIGRATIONS:
+        existing_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table});")]
+        if column not in existing_columns:
+            print(f"Migrating schema: adding {table}.{column}")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+            if backfill:
+                conn.execute(backfill)
+    conn.commit()
+
+    cube_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'comment_sentiment_cube'"
+    ).fetchone()
+    conn.execute(CREATE_DRAFT_GENERATIONS_TABLE)
+    conn.execute(CREATE_WORD_CLOUD_STATE_TABLE)
+    conn.execute(CREATE_COMMENT_TERMS_TABLE)
+    conn.execute(CREATE_COMMENT_TERMS_INDEXED_TABLE)
+    conn.execute(CREATE_COMMENT_EMBEDDINGS_TABLE)
+    conn.execute(CREATE_CLUSTER_INDEX)
+    search_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_INDEX_TABLE,)
+    ).fetchone()
+    conn.execute(CREATE_SEARCH_SOURCE_VIEW)
+    conn.execute(CREATE_SEARCH_INDEX_TABLE)
+    if not search_exists:
+        # 'ORDER BY rank' on the index uses these weights. FTS5 keeps the
+        # setting in its config table, so it is written once, with the table.
+        conn.execute(f"INSERT INTO {SEARCH_INDEX_TABLE} ({SEARCH_INDEX_TABLE}, rank) VALUES ('rank', ?);",
+                     (f"bm25({', '.join(map(str, SEARCH_COLUMN_WEIGHTS))})",))
+        print("Migrating schema: building the comment_search full-text index")
+        rebuild_search_index(conn)
+    conn.execute(CREATE_ROW_CHANGES_TABLE)
+    for statement in CREATE_ROW_CHANGES_INDEXES:
+        conn.execute(statement)
+    conn.execute(CREATE_SENTIMENT_CUBE_TABLE)
+    # Cubes keyed on the section's draft are rebuilt, along with their triggers.
+    stale_cube = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_cube_comment_insert' AND sql LIKE '%sec.draft_id%'"
+    ).fetchone()
+    if stale_cube:
+        for trigger in ("trg_cube_comment_insert", "trg_cube_comment_delete", "trg_cube_comment_update"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    if not cube_exists or stale_cube:
+        print("Migrating schema: building comment_sentiment_cube")
+        rebuild_sentiment_cube(conn)
+    for statement in (CREATE_SENTIMENT_CUBE_TRIGGERS + CREATE_COMMENT_TERMS_TRIGGERS
+                      + CREATE_CLUSTER_TRIGGERS + CREATE_SEARCH_TRIGGERS + CREATE_ROW_CHANGES_TRIGGERS):
+        conn.execute(statement)
+    conn.commit()
+
+    create_indexes(conn)
+
+
 # --- Data Insertion Queries ---
 # All the INSERT statements you need to populate the database with fake data.
 INSERT_DATA = """
@@ -166,20 +650,21 @@ INSERT INTO comments (submission_id, section_id, action_type, comment_text) VALU
 """
 
 
-def setup_database():
+def setup_database(database_file=DATABASE_FILE):
     """
-    Creates the database schema and populates it with initial data.
+    Creates the database schema and populates it with initial data. On an
+    existing database this migrates the schema (see migrate_schema).
     """
     # Check if the database file already exists. If so, don't re-populate.
-    db_exists = os.path.exists(DATABASE_FILE)
+    db_exists = os.path.exists(database_file)
     if db_exists:
-        print(f"Database file '{DATABASE_FILE}' already exists. Skipping creation and population.")
+        print(f"Database file '{database_file}' already exists. Skipping creation and population.")
         # We will still connect to verify the schema is there.
     
     # Connect to the SQLite database. It will be created if it doesn't exist.
     conn = None
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
+        conn = sqlite3.connect(database_file, timeout=BUSY_TIMEOUT_SECONDS)
         cursor = conn.cursor()
 
         # IMPORTANT: Enable foreign key constraint enforcement
@@ -192,6 +677,7 @@ def setup_database():
         cursor.execute(CREATE_USERS_TABLE)
         cursor.execute(CREATE_SUBMISSIONS_TABLE)
         cursor.execute(CREATE_COMMENTS_TABLE)
+        migrate_schema(conn)
         print("Schema created successfully.")
 
         # --- Populate Tables (only if the database is new) ---
@@ -231,6 +717,7 @@ def setup_database():
 
     except sqlite3.Error as e:
         print(f"Database error: {e}")
+        raise
     finally:
         # Ensure the connection is closed no matter what
         if conn:
@@ -239,4 +726,7 @@ def setup_database():
 
 if __name__ == '__main__':
     # This block runs when you execute the script directly
-    setup_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create the database, or migrate an existing one to the current schema.")
+    parser.add_argument("--db", default=DATABASE_FILE, help="Database file to create or migrate (e.g. backend/econsultation.db).")
+    args = parser.parse_args()
+    setup_database(args.db)
\ No newline at end of file
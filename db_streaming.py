@@ -0,0 +1,68 @@
+import time
+
+# --- Configuration ---
+# How many pending rows are read from the database per page.
+READ_CHUNK_SIZE = 1000
+# Results are committed when either threshold is reached, whichever comes first.
+COMMIT_EVERY_ROWS = 500
+COMMIT_EVERY_SECONDS = 30.0
+
+
+def iter_keyset_chunks(conn, select_query, params=(), key_column="comment_id", chunk_size=READ_CHUNK_SIZE):
+    """
+    Reads the rows matched by 'select_query' page by page using keyset pagination
+    (key > last seen key), so memory stays flat no matter how big the table is.
+    'select_query' must have a WHERE clause and return the key as its first column;
+    the key filter, ORDER BY and LIMIT are appended here.
+    """
+    paged_query = f"{select_query} AND {key_column} > ? ORDER BY {key_column} LIMIT ?"
+    last_key = 0
+    while True:
+        rows = conn.execute(paged_query, (*params, last_key, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_key = rows[-1][0]
+
+
+class CheckpointedWriter:
+    """
+    Buffers UPDATE parameter tuples and writes them with one executemany per
+    transaction, every 'commit_every' rows or 'commit_interval' seconds.
+    Anything already committed is not in the worklist on the next run, so a
+    crashed job resumes where it stopped. 'on_commit', if given, is called with
+    the rows of every committed transaction.
+    """
+
+    def __init__(self, conn, update_query, commit_every=COMMIT_EVERY_ROWS, commit_interval=COMMIT_EVERY_SECONDS, on_commit=None):
+        self.conn = conn
+        self.update_query = update_query
+        self.on_commit = on_commit
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.pending = []
+        self.written = 0
+        self.last_commit = time.monotonic()
+
+    def add(self, updates):
+        self.pending.extend(updates)
+        if len(self.pending) >= self.commit_every or time.monotonic() - self.last_commit >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            with self.conn:
+                self.conn.executemany(self.update_query, self.pending)
+            self.written += len(self.pending)
+            if self.on_commit:
+                self.on_commit(self.pending)
+            self.pending = []
+        self.last_commit = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Keep whatever finished before a crash; those rows are valid results.
+        self.flush()
+        return False
@@ -1,43 +1,131 @@
 import sqlite3
 import os
-import torch
 from tqdm import tqdm
-from transformers import pipeline
-from sentence_transformers import SentenceTransformer
+from inference_cache import InferenceCache
+from database_setup import migrate_schema, bump_draft_generations, DIRTY_SECTIONS_QUERY, DIRTY_DRAFTS_QUERY, BUSY_TIMEOUT_SECONDS
+from inference_service import load_pipeline, default_device
 
 # --- Configuration ---
 DATABASE_FILE = "econsultation.db"
 # We only need the summarizer and key points models for this final version
 SUMMARIZER_MODEL_NAME = "facebook/bart-large-cnn"
 KEY_POINTS_MODEL_NAME = "google/flan-t5-base"
+# Pin these to commit hashes to make cached results tied to an exact model version.
+SUMMARIZER_MODEL_REVISION = "main"
+KEY_POINTS_MODEL_REVISION = "main"
 
+# Generation settings for each model call; they are also part of the cache key.
+SECTION_SUMMARY_PARAMS = {"max_length": 256, "min_length": 64, "do_sample": False, "truncation": True}
+KEY_POINTS_PARAMS = {"max_length": 256, "truncation": True}
+DRAFT_SUMMARY_PARAMS = {"max_length": 400, "min_length": 100, "do_sample": False, "truncation": True}
+# Intermediate summaries produced for each chunk during map-reduce.
+CHUNK_SUMMARY_PARAMS = {"max_length": 150, "min_length": 40, "do_sample": False, "truncation": True}
 
-def run_section_analysis(conn, summarizer, key_points_extractor):
+# Map-reduce settings. Inputs are packed into chunks that fit the summarizer's
+# context (BART reads at most 1024 tokens), summarized MAP_BATCH_SIZE chunks at a
+# time, and the chunk summaries are reduced level by level until one chunk remains.
+CHUNK_TOKEN_BUDGET = 900
+MAP_BATCH_SIZE = 8
+# Use the per-comment ai_summary (from individual_summaries.py) as the map output
+# where one exists, instead of re-reading the full comment text.
+USE_COMMENT_SUMMARIES = True
+
+
+def generate_text(model, text, params, output_key, cache=None):
+    """
+    Runs one generation call and returns the output text, going through the
+    inference cache when one is given.
+    """
+    def run_model():
+        return model(text, **params)[0][output_key]
+
+    return cache.get_or_compute(text, params, run_model) if cache else run_model()
+
+
+def pack_into_chunks(texts, tokenizer, token_budget=CHUNK_TOKEN_BUDGET):
+    """
+    Greedily packs texts, in order, into "\n\n"-joined chunks of at most
+    'token_budget' tokens. A single text longer than the budget gets a chunk
+    of its own (and is truncated by the model).
+    """
+    lengths = [len(ids) + 2 for ids in tokenizer(texts, add_special_tokens=False)['input_ids']]
+    chunks = []
+    current, current_tokens = [], 0
+    for text, length in zip(texts, lengths):
+        if current and current_tokens + length > token_budget:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += length
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def summarize_batch(summarizer, texts, params, cache=None):
+    """
+    Summarizes a list of texts with batched pipeline calls, skipping texts that
+    are already in the cache. Returns the summaries in input order.
+    """
+    results = cache.get_many(texts, params) if cache else {}
+    missing = [text for text in dict.fromkeys(texts) if text not in results]
+    if missing:
+        outputs = summarizer(missing, batch_size=MAP_BATCH_SIZE, **params)
+        computed = [output['summary_text'] for output in outputs]
+        results.update(zip(missing, computed))
+        if cache:
+            cache.put_many(list(zip(missing, computed)), params)
+    return [results[text] for text in texts]
+
+
+def map_reduce_summarize(summarizer, texts, final_params, cache=None):
+    """
+    Summarizes any number of texts without silently dropping the tail: texts are
+    packed into token-budgeted chunks, each chunk is summarized (map), and the
+    chunk summaries are packed and summarized again (reduce) until everything
+    fits into one chunk, which gets the final summary with 'final_params'.
+    """
+    level = 0
+    chunks = pack_into_chunks(texts, summarizer.tokenizer)
+    while len(chunks) > 1:
+        level += 1
+        print(f"    - Level {level}: summarizing {len(chunks)} chunks...")
+        chunk_summaries = summarize_batch(summarizer, chunks, CHUNK_SUMMARY_PARAMS, cache)
+        chunks = pack_into_chunks(chunk_summaries, summarizer.tokenizer)
+    return generate_text(summarizer, chunks[0], final_params, 'summary_text', cache)
+
+
+def run_section_analysis(conn, summarizer, key_points_extractor, summary_cache=None, key_points_cache=None):
     """
     Part 1: Generates a summary paragraph and bulleted key points for
-    each section based on all of its comments.
+    each section based on all of its comments. Only sections with new or
+    edited comments since their last summary are recomputed.
     """
     cursor = conn.cursor()
     print("--- Starting Part 1: Section-Wise Executive Analysis ---")
     
-    cursor.execute("SELECT section_id FROM sections")
-    all_section_ids = [row['section_id'] for row in cursor.fetchall()]
+    cursor.execute(DIRTY_SECTIONS_QUERY)
+    dirty_section_ids = [row['section_id'] for row in cursor.fetchall()]
+    print(f"Found {len(dirty_section_ids)} sections with new or edited comments.")
     
     section_updates = []
-    for section_id in tqdm(all_section_ids, desc="Analyzing Sections"):
-        # Check if already processed to allow re-running the script
-        cursor.execute("SELECT section_ai_key_points FROM sections WHERE section_id = ?", (section_id,))
-        if cursor.fetchone()['section_ai_key_points']:
-             print(f"\nSkipping Section ID: {section_id} - already analyzed.")
-             continue
+    for section_id in tqdm(dirty_section_ids, desc="Analyzing Sections"):
+        # The watermark is taken before reading so comments added mid-run stay dirty.
+        cursor.execute("SELECT MAX(comment_id) AS watermark FROM comments WHERE section_id = ?", (section_id,))
+        watermark = cursor.fetchone()['watermark']
 
         # Gather all relevant comments for the section
         cursor.execute("""
-            SELECT comment_text FROM comments 
-            WHERE section_id = ? AND comment_text IS NOT NULL AND LENGTH(comment_text) > 20
-        """, (section_id,))
+            SELECT comment_text, ai_summary FROM comments 
+            WHERE section_id = ? AND comment_id <= ? AND comment_text IS NOT NULL AND LENGTH(comment_text) > 20
+            ORDER BY comment_id
+        """, (section_id, watermark))
         
-        comments = [row['comment_text'] for row in cursor.fetchall()]
+        comments = [
+            row['ai_summary'] if USE_COMMENT_SUMMARIES and row['ai_summary'] and row['ai_summary'] != 'Error generating summary.'
+            else row['comment_text']
+            for row in cursor.fetchall()
+        ]
         
         if len(comments) < 2:
             print(f"\nSkipping Section ID: {section_id} (not enough comments for a meaningful summary).")
@@ -45,56 +133,61 @@ def run_section_analysis(conn, summarizer, key_points_extractor):
 
         print(f"\nProcessing Section ID: {section_id} with {len(comments)} comments...")
         
-        combined_text = "\n\n".join(comments)
-
         try:
-            # Generate the executive summary paragraph for the whole section
-            summary_paragraph = summarizer(
-                combined_text, max_length=256, min_length=64, do_sample=False, truncation=True
-            )[0]['summary_text']
+            # Generate the executive summary paragraph for the whole section,
+            # covering every comment rather than just the first ~1024 tokens
+            summary_paragraph = map_reduce_summarize(
+                summarizer, comments, SECTION_SUMMARY_PARAMS, summary_cache
+            )
             
             # Use the instruction model to extract clean bullet points from that summary
             key_point_prompt = f"Extract the key points as a bulleted list from the following text:\n{summary_paragraph}"
-            key_points = key_points_extractor(
-                key_point_prompt, max_length=256, truncation=True
-            )[0]['generated_text']
+            key_points = generate_text(
+                key_points_extractor, key_point_prompt, KEY_POINTS_PARAMS, 'generated_text', key_points_cache
+            )
 
-            section_updates.append((summary_paragraph, key_points, section_id))
+            section_updates.append((summary_paragraph, key_points, watermark, section_id))
         except Exception as e:
             print(f"    - ERROR processing Section ID {section_id}: {e}")
 
     if section_updates:
-        update_query = "UPDATE sections SET section_ai_summary = ?, section_ai_key_points = ? WHERE section_id = ?"
+        update_query = """
+            UPDATE sections
+            SET section_ai_summary = ?, section_ai_key_points = ?, section_summary_watermark = ?,
+                section_ai_summary_updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            WHERE section_id = ?
+        """
         cursor.executemany(update_query, section_updates)
         conn.commit()
+        updated_section_ids = [update[-1] for update in section_updates]
+        placeholders = ",".join("?" * len(updated_section_ids))
+        cursor.execute(f"SELECT DISTINCT draft_id FROM sections WHERE section_id IN ({placeholders})", updated_section_ids)
+        bump_draft_generations(conn, [row['draft_id'] for row in cursor.fetchall()])
         print(f"\nPart 1 Complete: Successfully updated {len(section_updates)} sections with executive analysis.")
     else:
         print("\nPart 1 Complete: No new sections to update.")
 
 
-def run_draft_analysis_simplified(conn, summarizer):
+def run_draft_analysis_simplified(conn, summarizer, summary_cache=None):
     """
     Part 2 (Simplified): Generates a single summary paragraph for each draft by
-    rolling up the section-level summaries.
+    rolling up the section-level summaries. Only drafts whose section
+    summaries changed since the last roll-up are recomputed.
     """
     cursor = conn.cursor()
     print("\n--- Starting Part 2: Draft-Wise Roll-up Analysis ---")
     
-    cursor.execute("SELECT draft_id FROM drafts")
-    all_draft_ids = [row['draft_id'] for row in cursor.fetchall()]
+    cursor.execute(DIRTY_DRAFTS_QUERY)
+    dirty_draft_ids = [row['draft_id'] for row in cursor.fetchall()]
+    print(f"Found {len(dirty_draft_ids)} drafts with changed section summaries.")
     
     draft_updates = []
-    for draft_id in tqdm(all_draft_ids, desc="Analyzing Drafts"):
-        # Check if already processed
-        cursor.execute("SELECT draft_ai_summary FROM drafts WHERE draft_id = ?", (draft_id,))
-        if cursor.fetchone()['draft_ai_summary']:
-             print(f"\nSkipping Draft ID: {draft_id} - already analyzed.")
-             continue
-
+    for draft_id in tqdm(dirty_draft_ids, desc="Analyzing Drafts"):
         # Gather the summaries from the child sections
         cursor.execute("""
             SELECT section_ai_summary FROM sections 
             WHERE draft_id = ? AND section_ai_summary IS NOT NULL AND section_ai_summary != ''
+            ORDER BY section_id
         """, (draft_id,))
         
         section_summaries = [row['section_ai_summary'] for row in cursor.fetchall()]
@@ -106,21 +199,21 @@ def run_draft_analysis_simplified(conn, summarizer):
         print(f"\nProcessing Draft ID: {draft_id} by rolling up {len(section_summaries)} section summaries...")
         
         try:
-            # Create a "summary of summaries"
-            combined_summaries = "\n\n".join(section_summaries)
-            draft_summary_paragraph = summarizer(
-                combined_summaries, max_length=400, min_length=100, do_sample=False, truncation=True
-            )[0]['summary_text']
+            # Create a "summary of summaries", reduced in stages for drafts with many sections
+            draft_summary_paragraph = map_reduce_summarize(
+                summarizer, section_summaries, DRAFT_SUMMARY_PARAMS, summary_cache
+            )
             
             draft_updates.append((draft_summary_paragraph, draft_id))
         except Exception as e:
             print(f"    - ERROR processing Draft ID {draft_id}: {e}")
 
     if draft_updates:
-        # Note: We are only updating one column now.
-        update_query = "UPDATE drafts SET draft_ai_summary = ? WHERE draft_id = ?"
+        # Note: We are only updating the summary paragraph (and its timestamp) now.
+        update_query = "UPDATE drafts SET draft_ai_summary = ?, draft_ai_summary_updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE draft_id = ?"
         cursor.executemany(update_query, draft_updates)
         conn.commit()
+        bump_draft_generations(conn, [draft_id for _, draft_id in draft_updates])
         print(f"\nPart 2 Complete: Successfully updated {len(draft_updates)} drafts.")
     else:
         print("\nPart 2 Complete: No new drafts to update.")
@@ -130,27 +223,42 @@ def main():
     """
     Main orchestrator for the entire Phase 2 process.
     """
-    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    device = default_device()
     print(f"Using device: {device}")
 
     conn = None
+    caches = []
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
+        conn = sqlite3.connect(DATABASE_FILE, timeout=BUSY_TIMEOUT_SECONDS)
         conn.row_factory = sqlite3.Row
         print("Successfully connected to the database.")
+        migrate_schema(conn)
 
+        # Served by inference_service.py when it is running, otherwise loaded here.
         print("Loading AI models... (This may take several minutes)")
-        summarizer = pipeline("summarization", model=SUMMARIZER_MODEL_NAME, device=device)
-        key_points_extractor = pipeline("text2text-generation", model=KEY_POINTS_MODEL_NAME, device=device)
+        summarizer = load_pipeline("summarization", SUMMARIZER_MODEL_NAME, SUMMARIZER_MODEL_REVISION, device)
+        key_points_extractor = load_pipeline("text2text-generation", KEY_POINTS_MODEL_NAME, KEY_POINTS_MODEL_REVISION, device)
         print("All models loaded successfully.\n")
 
+        summary_cache = InferenceCache(SUMMARIZER_MODEL_NAME, "summarization", SUMMARIZER_MODEL_REVISION,
+                                       pipeline=summarizer)
+        key_points_cache = InferenceCache(KEY_POINTS_MODEL_NAME, "text2text-generation", KEY_POINTS_MODEL_REVISION,
+                                          pipeline=key_points_extractor)
+        caches = [summary_cache, key_points_cache]
+
         # --- RUN THE PROCESS IN THE CORRECT ORDER ---
-        run_section_analysis(conn, summarizer, key_points_extractor)
-        run_draft_analysis_simplified(conn, summarizer)
+        run_section_analysis(conn, summarizer, key_points_extractor, summary_cache, key_points_cache)
+        run_draft_analysis_simplified(conn, summarizer, summary_cache)
+
+        for cache in caches:
+            cache.report()
 
     except Exception as e:
         print(f"A critical error occurred in the main process: {e}")
+        raise
     finally:
+        for cache in caches:
+            cache.close()
         if conn:
             conn.close()
             print("\nPhase 2 analysis is complete. Database connection closed.")
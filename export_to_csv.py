@@ -1,45 +1,185 @@
 import sqlite3
 import csv
+import io
 import os
+import gzip
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
-def export_db_to_csv(database_name):
+try:
+    import zstandard
+except ImportError:
+    # zstd output is optional; gzip is always available.
+    zstandard = None
+
+# --- Configuration ---
+DATABASE_FILE = "econsultation.db"
+OUTPUT_FOLDER = "."
+# Rows pulled from the cursor per fetchmany call; memory stays flat per table.
+FETCH_SIZE = 5000
+# Tables exported at the same time, each by its own process and connection.
+EXPORT_WORKERS = min(4, os.cpu_count() or 1)
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 6
+# Per-table watermarks of the last export, kept next to the exported files.
+STATE_FILE = "export_state.json"
+# Derived data that the jobs rebuild from the base tables; not worth exporting.
+# Virtual tables (the full-text search index) and their shadow tables are
+# skipped as well (see exported_tables).
+SKIP_TABLES = {"comment_terms", "comment_terms_indexed", "comment_embeddings", "word_cloud_state", "row_changes",
+               # The API's cache counters and the aggregate cube (see database_setup.py)
+               "draft_generations", "comment_sentiment_cube"}
+
+FILE_EXTENSIONS = {None: ".csv", "gzip": ".csv.gz", "zstd": ".csv.zst"}
+
+
+def open_output(path, compression):
+    """Opens a text stream for CSV output, compressed as requested."""
+    if compression == "gzip":
+        return gzip.open(path, "wt", compresslevel=GZIP_LEVEL, newline="", encoding="utf-8")
+    if compression == "zstd":
+        raw = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, "wb"))
+        return io.TextIOWrapper(raw, newline="", encoding="utf-8")
+    return open(path, "w", newline="", encoding="utf-8")
+
+
+def exported_tables(conn):
     """
-    Exports each table from a SQLite database to its own CSV file.
+    The tables worth exporting: all but SKIP_TABLES, virtual tables and the
+    shadow tables SQLite keeps for them ('<virtual table>_data', ...).
     """
-    try:
-        # Connect to the SQLite database
-        conn = sqlite3.connect(database_name)
-        cursor = conn.cursor()
+    rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%';").fetchall()
+    virtual = [name for name, sql in rows if sql.upper().startswith("CREATE VIRTUAL TABLE")]
+    return [
+        name for name, _ in rows
+        if name not in SKIP_TABLES and name not in virtual and not any(name.startswith(f"{table}_") for table in virtual)
+    ]
 
-        # Query to get all table names in the database
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
 
-        # Iterate over each table
-        for table_name in tables:
-            table_name = table_name[0]
-            csv_filename = f"{table_name}.csv"
+def is_change_tracked(conn, table):
+    """True if the row_changes triggers (see database_setup.py) cover this table."""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (f"trg_changes_{table}_update",)
+    ).fetchone() is not None
 
-            print(f"Exporting table '{table_name}' to '{csv_filename}'...")
 
-            # Select all data from the current table
-            cursor.execute(f"SELECT * FROM {table_name};")
-            rows = cursor.fetchall()
+def export_table(database_name, table_name, output_dir, compression=None, since_seq=None):
+    """
+    Streams one table into a CSV over its own read-only connection. With
+    'since_seq', only rows changed after that change sequence are written, to
+    '<table>.delta-<timestamp>.csv' with leading _row_id/_deleted columns.
+    Returns (table_name, rows written, output path or None, watermark).
+    """
+    conn = sqlite3.connect(f"file:{database_name}?mode=ro", uri=True)
+    try:
+        # One read transaction, so the watermark and the rows come from the same snapshot.
+        conn.execute("BEGIN;")
+        tracked = is_change_tracked(conn, table_name)
+        watermark = None
+        if tracked:
+            watermark = conn.execute(
+                "SELECT COALESCE(MAX(change_seq), 0) FROM row_changes WHERE table_name = ?", (table_name,)
+            ).fetchone()[0]
+
+        extension = FILE_EXTENSIONS[compression]
+        if since_seq is not None and tracked:
+            cursor = conn.execute(f"""
+                SELECT ch.row_id AS _row_id, ch.deleted AS _deleted, t.*
+                FROM row_changes ch LEFT JOIN {table_name} t ON t.rowid = ch.row_id
+                WHERE ch.table_name = ? AND ch.change_seq > ?
+                ORDER BY ch.row_id
+            """, (table_name, since_seq))
+            csv_filename = os.path.join(output_dir, f"{table_name}.delta-{time.strftime('%Y%m%dT%H%M%S')}{extension}")
+        else:
+            cursor = conn.execute(f"SELECT * FROM {table_name};")
+            csv_filename = os.path.join(output_dir, f"{table_name}{extension}")
 
-            if not rows:
-                print(f"Table '{table_name}' is empty. Skipping CSV creation.")
-                continue
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return table_name, 0, None, watermark
 
-            # Get the column headers
-            headers = [description[0] for description in cursor.description]
+        # Get the column headers
+        headers = [description[0] for description in cursor.description]
 
-            # Create and write to the CSV file
-            with open(csv_filename, 'w', newline='', encoding='utf-8') as csv_file:
-                writer = csv.writer(csv_file)
-                writer.writerow(headers)
+        # Written under a temporary name and renamed, so readers never see half a file.
+        temp_filename = f"{csv_filename}.tmp"
+        written = 0
+        with open_output(temp_filename, compression) as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(headers)
+            while rows:
                 writer.writerows(rows)
+                written += len(rows)
+                rows = cursor.fetchmany(FETCH_SIZE)
+        os.replace(temp_filename, csv_filename)
+        return table_name, written, csv_filename, watermark
+    finally:
+        conn.close()
+
+
+def load_export_state(output_dir):
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as state_file:
+        return json.load(state_file)
+
+
+def save_export_state(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_db_to_csv(database_name, output_dir=OUTPUT_FOLDER, compression=None, workers=EXPORT_WORKERS, incremental=False):
+    """
+    Exports each table from a SQLite database to its own CSV file.
+    Tables are exported in parallel and streamed with fetchmany, so memory
+    stays bounded. With incremental=True, change-tracked tables only export
+    the rows changed since the previous incremental run into this folder
+    (the first run exports everything).
+    """
+    if compression == "zstd" and zstandard is None:
+        print("zstd output needs the 'zstandard' package (pip install zstandard).")
+        return
+
+    conn = None
+    try:
+        # Connect to the SQLite database
+        conn = sqlite3.connect(f"file:{database_name}?mode=ro", uri=True)
+        tables = exported_tables(conn)
+        conn.close()
+        conn = None
+
+        os.makedirs(output_dir, exist_ok=True)
+        state = load_export_state(output_dir) if incremental else {}
+        started = time.perf_counter()
+        total_rows = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(export_table, database_name, table_name, output_dir, compression,
+                            state.get(table_name, {}).get("change_seq"))
+                for table_name in tables
+            ]
+            for future in futures:
+                table_name, written, csv_filename, watermark = future.result()
+                total_rows += written
+                if csv_filename is None and table_name in state:
+                    print(f"No changes in '{table_name}' since the last export.")
+                elif csv_filename is None:
+                    print(f"Table '{table_name}' has no rows to export. Skipping CSV creation.")
+                else:
+                    print(f"Exported {written} rows of '{table_name}' to '{csv_filename}'.")
+                if incremental and watermark is not None:
+                    state[table_name] = {"change_seq": watermark, "exported_at": time.strftime("%Y-%m-%d %H:%M:%S")}
 
-        print("Export complete.")
+        if incremental:
+            save_export_state(output_dir, state)
+        elapsed = time.perf_counter() - started
+        print(f"Export complete: {total_rows} rows in {elapsed:.1f}s.")
 
     except sqlite3.Error as e:
         print(f"Database error: {e}")
@@ -50,11 +190,17 @@ def export_db_to_csv(database_name):
             conn.close()
 
 if __name__ == "__main__":
-    db_file = "econsultation.db"
+    parser = argparse.ArgumentParser(description="Export every table of the database to CSV.")
+    parser.add_argument("--db", default=DATABASE_FILE, help="Database file to export.")
+    parser.add_argument("--out", default=OUTPUT_FOLDER, help="Folder to write the CSVs to.")
+    parser.add_argument("--compress", choices=["gzip", "zstd"], help="Compress the CSVs.")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="Tables exported in parallel.")
+    parser.add_argument("--incremental", action="store_true", help="Only export rows changed since the last incremental run.")
+    args = parser.parse_args()
 
     # Check if the database file exists before trying to export
-    if os.path.exists(db_file):
-        export_db_to_csv(db_file)
+    if os.path.exists(args.db):
+        export_db_to_csv(args.db, args.out, args.compress, args.workers, args.incremental)
     else:
-        print(f"Error: Database file '{db_file}' not found.")
+        print(f"Error: Database file '{args.db}' not found.")
         print("Please ensure the database file is in the same directory as this script.")
@@ -0,0 +1,248 @@
+import sqlite3
+import os
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from export_to_csv import exported_tables, EXPORT_WORKERS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Parquet export is optional; export_to_csv.py needs no extra packages.
+    pa = pq = None
+
+# --- Configuration ---
+DATABASE_FILE = "econsultation.db"
+OUTPUT_FOLDER = "parquet"
+# Rows fetched and written per Parquet row group; memory stays flat per table.
+ROW_GROUP_ROWS = 64_000
+PARQUET_COMPRESSION = "zstd"
+# DATETIME columns are parsed as ISO 8601, which covers both CURRENT_TIMESTAMP
+# ('2026-01-31 12:00:00') and strftime('%Y-%m-%d %H:%M:%f') ('...12:00:00.123').
+TIMESTAMP_UNIT = "ms"
+# Low-cardinality text columns stored as dictionaries, which Power BI loads
+# as categories instead of re-reading every string.
+DICTIONARY_COLUMNS = {"sentiment_label", "sentiment_tier", "action_type", "state", "industry"}
+
+# The denormalized comment fact table: every comment column plus the section,
+# submission and user attributes the dashboard slices by. A comment's draft_id
+# is its submission's, as in /api/comments and the sentiment cube.
+FACT_TABLE = "comment_facts"
+FACT_COLUMNS = [
+    ("c", "comments", None),
+    ("sec", "sections", ["section_title"]),
+    ("s", "submissions", ["user_id", "draft_id", "submission_status", "otp_verified", "submitted_at"]),
+    ("u", "users", ["country", "state", "is_organization", "organization_name", "industry"]),
+]
+FACT_FROM = """
+    FROM comments c
+    LEFT JOIN sections sec ON c.section_id = sec.section_id
+    LEFT JOIN submissions s ON c.submission_id = s.submission_id
+    LEFT JOIN users u ON s.user_id = u.user_id
+"""
+# Partitioned tables are written as one file per draft: <table>/draft_<id>.parquet.
+# Rows without a draft, or whose draft no longer exists, go to draft_null.parquet.
+PARTITION_COLUMN = "draft_id"
+ORPHAN_PARTITION = "draft_null"
+
+
+def arrow_type(column, declared_type):
+    """Maps a column's declared SQLite type to the Arrow type it is exported as."""
+    if column in DICTIONARY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    declared_type = (declared_type or "").upper()
+    if declared_type == "BOOLEAN":
+        return pa.bool_()
+    if declared_type == "DATETIME":
+        return pa.timestamp(TIMESTAMP_UNIT)
+    if "INT" in declared_type:
+        return pa.int64()
+    if declared_type in ("REAL", "FLOAT", "DOUBLE"):
+        return pa.float64()
+    return pa.string()
+
+
+def parse_timestamps(values, arrow_field_type):
+    """
+    Parses a list of SQLite timestamp strings. Values that aren't timestamps
+    become nulls rather than failing the export. Returns (array, unparsed count).
+    """
+    try:
+        return pa.array(values, pa.string()).cast(arrow_field_type), 0
+    except pa.ArrowInvalid:
+        pass
+    # Rare: some value is malformed, so parse one by one to find which.
+    parsed, unparsed = [], 0
+    for value in values:
+        try:
+            parsed.append(None if value is None else pa.scalar(str(value)).cast(arrow_field_type).as_py())
+        except pa.ArrowInvalid:
+            parsed.append(None)
+            unparsed += 1
+    return pa.array(parsed, arrow_field_type), unparsed
+
+
+def to_arrow_array(values, arrow_field_type):
+    """Builds one Arrow column from a list of SQLite values. Returns (array, unparsed count)."""
+    if pa.types.is_dictionary(arrow_field_type):
+        return pa.array(values, pa.string()).dictionary_encode(), 0
+    if pa.types.is_boolean(arrow_field_type):
+        return pa.array(values, pa.int64()).cast(pa.bool_()), 0
+    if pa.types.is_timestamp(arrow_field_type):
+        return parse_timestamps(values, arrow_field_type)
+    return pa.array(values, arrow_field_type), 0
+
+
+def table_columns(conn, table_name):
+    """Returns [(column, declared type)] for a table."""
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({table_name});")]
+
+
+def build_table_query(conn, table_name):
+    """
+    Returns (select query, Arrow schema, partition column) for a table or for
+    the comment fact table. The query has a '{where}' slot for the partition's
+    condition; the partition column is None for unpartitioned tables.
+    """
+    if table_name == FACT_TABLE:
+        select_list, fields = [], []
+        for alias, source_table, wanted in FACT_COLUMNS:
+            for column, declared_type in table_columns(conn, source_table):
+                if wanted is None or column in wanted:
+                    select_list.append(f"{alias}.{column}")
+                    fields.append(pa.field(column, arrow_type(column, declared_type)))
+        query = f"SELECT {', '.join(select_list)} {FACT_FROM} WHERE {{where}} ORDER BY c.comment_id"
+        return query, pa.schema(fields), f"s.{PARTITION_COLUMN}"
+
+    columns = table_columns(conn, table_name)
+    schema = pa.schema([pa.field(column, arrow_type(column, declared_type)) for column, declared_type in columns])
+    partition = PARTITION_COLUMN if PARTITION_COLUMN in schema.names else None
+    return f"SELECT * FROM {table_name} WHERE {{where}}", schema, partition
+
+
+def write_parquet_file(cursor, schema, path, unparsed):
+    """
+    Streams a cursor into one Parquet file, one row group per fetch. Adds the
+    values exported as null because they didn't parse to 'unparsed'
+    ({column: count}). Returns the row count.
+    """
+    written = 0
+    with pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION) as writer:
+        rows = cursor.fetchmany(ROW_GROUP_ROWS)
+        while rows:
+            columns = list(zip(*rows))
+            arrays = []
+            for values, field in zip(columns, schema):
+                array, failures = to_arrow_array(list(values), field.type)
+                arrays.append(array)
+                if failures:
+                    unparsed[field.name] = unparsed.get(field.name, 0) + failures
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            written += len(rows)
+            rows = cursor.fetchmany(ROW_GROUP_ROWS)
+    return written
+
+
+def export_table(database_name, table_name, output_dir):
+    """
+    Exports one table to '<output_dir>/<table_name>/' over its own read-only
+    connection, with one Parquet file per draft for tables that carry a
+    draft_id. The folder is built aside and swapped in when complete.
+    Returns (table_name, rows written, files written, {column: unparsed values},
+    rows without an existing draft).
+    """
+    conn = sqlite3.connect(f"file:{database_name}?mode=ro", uri=True)
+    table_dir = os.path.join(output_dir, table_name)
+    temp_dir = f"{table_dir}.tmp"
+    try:
+        # One read transaction, so all partitions come from the same snapshot.
+        conn.execute("BEGIN;")
+        query, schema, partition = build_table_query(conn, table_name)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+
+        written, files, unparsed, orphaned = 0, 0, {}, 0
+        if partition:
+            draft_ids = [row[0] for row in conn.execute("SELECT draft_id FROM drafts ORDER BY draft_id")]
+            parts = [(f"draft_{draft_id}", f"{partition} = ?", (draft_id,)) for draft_id in draft_ids]
+            parts.append((ORPHAN_PARTITION, f"{partition} IS NULL OR {partition} NOT IN (SELECT draft_id FROM drafts)", ()))
+            for part_name, condition, params in parts:
+                path = os.path.join(temp_dir, f"{part_name}.parquet")
+                rows = write_parquet_file(conn.execute(query.format(where=condition), params), schema, path, unparsed)
+                if rows:
+                    written += rows
+                    files += 1
+                    if part_name == ORPHAN_PARTITION:
+                        orphaned = rows
+                else:
+                    os.remove(path)
+        else:
+            path = os.path.join(temp_dir, "part-0.parquet")
+            written = write_parquet_file(conn.execute(query.format(where="1")), schema, path, unparsed)
+            files = 1
+
+        shutil.rmtree(table_dir, ignore_errors=True)
+        os.replace(temp_dir, table_dir)
+        return table_name, written, files, unparsed, orphaned
+    finally:
+        conn.close()
+
+
+def export_db_to_parquet(database_name, output_dir=OUTPUT_FOLDER, workers=EXPORT_WORKERS):
+    """
+    Exports each table, plus the denormalized comment fact table, to Parquet
+    for the Power BI refresh. Row groups are streamed from the database, so
+    memory stays bounded regardless of table size.
+    """
+    if pa is None:
+        print("Parquet export needs the 'pyarrow' package (pip install pyarrow).")
+        return
+
+    conn = None
+    try:
+        conn = sqlite3.connect(f"file:{database_name}?mode=ro", uri=True)
+        tables = exported_tables(conn)
+        conn.close()
+        conn = None
+
+        os.makedirs(output_dir, exist_ok=True)
+        started = time.perf_counter()
+        total_rows = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # The fact table is the largest, so it is started first.
+            futures = [pool.submit(export_table, database_name, table_name, output_dir)
+                       for table_name in [FACT_TABLE] + tables]
+            for future in futures:
+                table_name, written, files, unparsed, orphaned = future.result()
+                total_rows += written
+                print(f"Exported {written} rows of '{table_name}' to {files} Parquet file(s) in '{os.path.join(output_dir, table_name)}'.")
+                if orphaned:
+                    print(f"  - Warning: {orphaned} row(s) of '{table_name}' have no existing draft; they are in {ORPHAN_PARTITION}.parquet.")
+                for column, count in unparsed.items():
+                    print(f"  - Warning: {count} value(s) of '{table_name}.{column}' are not timestamps and were exported as null.")
+
+        elapsed = time.perf_counter() - started
+        print(f"Export complete: {total_rows} rows in {elapsed:.1f}s.")
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+    except IOError as e:
+        print(f"File I/O error: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the database to Parquet for the Power BI refresh.")
+    parser.add_argument("--db", default=DATABASE_FILE, help="Database file to export.")
+    parser.add_argument("--out", default=OUTPUT_FOLDER, help="Folder to write the Parquet tables to.")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="Tables exported in parallel.")
+    args = parser.parse_args()
+
+    # Check if the database file exists before trying to export
+    if os.path.exists(args.db):
+        export_db_to_parquet(args.db, args.out, args.workers)
+    else:
+        print(f"Error: Database file '{args.db}' not found.")
@@ -1,14 +1,37 @@
 import sqlite3
 import os
 import re
-from transformers import pipeline
+import argparse
+import multiprocessing
 from tqdm import tqdm
-import torch
+from db_streaming import iter_keyset_chunks, CheckpointedWriter
+from inference_cache import InferenceCache
+from database_setup import migrate_schema, bump_comment_drafts, PENDING_COMMENTS_FILTER, BUSY_TIMEOUT_SECONDS
+from inference_service import load_pipeline, default_device
+from near_duplicates import fan_out_to_members
 
 # --- Configuration ---
 DATABASE_FILE = "econsultation.db"
 # Reverting to the model that worked best for true summarization
 SUMMARIZER_MODEL_NAME = "facebook/bart-large-cnn"
+# Pin this to a commit hash to make cached results tied to an exact model version.
+SUMMARIZER_MODEL_REVISION = "main"
+SUMMARY_PARAMS = {"max_length": 80, "min_length": 15, "do_sample": False}
+# Process-pool settings. With NUM_WORKERS > 1 each worker loads its own copy of
+# the summarizer and pulls comment_id ranges of ID_RANGE_SIZE pending comments
+# from a shared queue. Keep NUM_WORKERS x THREADS_PER_WORKER <= physical cores.
+NUM_WORKERS = 1
+THREADS_PER_WORKER = 1
+ID_RANGE_SIZE = 50
+
+# Near-duplicates (see near_duplicates.py) are not summarized themselves; they
+# get their cluster's canonical summary afterwards.
+WORKLIST_FILTER = f"{PENDING_COMMENTS_FILTER} AND (c.cluster_id IS NULL OR c.cluster_id = c.comment_id)"
+
+# Per-process state for pool workers, set once by init_summary_worker.
+_worker_summarizer = None
+_worker_conn = None
+_worker_cache = None
 
 def clean_summary(raw_text):
     """
@@ -33,80 +56,162 @@ def clean_summary(raw_text):
     return cleaned_text.strip().lstrip(':"\' ').capitalize()
 
 
-def generate_individual_summaries_bart_final():
+def summarize_comment(summarizer, comment_row, cache=None):
+    """
+    Summarizes a single comment row and returns the (ai_summary, comment_id)
+    update tuple, falling back to the error marker if the model fails.
+    The raw model output is looked up in / stored to 'cache' when one is given.
+    """
+    comment_id = comment_row['comment_id']
+    try:
+        # A simple, direct prompt that has proven to work well with this model
+        prompt = (
+            f"Summarize the following user comment regarding the law section '{comment_row['section_title']}':\n\n"
+            f"\"{comment_row['comment_text']}\""
+        )
+
+        def run_model():
+            return summarizer(prompt, **SUMMARY_PARAMS)[0]['summary_text']
+
+        raw_summary = cache.get_or_compute(prompt, SUMMARY_PARAMS, run_model) if cache else run_model()
+        
+        # Use our powerful function to clean the output perfectly
+        return (clean_summary(raw_summary), comment_id)
+    
+    except Exception as e:
+        print(f"\nCould not process comment_id {comment_id}. Error: {e}")
+        return ('Error generating summary.', comment_id)
+
+
+def fan_out_summaries(conn):
+    """Copies each canonical comment's summary to its near-duplicates still missing one."""
+    copied = fan_out_to_members(
+        conn, ["ai_summary"],
+        "comments.ai_summary IS NULL OR comments.ai_summary = 'Error generating summary.'",
+        "canonical.ai_summary IS NOT NULL AND canonical.ai_summary != 'Error generating summary.'"
+    )
+    if copied:
+        bump_comment_drafts(conn, copied)
+        print(f"Copied summaries to {len(copied)} near-duplicate comments.")
+
+
+def build_pending_id_ranges(conn, range_size=ID_RANGE_SIZE):
+    """
+    Splits the pending worklist into disjoint, inclusive (first_id, last_id)
+    comment_id ranges of at most 'range_size' pending comments each.
+    """
+    id_ranges = []
+    select_query = f"SELECT c.comment_id {WORKLIST_FILTER}"
+    for chunk in iter_keyset_chunks(conn, select_query, key_column="c.comment_id"):
+        ids = [row[0] for row in chunk]
+        for i in range(0, len(ids), range_size):
+            id_ranges.append((ids[i], ids[min(i + range_size, len(ids)) - 1]))
+    return id_ranges
+
+
+def init_summary_worker(threads_per_worker, device):
+    """
+    Pool initializer: pins torch intra-op threads and loads the summarizer on
+    'device' and a read-only database connection once per worker process.
+    """
+    global _worker_summarizer, _worker_conn, _worker_cache
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    # With the inference server running, workers are clients whose requests
+    # the server micro-batches together.
+    _worker_summarizer = load_pipeline("summarization", SUMMARIZER_MODEL_NAME, SUMMARIZER_MODEL_REVISION, device)
+    _worker_conn = sqlite3.connect(f"file:{DATABASE_FILE}?mode=ro", uri=True)
+    _worker_conn.row_factory = sqlite3.Row
+    _worker_cache = InferenceCache(SUMMARIZER_MODEL_NAME, "summarization", SUMMARIZER_MODEL_REVISION,
+                                   pipeline=_worker_summarizer)
+
+
+def summarize_id_range(id_range):
+    """
+    Pool task: summarizes every pending comment in one comment_id range and
+    returns the update tuples for the writer process, plus this task's cache
+    hit and miss counts.
+    """
+    first_id, last_id = id_range
+    hits, misses = _worker_cache.hits, _worker_cache.misses
+    rows = _worker_conn.execute(
+        f"SELECT c.comment_id, c.comment_text, s.section_title {WORKLIST_FILTER} "
+        "AND c.comment_id BETWEEN ? AND ?",
+        (first_id, last_id)
+    ).fetchall()
+    updates = [summarize_comment(_worker_summarizer, row, _worker_cache) for row in rows]
+    return updates, _worker_cache.hits - hits, _worker_cache.misses - misses
+
+
+def generate_individual_summaries_bart_final(num_workers=NUM_WORKERS, threads_per_worker=THREADS_PER_WORKER):
     """
     (FINAL, BART-BASED): Uses the robust Bart-large-cnn model combined with
     a direct prompt and a powerful post-processing function to guarantee clean,
-    high-quality summaries.
+    high-quality summaries. With num_workers > 1 the comments are spread over a
+    process pool while this process remains the single database writer.
     """
-    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    device = default_device()
     print(f"Using device: {device}")
 
     conn = None
+    cache = None
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
+        conn = sqlite3.connect(DATABASE_FILE, timeout=BUSY_TIMEOUT_SECONDS)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         print("Successfully connected to the database.")
+        # Makes sure the worklist index exists on databases created before it.
+        migrate_schema(conn)
         
-        # This query now correctly identifies unprocessed comments based on the schema
-        query = """
-            SELECT c.comment_id, c.comment_text, s.section_title
-            FROM comments c
-            JOIN sections s ON c.section_id = s.section_id
-            WHERE 
-                (c.ai_summary IS NULL OR c.ai_summary = 'Error generating summary.') AND
-                (c.comment_text IS NOT NULL AND LENGTH(c.comment_text) > 20)
-        """
-        cursor.execute(query)
-        comments_to_process = cursor.fetchall()
+        pending_count = cursor.execute(f"SELECT COUNT(*) {WORKLIST_FILTER}").fetchone()[0]
         
-        if not comments_to_process:
+        if not pending_count:
+            fan_out_summaries(conn)
             print("No new comments to summarize.")
             return
 
-        print(f"Found {len(comments_to_process)} comments to re-process with the Bart model.")
+        print(f"Found {pending_count} comments to re-process with the Bart model.")
 
-        print(f"Loading summarization model: '{SUMMARIZER_MODEL_NAME}'... (This may take a moment)")
-        summarizer = pipeline("summarization", model=SUMMARIZER_MODEL_NAME, device=device)
-        print("Model loaded successfully.")
-        
-        updates_to_make = []
-        print("\nStarting final summarization run with robust post-processing.")
-        
-        for comment_row in tqdm(comments_to_process, desc="Summarizing Comments"):
-            try:
-                comment_id = comment_row['comment_id']
-                
-                # A simple, direct prompt that has proven to work well with this model
-                prompt = (
-                    f"Summarize the following user comment regarding the law section '{comment_row['section_title']}':\n\n"
-                    f"\"{comment_row['comment_text']}\""
-                )
-
-                summary_result = summarizer(
-                    prompt, max_length=80, min_length=15, do_sample=False
-                )
-                
-                raw_summary = summary_result[0]['summary_text']
-                
-                # Use our powerful function to clean the output perfectly
-                clean_summary_text = clean_summary(raw_summary)
-                
-                updates_to_make.append((clean_summary_text, comment_id))
-            
-            except Exception as e:
-                print(f"\nCould not process comment_id {comment_id}. Error: {e}")
-                updates_to_make.append(('Error generating summary.', comment_id))
+        # Comments are read in keyset-paginated chunks and results are committed
+        # periodically, so a crash only loses the work since the last checkpoint.
+        update_query = "UPDATE comments SET ai_summary = ? WHERE comment_id = ?"
+        # Each checkpoint invalidates the API's cached responses for the drafts it
+        # wrote to, so dashboards see new summaries. comment_id is each row's last value.
+        on_commit = lambda rows: bump_comment_drafts(conn, [row[-1] for row in rows])
+        with CheckpointedWriter(conn, update_query, on_commit=on_commit) as writer, tqdm(total=pending_count, desc="Summarizing Comments") as progress:
+            if num_workers > 1:
+                print(f"\nStarting summarization with {num_workers} worker processes x {threads_per_worker} threads.")
+                id_ranges = build_pending_id_ranges(conn)
+                ctx = multiprocessing.get_context("spawn")
+                with ctx.Pool(num_workers, initializer=init_summary_worker, initargs=(threads_per_worker, device)) as pool:
+                    # This process is the only writer; workers just stream results back.
+                    cache = InferenceCache(SUMMARIZER_MODEL_NAME, "summarization", SUMMARIZER_MODEL_REVISION)
+                    for updates, hits, misses in pool.imap_unordered(summarize_id_range, id_ranges):
+                        writer.add(updates)
+                        cache.hits += hits
+                        cache.misses += misses
+                        progress.update(len(updates))
+            else:
+                print(f"Loading summarization model: '{SUMMARIZER_MODEL_NAME}'... (This may take a moment)")
+                summarizer = load_pipeline("summarization", SUMMARIZER_MODEL_NAME, SUMMARIZER_MODEL_REVISION, device)
+                print("Model loaded successfully.")
+                cache = InferenceCache(SUMMARIZER_MODEL_NAME, "summarization", SUMMARIZER_MODEL_REVISION,
+                                       pipeline=summarizer)
+
+                print("\nStarting final summarization run with robust post-processing.")
+                select_query = f"SELECT c.comment_id, c.comment_text, s.section_title {WORKLIST_FILTER}"
+                for chunk in iter_keyset_chunks(conn, select_query, key_column="c.comment_id"):
+                    for comment_row in chunk:
+                        writer.add([summarize_comment(summarizer, comment_row, cache)])
+                        progress.update(1)
 
-        if updates_to_make:
-            print("\nSummarization complete. Updating the database with final, clean results...")
-            update_query = "UPDATE comments SET ai_summary = ? WHERE comment_id = ?"
-            cursor.executemany(update_query, updates_to_make)
-            conn.commit()
-            print(f"Successfully updated {len(updates_to_make)} records.")
+        print(f"\nSummarization complete. Successfully updated {writer.written} records.")
+        fan_out_summaries(conn)
+        cache.report()
 
     finally:
+        if cache:
+            cache.close()
         if conn:
             conn.close()
             print("\nIndividual summary generation is complete.")
@@ -114,4 +219,8 @@ def generate_individual_summaries_bart_final():
 if __name__ == '__main__':
     # Use your db_manager.py script to clear all old, bad summaries first.
     # python db_manager.py --reset-summaries
-    generate_individual_summaries_bart_final()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate per-comment AI summaries.")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Number of summarizer processes.")
+    parser.add_argument("--threads-per-worker", type=int, default=THREADS_PER_WORKER, help="Torch intra-op threads per worker.")
+    args = parser.parse_args()
+    generate_individual_summaries_bart_final(args.workers, args.threads_per_worker)
\ No newline at end of file
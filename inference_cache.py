@@ -0,0 +1,180 @@
+import sqlite3
+import os
+import json
+import time
+import hashlib
+import unicodedata
+import inference_service
+
+# --- Configuration ---
+CACHE_FILE = "inference_cache.db"
+# Upper bound on cached results across all models; least recently used entries go first.
+MAX_CACHE_ENTRIES = 1_000_000
+# Eviction is checked after this many new entries rather than on every write.
+EVICTION_CHECK_INTERVAL = 1000
+# SQLite's default limit on bound parameters is 999 on older builds.
+LOOKUP_CHUNK_SIZE = 500
+
+CREATE_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS inference_cache (
+    cache_key TEXT PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    task TEXT NOT NULL,
+    result TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+"""
+
+CREATE_CACHE_INDEX = "CREATE INDEX IF NOT EXISTS idx_inference_cache_last_used ON inference_cache(last_used);"
+
+
+def normalize_text(text):
+    """
+    Normalizes text before hashing so that whitespace and unicode-form
+    differences don't produce separate cache entries.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class InferenceCache:
+    """
+    Persistent cache of model outputs, keyed on (model name, model revision,
+    task, generation params, normalized text hash, and the inference backend
+    unless it is PyTorch). All model stages share one
+    SQLite file; each stage creates its own InferenceCache for its model/task.
+    Pass the 'pipeline' that produces the outputs (or set it once loaded), so
+    they are keyed on the backend that actually ran them.
+    """
+
+    def __init__(self, model_name, task, model_revision="main", path=CACHE_FILE, max_entries=MAX_CACHE_ENTRIES,
+                 pipeline=None, backend=None):
+        self.model_name = model_name
+        self.task = task
+        self.model_revision = model_revision
+        self.pipeline = pipeline
+        self._backend = backend
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_eviction = 0
+        # A generous timeout lets several worker processes share the cache file.
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode = WAL;")
+        self.conn.execute(CREATE_CACHE_TABLE)
+        self.conn.execute(CREATE_CACHE_INDEX)
+        self.conn.commit()
+
+    @property
+    def backend(self):
+        """
+        ONNX and int8 outputs differ slightly from PyTorch's, so they are cached
+        apart. The pipeline's backend wins: an ONNX model can fall back to
+        PyTorch, and the daemon may run another backend than this process.
+        """
+        if self.pipeline is not None:
+            return inference_service.pipeline_backend(self.pipeline)
+        if self._backend is None:
+            self._backend = inference_service.active_backend()
+        return self._backend
+
+    def key_for(self, text, params=None):
+        text_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        identity = [self.model_name, self.model_revision, self.task, params or {}, text_hash]
+        if self.backend != "pytorch":
+            # PyTorch keys keep their original form, so existing entries stay valid.
+            identity.append(self.backend)
+        identity = json.dumps(identity, sort_keys=True, default=str)
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def get_many(self, texts, params=None):
+        """
+        Looks up a list of texts and returns {text: result} for the ones found.
+        Hits are marked as recently used.
+        """
+        keys = {self.key_for(text, params): text for text in texts}
+        found = {}
+        key_list = list(keys)
+        for i in range(0, len(key_list), LOOKUP_CHUNK_SIZE):
+            chunk = key_list[i:i + LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT cache_key, result FROM inference_cache WHERE cache_key IN ({placeholders})", chunk
+            ).fetchall()
+            for cache_key, result in rows:
+                found[cache_key] = json.loads(result)
+
+        if found:
+            now = time.time()
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE inference_cache SET last_used = ? WHERE cache_key = ?",
+                    [(now, cache_key) for cache_key in found]
+                )
+
+        unique_texts = set(keys.values())
+        self.hits += len(found)
+        self.misses += len(unique_texts) - len(found)
+        return {keys[cache_key]: result for cache_key, result in found.items()}
+
+    def get(self, text, params=None):
+        return self.get_many([text], params).get(text)
+
+    def put_many(self, items, params=None):
+        """Stores a list of (text, result) pairs; results must be JSON-serializable."""
+        if not items:
+            return
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO inference_cache (cache_key, model_name, task, result, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(self.key_for(text, params), self.model_name, self.task, json.dumps(result), now) for text, result in items]
+            )
+        self._writes_since_eviction += len(items)
+        if self._writes_since_eviction >= EVICTION_CHECK_INTERVAL:
+            self.evict()
+
+    def put(self, text, result, params=None):
+        self.put_many([(text, result)], params)
+
+    def get_or_compute(self, text, params, compute):
+        """Returns the cached result for 'text', calling compute() and storing its result on a miss."""
+        result = self.get(text, params)
+        if result is None:
+            result = compute()
+            self.put(text, result, params)
+        return result
+
+    def evict(self):
+        """Drops the least recently used entries until the cache is within max_entries."""
+        self._writes_since_eviction = 0
+        total = self.conn.execute("SELECT COUNT(*) FROM inference_cache").fetchone()[0]
+        excess = total - self.max_entries
+        if excess > 0:
+            with self.conn:
+                self.conn.execute("""
+                    DELETE FROM inference_cache WHERE cache_key IN (
+                        SELECT cache_key FROM inference_cache ORDER BY last_used LIMIT ?
+                    )
+                """, (excess,))
+        return max(excess, 0)
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / lookups if lookups else 0.0
+        print(f"Inference cache [{self.model_name} / {self.task}]: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate).")
+
+    def close(self):
+        self.evict()
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    # Prints what is currently cached, per model and task.
+    if not os.path.exists(CACHE_FILE):
+        print(f"No inference cache found at '{CACHE_FILE}'.")
+    else:
+        conn = sqlite3.connect(CACHE_FILE)
+        rows = conn.execute("SELECT model_name, task, COUNT(*) FROM inference_cache GROUP BY model_name, task").fetchall()
+        for model_name, task, count in rows:
+            print(f"- {model_name} / {task}: {count} entries")
+        conn.close()
@@ -0,0 +1,418 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- Configuration ---
+# The daemon only listens on localhost; the analysis scripts are its only clients.
+HOST = "127.0.0.1"
+PORT = 8765
+INFERENCE_SERVER_URL = f"http://{HOST}:{PORT}"
+# Set to False to always load models in-process, as before the daemon existed.
+USE_INFERENCE_SERVER = True
+# How long a client waits for the daemon to answer a health check before it
+# falls back to loading the model itself, and for a single inference request.
+CONNECT_TIMEOUT_SECONDS = 0.5
+REQUEST_TIMEOUT_SECONDS = 600
+# Micro-batching: after the first queued request the daemon waits up to
+# MICRO_BATCH_WAIT_MS for more, then runs up to MAX_MICRO_BATCH texts through
+# the model in one pipeline call.
+MAX_MICRO_BATCH = 32
+MICRO_BATCH_WAIT_MS = 10
+# Request latencies kept per model for the percentiles in /health.
+LATENCY_WINDOW = 1000
+# How models run on the CPU: 'pytorch' (stock transformers pipelines), 'onnx'
+# (exported to ONNX and run by ONNX Runtime) or 'onnx-int8' (the same, with
+# dynamically quantized int8 weights). See onnx_backend.py. The
+# INFERENCE_BACKEND environment variable overrides it for one run, and pipeline
+# stages inherit it. GPU devices always use PyTorch.
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "pytorch")
+
+
+def default_device():
+    """The device the scripts used before: the first GPU if there is one, else the CPU."""
+    import torch
+    return "cuda:0" if torch.cuda.is_available() else "cpu"
+
+
+def load_local_pipeline(task, model, revision, device=None, backend=None, **init_kwargs):
+    """
+    Loads a pipeline in this process on 'backend' (INFERENCE_BACKEND by
+    default). transformers is imported only here and in onnx_backend.py. An
+    ONNX backend that is not installed, or whose model fails its parity check,
+    falls back to PyTorch.
+    """
+    backend = backend or INFERENCE_BACKEND
+    if backend != "pytorch" and str(device or "cpu") in ("cpu", "-1"):
+        from onnx_backend import load_verified_pipeline
+        onnx_pipeline = load_verified_pipeline(task, model, revision, backend, **init_kwargs)
+        if onnx_pipeline is not None:
+            onnx_pipeline.inference_backend = backend
+            return onnx_pipeline
+    from transformers import pipeline
+    if device is not None:
+        init_kwargs["device"] = device
+    local_pipeline = pipeline(task, model=model, revision=revision, **init_kwargs)
+    # Also when an ONNX backend fell back: the cache keys outputs on what actually ran.
+    local_pipeline.inference_backend = "pytorch"
+    return local_pipeline
+
+
+def pipeline_backend(pipeline):
+    """The backend that produces a pipeline's outputs ('pytorch', 'onnx' or 'onnx-int8')."""
+    return getattr(pipeline, "inference_backend", "pytorch")
+
+
+def model_key(task, model, revision, init_kwargs):
+    """Identifies one loaded pipeline on the daemon."""
+    return json.dumps([task, model, revision, init_kwargs], sort_keys=True)
+
+
+# --- Daemon ---
+
+class InferenceRequest:
+    """One client request waiting in a model's queue."""
+
+    def __init__(self, inputs, params):
+        self.inputs = inputs
+        self.params = params
+        self.params_key = json.dumps(params, sort_keys=True)
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.outputs = None
+        self.error = None
+
+
+class ModelWorker:
+    """
+    Owns one pipeline on the daemon. The model is loaded on the first request;
+    requests are queued and a single thread runs them in micro-batches, merging
+    requests that use the same generation params into one pipeline call.
+    """
+
+    def __init__(self, task, model, revision, init_kwargs, device):
+        self.task = task
+        self.model = model
+        self.revision = revision
+        self.init_kwargs = init_kwargs
+        self.device = device
+        self.pipeline = None
+        self.load_seconds = None
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, inputs, params):
+        request = InferenceRequest(inputs, params)
+        self.queue.put(request)
+        request.done.wait()
+        if request.error:
+            raise RuntimeError(request.error)
+        return request.outputs
+
+    def _load(self):
+        if self.pipeline is None:
+            print(f"Loading {self.task} model '{self.model}' ({self.revision})...")
+            started = time.perf_counter()
+            self.pipeline = load_local_pipeline(self.task, self.model, self.revision, self.device, **self.init_kwargs)
+            self.load_seconds = time.perf_counter() - started
+            print(f"Loaded '{self.model}' in {self.load_seconds:.1f}s.")
+
+    def _collect(self):
+        """Blocks for one request, then gathers more until the batch is full or the wait is over."""
+        batch = [self.queue.get()]
+        size = len(batch[0].inputs)
+        deadline = time.perf_counter() + MICRO_BATCH_WAIT_MS / 1000
+        while size < MAX_MICRO_BATCH:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.inputs)
+        return batch
+
+    def _run_group(self, group):
+        texts = [text for request in group for text in request.inputs]
+        outputs = self.pipeline(texts, batch_size=min(len(texts), MAX_MICRO_BATCH), **group[0].params)
+        position = 0
+        for request in group:
+            request.outputs = outputs[position:position + len(request.inputs)]
+            position += len(request.inputs)
+        with self.lock:
+            self.batches += 1
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.params_key, []).append(request)
+            for group in groups.values():
+                try:
+                    self._load()
+                except Exception as e:
+                    for request in group:
+                        request.error = f"Could not load '{self.model}': {e}"
+                else:
+                    try:
+                        self._run_group(group)
+                    except Exception:
+                        # Retry one by one so a single bad input only fails its own request.
+                        for request in group:
+                            try:
+                                self._run_group([request])
+                            except Exception as request_error:
+                                request.error = f"{type(request_error).__name__}: {request_error}"
+                finally:
+                    now = time.perf_counter()
+                    with self.lock:
+                        for request in group:
+                            self.requests += 1
+                            self.texts += len(request.inputs)
+                            self.errors += request.error is not None
+                            self.latencies.append(now - request.enqueued)
+                    for request in group:
+                        request.done.set()
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            percentile = lambda p: round(latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000, 2) if latencies else None
+            return {
+                "task": self.task,
+                "model": self.model,
+                "revision": self.revision,
+                "loaded": self.pipeline is not None,
+                "backend": pipeline_backend(self.pipeline) if self.pipeline is not None else None,
+                "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+                "queued": self.queue.qsize(),
+                "requests": self.requests,
+                "texts": self.texts,
+                "batches": self.batches,
+                "mean_batch_texts": round(self.texts / self.batches, 2) if self.batches else None,
+                "errors": self.errors,
+                "latency_p50_ms": percentile(0.50),
+                "latency_p95_ms": percentile(0.95),
+            }
+
+
+class InferenceServer(ThreadingHTTPServer):
+    """Holds one ModelWorker per (task, model, revision, pipeline kwargs)."""
+
+    daemon_threads = True
+
+    def __init__(self, address, device):
+        super().__init__(address, InferenceRequestHandler)
+        self.device = device
+        self.started = time.time()
+        self.workers = {}
+        self.workers_lock = threading.Lock()
+
+    def get_worker(self, task, model, revision, init_kwargs):
+        key = model_key(task, model, revision, init_kwargs)
+        with self.workers_lock:
+            if key not in self.workers:
+                self.workers[key] = ModelWorker(task, model, revision, init_kwargs, self.device)
+            return self.workers[key]
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health  -> uptime plus per-model queue, batch and latency stats
+    POST /infer   -> {"task", "model", "revision", "init_kwargs", "inputs", "params"}
+                     answered with {"outputs": [...]} (one output per input)
+    """
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=float).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "Unknown path"})
+            return
+        with self.server.workers_lock:
+            workers = list(self.server.workers.values())
+        self._send_json(200, {
+            "status": "ok",
+            "pid": os.getpid(),
+            "device": self.server.device,
+            "backend": INFERENCE_BACKEND,
+            "uptime_seconds": round(time.time() - self.server.started, 1),
+            "models": [worker.stats() for worker in workers],
+        })
+
+    def do_POST(self):
+        if self.path != "/infer":
+            self._send_json(404, {"error": "Unknown path"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            worker = self.server.get_worker(
+                request["task"], request["model"], request["revision"], request.get("init_kwargs", {})
+            )
+            outputs = worker.submit(request["inputs"], request.get("params", {}))
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": f"Bad request: {e}"})
+            return
+        except RuntimeError as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {"outputs": outputs, "backend": pipeline_backend(worker.pipeline)})
+
+    def log_message(self, format, *args):
+        # Per-request access logs would drown the model loading messages.
+        pass
+
+
+# --- Client ---
+
+def server_health(url=None, timeout=CONNECT_TIMEOUT_SECONDS):
+    """Returns the daemon's /health document, or None if it isn't running."""
+    url = url or INFERENCE_SERVER_URL
+    try:
+        with urllib.request.urlopen(f"{url}/health", timeout=timeout) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError):
+        return None
+
+
+class RemotePipeline:
+    """
+    Stands in for a transformers pipeline by sending calls to the daemon.
+    Accepts a string or a list of strings, like the pipelines it replaces, and
+    returns one output per input. The tokenizer (used for batching and chunk
+    packing) is loaded locally on first use; it is small next to the model.
+    If the daemon goes away mid-run, the model is loaded in-process instead.
+    'backend' is the daemon's; each response reports the one the model ran on.
+    """
+
+    def __init__(self, url, task, model, revision, device=None, backend="pytorch", **init_kwargs):
+        self.url = url
+        self.task = task
+        self.model = model
+        self.revision = revision
+        self.device = device
+        self.init_kwargs = init_kwargs
+        self._backend = backend
+        self._tokenizer = None
+        self._local = None
+
+    @property
+    def inference_backend(self):
+        return pipeline_backend(self._local) if self._local is not None else self._backend
+
+    @property
+    def tokenizer(self):
+        if self._local is not None:
+            return self._local.tokenizer
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model, revision=self.revision)
+        return self._tokenizer
+
+    def __call__(self, inputs, **params):
+        if self._local is not None:
+            return self._local(inputs, **params)
+        # The daemon sizes its own batches.
+        params.pop("batch_size", None)
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        payload = json.dumps({
+            "task": self.task, "model": self.model, "revision": self.revision,
+            "init_kwargs": self.init_kwargs, "inputs": texts, "params": params,
+        }).encode("utf-8")
+        request = urllib.request.Request(
+            f"{self.url}/infer", data=payload, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+                result = json.loads(response.read())
+            self._backend = result.get("backend", self._backend)
+            return result["outputs"]
+        except urllib.error.HTTPError as e:
+            # The daemon is up but the model failed on these inputs.
+            raise RuntimeError(json.loads(e.read()).get("error", str(e)))
+        except OSError as e:
+            print(f"\nInference server unreachable ({e}); loading '{self.model}' in-process.")
+            self._local = load_local_pipeline(self.task, self.model, self.revision, self.device, **self.init_kwargs)
+            return self._local(inputs, **params)
+
+
+def load_pipeline(task, model, revision, device=None, **init_kwargs):
+    """
+    Returns a pipeline for the analysis scripts: a thin client of the inference
+    daemon when one is running, otherwise the model loaded in this process.
+    """
+    health = server_health() if USE_INFERENCE_SERVER else None
+    if health is not None:
+        print(f"Using the inference server at {INFERENCE_SERVER_URL} for '{model}'.")
+        return RemotePipeline(INFERENCE_SERVER_URL, task, model, revision, device,
+                              health.get("backend", "pytorch"), **init_kwargs)
+    return load_local_pipeline(task, model, revision, device, **init_kwargs)
+
+
+def active_backend():
+    """The backend load_pipeline would use: the daemon's when it is running, else INFERENCE_BACKEND."""
+    health = server_health() if USE_INFERENCE_SERVER else None
+    return health.get("backend", "pytorch") if health is not None else INFERENCE_BACKEND
+
+
+def analysis_models():
+    """(task, model, revision, pipeline kwargs) of every model the analysis scripts use."""
+    from analyze_sentiments import MODEL_NAME, MODEL_REVISION, CASCADE_MODEL_NAME, CASCADE_MODEL_REVISION
+    from executive_summarization import (
+        SUMMARIZER_MODEL_NAME, SUMMARIZER_MODEL_REVISION, KEY_POINTS_MODEL_NAME, KEY_POINTS_MODEL_REVISION
+    )
+    return [
+        ("sentiment-analysis", MODEL_NAME, MODEL_REVISION, {"top_k": None}),
+        ("sentiment-analysis", CASCADE_MODEL_NAME, CASCADE_MODEL_REVISION, {"top_k": None}),
+        ("summarization", SUMMARIZER_MODEL_NAME, SUMMARIZER_MODEL_REVISION, {}),
+        ("text2text-generation", KEY_POINTS_MODEL_NAME, KEY_POINTS_MODEL_REVISION, {}),
+    ]
+
+
+def preload_models(server):
+    """Warms the models used by the analysis scripts so the first run doesn't wait for them."""
+    for task, model, revision, init_kwargs in analysis_models():
+        server.get_worker(task, model, revision, init_kwargs)._load()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Keep the analysis models loaded and serve them on localhost.")
+    parser.add_argument("--port", type=int, default=PORT, help="Port to listen on.")
+    parser.add_argument("--preload", action="store_true", help="Load the sentiment, summary and key point models at startup.")
+    parser.add_argument("--backend", choices=["pytorch", "onnx", "onnx-int8"], default=INFERENCE_BACKEND,
+                        help="How the models run on the CPU (see onnx_backend.py).")
+    args = parser.parse_args()
+    INFERENCE_BACKEND = args.backend
+
+    server = InferenceServer((HOST, args.port), default_device())
+    print(f"Inference server listening on http://{HOST}:{args.port} (device: {server.device}, backend: {INFERENCE_BACKEND})")
+    if args.preload:
+        preload_models(server)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down the inference server.")
+        server.server_close()
+        sys.exit(0)
@@ -0,0 +1,220 @@
+import sqlite3
+import time
+import argparse
+import numpy as np
+from db_streaming import iter_keyset_chunks
+from inference_cache import normalize_text
+from database_setup import migrate_schema, bump_draft_generations, BUSY_TIMEOUT_SECONDS
+
+# --- Configuration ---
+DATABASE_FILE = "econsultation.db"
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Pin this to a commit hash so clusters are tied to an exact model version.
+EMBEDDING_MODEL_REVISION = "main"
+EMBEDDING_BATCH_SIZE = 64
+# Cosine similarity at or above which two comments of a section are treated as
+# the same comment. Campaign copies that only differ in a greeting or a
+# signature score well above this; genuinely different comments on the same
+# topic score well below.
+SIMILARITY_THRESHOLD = 0.95
+# Canonical embeddings compared per matrix product in the blocked search, which
+# bounds the similarity matrix to chunk size x SEARCH_BLOCK_ROWS floats.
+SEARCH_BLOCK_ROWS = 8192
+# Clusters of at least this many comments are reported as campaigns.
+MIN_CAMPAIGN_SIZE = 3
+
+PENDING_SECTIONS_QUERY = """
+    SELECT DISTINCT section_id FROM comments
+    WHERE cluster_id IS NULL AND comment_text IS NOT NULL AND comment_text != ''
+"""
+PENDING_CLUSTER_QUERY = """
+    SELECT comment_id, comment_text FROM comments
+    WHERE section_id = ? AND cluster_id IS NULL AND comment_text IS NOT NULL AND comment_text != ''
+"""
+
+_model = None
+
+
+def get_model():
+    """Loads the sentence embedding model on first use."""
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        from inference_service import default_device
+        _model = SentenceTransformer(EMBEDDING_MODEL_NAME, revision=EMBEDDING_MODEL_REVISION, device=default_device())
+    return _model
+
+
+def embed_texts(texts):
+    """
+    Unit-length float32 embeddings for 'texts'. Texts identical after
+    normalization are embedded once.
+    """
+    normalized = [normalize_text(text) for text in texts]
+    unique = list(dict.fromkeys(normalized))
+    vectors = get_model().encode(unique, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True, convert_to_numpy=True)
+    position = {text: i for i, text in enumerate(unique)}
+    return np.asarray(vectors, dtype=np.float32)[[position[text] for text in normalized]]
+
+
+class CanonicalIndex:
+    """
+    The canonical comments of one section and their embeddings, searched with a
+    blocked exact cosine search (embeddings are unit length, so cosine
+    similarity is a dot product).
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.blocks = []
+        self.tail = []
+
+    @classmethod
+    def load(cls, conn, section_id):
+        index = cls()
+        rows = conn.execute("""
+            SELECT e.comment_id, e.embedding FROM comment_embeddings e
+            JOIN comments c ON c.comment_id = e.comment_id
+            WHERE c.section_id = ?
+            ORDER BY e.comment_id
+        """, (section_id,))
+        for comment_id, blob in rows:
+            index.add(comment_id, np.frombuffer(blob, dtype=np.float16).astype(np.float32))
+        return index
+
+    def add(self, comment_id, vector):
+        self.ids.append(comment_id)
+        self.tail.append(vector)
+        if len(self.tail) == SEARCH_BLOCK_ROWS:
+            self.blocks.append(np.vstack(self.tail))
+            self.tail = []
+
+    def best_matches(self, vectors):
+        """For each row of 'vectors': (best canonical comment_id or None, its similarity)."""
+        best_ids = [None] * len(vectors)
+        best_scores = np.full(len(vectors), -1.0, dtype=np.float32)
+        blocks = self.blocks + ([np.vstack(self.tail)] if self.tail else [])
+        offset = 0
+        for block in blocks:
+            scores = vectors @ block.T
+            columns = scores.argmax(axis=1)
+            block_best = scores[np.arange(len(vectors)), columns]
+            for row in np.nonzero(block_best > best_scores)[0]:
+                best_ids[row] = self.ids[offset + columns[row]]
+            best_scores = np.maximum(best_scores, block_best)
+            offset += len(block)
+        return best_ids, best_scores
+
+
+def cluster_chunk(index, chunk, threshold=SIMILARITY_THRESHOLD):
+    """
+    Assigns each (comment_id, text) in 'chunk' to the most similar canonical of
+    its section, or makes it a new canonical. Returns the (cluster_id,
+    comment_id) updates and the (comment_id, embedding) rows of new canonicals.
+    """
+    vectors = embed_texts([text for _, text in chunk])
+    best_ids, best_scores = index.best_matches(vectors)
+    updates, new_canonicals = [], []
+    new_rows = []  # positions in 'chunk' of the canonicals created by this chunk
+    for position, (comment_id, _) in enumerate(chunk):
+        cluster_id = best_ids[position] if best_scores[position] >= threshold else None
+        if cluster_id is None and new_rows:
+            # Duplicates inside the chunk match canonicals the index has not seen yet.
+            scores = vectors[new_rows] @ vectors[position]
+            if scores.max() >= threshold:
+                cluster_id = chunk[new_rows[int(scores.argmax())]][0]
+        if cluster_id is None:
+            cluster_id = comment_id
+            new_rows.append(position)
+            new_canonicals.append((comment_id, vectors[position].astype(np.float16).tobytes()))
+        updates.append((cluster_id, comment_id))
+    for position in new_rows:
+        index.add(chunk[position][0], vectors[position])
+    return updates, new_canonicals
+
+
+def cluster_comments(conn, threshold=SIMILARITY_THRESHOLD):
+    """
+    Clusters every comment not yet in a cluster, section by section, against
+    the section's existing canonicals. Commits per chunk. Returns the number of
+    comments clustered.
+    """
+    migrate_schema(conn)
+    section_ids = [row[0] for row in conn.execute(PENDING_SECTIONS_QUERY)]
+    if not section_ids:
+        print("No new comments to cluster.")
+        return 0
+
+    started = time.perf_counter()
+    clustered = canonicals = 0
+    for section_id in section_ids:
+        # Only one section's canonicals are held in memory at a time.
+        index = CanonicalIndex.load(conn, section_id)
+        for chunk in iter_keyset_chunks(conn, PENDING_CLUSTER_QUERY, (section_id,)):
+            updates, new_canonicals = cluster_chunk(index, chunk, threshold)
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO comment_embeddings (comment_id, embedding) VALUES (?, ?)", new_canonicals)
+                conn.executemany("UPDATE comments SET cluster_id = ? WHERE comment_id = ?", updates)
+            clustered += len(updates)
+            canonicals += len(new_canonicals)
+
+    # Campaign sizes are part of the API responses.
+    bump_draft_generations(conn)
+    elapsed = time.perf_counter() - started
+    print(f"Clustered {clustered} comments in {elapsed:.1f}s; {canonicals} new canonical comments "
+          f"({clustered - canonicals} near-duplicates will reuse their canonical's model results).")
+    return clustered
+
+
+def fan_out_to_members(conn, columns, member_pending, canonical_done):
+    """
+    Copies 'columns' from each cluster's canonical comment to the members that
+    still need them. 'member_pending' and 'canonical_done' are SQL conditions
+    on the 'comments' (member) and 'canonical' aliases. Commits and returns the
+    comment_ids of the members updated.
+    """
+    assignments = ", ".join(f"{column} = canonical.{column}" for column in columns)
+    updated = [row[0] for row in conn.execute(f"""
+        UPDATE comments SET {assignments}
+        FROM comments AS canonical
+        WHERE comments.cluster_id = canonical.comment_id AND comments.comment_id != canonical.comment_id
+          AND ({member_pending}) AND ({canonical_done})
+        RETURNING comment_id
+    """).fetchall()]
+    conn.commit()
+    return updated
+
+
+def report_campaigns(conn, limit=10):
+    rows = conn.execute("""
+        SELECT cluster_id, COUNT(*) AS size FROM comments
+        WHERE cluster_id IS NOT NULL
+        GROUP BY cluster_id HAVING COUNT(*) >= ?
+        ORDER BY size DESC LIMIT ?
+    """, (MIN_CAMPAIGN_SIZE, limit)).fetchall()
+    print(f"\nLargest campaigns (clusters of at least {MIN_CAMPAIGN_SIZE} comments):")
+    for cluster_id, size in rows:
+        text = conn.execute("SELECT comment_text FROM comments WHERE comment_id = ?", (cluster_id,)).fetchone()[0]
+        print(f"  {size:>7} x comment {cluster_id}: {text[:80]!r}")
+
+
+def run_near_duplicates(threshold=SIMILARITY_THRESHOLD):
+    """Clusters DATABASE_FILE's new comments; a no-op without sentence-transformers."""
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        print("sentence-transformers is not installed; skipping near-duplicate detection.")
+        return
+    conn = sqlite3.connect(DATABASE_FILE, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        cluster_comments(conn, threshold)
+        report_campaigns(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Group near-duplicate comments so the models run once per cluster.")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD, help="Cosine similarity for a near-duplicate.")
+    args = parser.parse_args()
+    run_near_duplicates(args.threshold)
@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import shutil
+import difflib
+import argparse
+
+try:
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+except ImportError:
+    # The ONNX backends are optional; without these packages the scripts run on PyTorch.
+    ort = None
+
+# --- Configuration ---
+BACKENDS = ["onnx", "onnx-int8"]
+# Exported models, one folder per model, revision and backend.
+MODEL_FOLDER = "onnx_models"
+# ONNX Runtime threads per session. None uses the core allotment pipeline.py
+# gives the stage (OMP_NUM_THREADS), or every core outside the pipeline. One
+# inter-op thread: the graphs run operator after operator, so a second pool
+# would only contend with the first.
+INTRA_OP_THREADS = None
+INTER_OP_THREADS = 1
+# AutoQuantizationConfig preset for the int8 weights: 'avx2', 'avx512',
+# 'avx512_vnni' or 'arm64'. Pick the newest instruction set the nodes have.
+QUANTIZATION_PRESET = "avx512_vnni"
+
+# --- Parity Check ---
+# The fixed sample every exported model is compared against its PyTorch
+# original on. Short and long, positive, negative and neutral on purpose.
+PARITY_TEXTS = [
+    "I fully support this section.",
+    "This clause is unworkable and must be removed.",
+    "Noted.",
+    "The draft should clarify whether the reporting obligations apply to small businesses, "
+    "since the compliance costs described in the impact assessment would fall disproportionately on them.",
+    "We welcome the ministry's effort to strengthen independent oversight, but the proposed timelines "
+    "are unrealistic and the penalties for minor procedural lapses are excessive.",
+    "Please define 'significant data fiduciary' precisely; the current wording leaves too much to discretion.",
+    "The transition period of six months is too short for state governments to set up the new registries.",
+    "Thank you for the consultation. We have no further comments on this section.",
+]
+# Pipeline call params for the check, per task; generation is kept short.
+PARITY_PARAMS = {
+    "sentiment-analysis": {"truncation": True},
+    "summarization": {"max_length": 60, "min_length": 10, "do_sample": False, "truncation": True},
+    "text2text-generation": {"max_length": 64, "truncation": True},
+}
+# What counts as parity: the share of texts with the same top label and the
+# largest difference in any class probability for classifiers, and the mean
+# word-level similarity of generated texts. int8 weights move scores a little.
+PARITY_LIMITS = {
+    "onnx": {"label_agreement": 1.0, "max_score_diff": 0.01, "text_similarity": 0.95},
+    "onnx-int8": {"label_agreement": 0.875, "max_score_diff": 0.1, "text_similarity": 0.7},
+}
+# The first load of an exported model runs the parity check once and keeps the
+# result in this file next to the model; a model that fails runs on PyTorch.
+CHECK_PARITY_ON_FIRST_LOAD = True
+PARITY_FILE = "parity.json"
+
+
+def model_dir(model, revision, backend):
+    return os.path.join(MODEL_FOLDER, model.replace("/", "--"), revision, backend)
+
+
+def ort_model_class(task):
+    return {
+        "sentiment-analysis": ORTModelForSequenceClassification,
+        "summarization": ORTModelForSeq2SeqLM,
+        "text2text-generation": ORTModelForSeq2SeqLM,
+    }[task]
+
+
+def session_options():
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = INTRA_OP_THREADS or int(os.environ.get("OMP_NUM_THREADS", 0)) or os.cpu_count() or 1
+    options.inter_op_num_threads = INTER_OP_THREADS
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+def _publish(temp_dir, target_dir):
+    """Moves a finished export into place; another process may have got there first."""
+    try:
+        os.replace(temp_dir, target_dir)
+    except OSError:
+        if not os.path.isdir(target_dir):
+            raise
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def export_model(task, model, revision, backend):
+    """
+    Exports 'model' to ONNX on first use and, for 'onnx-int8', quantizes each of
+    the export's graphs with dynamic int8 quantization. Returns the folder.
+    """
+    from transformers import AutoTokenizer
+    target = model_dir(model, revision, backend)
+    if os.path.isdir(target):
+        return target
+
+    fp32 = model_dir(model, revision, "onnx")
+    if not os.path.isdir(fp32):
+        print(f"Exporting '{model}' to ONNX...")
+        temp = f"{fp32}.tmp-{os.getpid()}"
+        ort_model_class(task).from_pretrained(model, revision=revision, export=True).save_pretrained(temp)
+        AutoTokenizer.from_pretrained(model, revision=revision).save_pretrained(temp)
+        _publish(temp, fp32)
+
+    if backend == "onnx-int8":
+        print(f"Quantizing '{model}' to int8 ({QUANTIZATION_PRESET})...")
+        temp = f"{target}.tmp-{os.getpid()}"
+        # The config and tokenizer files are the fp32 export's.
+        shutil.copytree(fp32, temp, ignore=shutil.ignore_patterns("*.onnx", "*.onnx_data", PARITY_FILE))
+        config = getattr(AutoQuantizationConfig, QUANTIZATION_PRESET)(is_static=False, per_channel=False)
+        for file_name in sorted(os.listdir(fp32)):
+            if file_name.endswith(".onnx"):
+                ORTQuantizer.from_pretrained(fp32, file_name=file_name).quantize(config, save_dir=temp, file_suffix="quantized")
+                # Back to the original name, which the ORTModel classes load by default.
+                os.replace(os.path.join(temp, file_name.replace(".onnx", "_quantized.onnx")), os.path.join(temp, file_name))
+        _publish(temp, target)
+    return target
+
+
+def load_onnx_pipeline(task, model, revision, backend, **init_kwargs):
+    """A transformers pipeline running the exported model on ONNX Runtime's CPU provider."""
+    from transformers import AutoTokenizer, pipeline
+    path = export_model(task, model, revision, backend)
+    ort_model = ort_model_class(task).from_pretrained(path, provider="CPUExecutionProvider", session_options=session_options())
+    return pipeline(task, model=ort_model, tokenizer=AutoTokenizer.from_pretrained(path), **init_kwargs)
+
+
+def compare_outputs(task, reference, candidate):
+    """Parity metrics of a backend's pipeline outputs against PyTorch's for the same inputs."""
+    if task == "sentiment-analysis":
+        agreed, max_diff = 0, 0.0
+        for expected, actual in zip(reference, candidate):
+            # With top_k=None each output lists every class; without it, only the top one.
+            expected = {r["label"]: r["score"] for r in (expected if isinstance(expected, list) else [expected])}
+            actual = {r["label"]: r["score"] for r in (actual if isinstance(actual, list) else [actual])}
+            agreed += max(expected, key=expected.get) == max(actual, key=actual.get)
+            max_diff = max([max_diff] + [abs(score - actual.get(label, 0.0)) for label, score in expected.items()])
+        return {"label_agreement": agreed / len(reference), "max_score_diff": round(max_diff, 6)}
+
+    key = "summary_text" if task == "summarization" else "generated_text"
+    pairs = [(expected[key], actual[key]) for expected, actual in zip(reference, candidate)]
+    similarities = [difflib.SequenceMatcher(None, expected.split(), actual.split()).ratio() for expected, actual in pairs]
+    return {
+        "exact_match": sum(expected == actual for expected, actual in pairs) / len(pairs),
+        "text_similarity": round(sum(similarities) / len(similarities), 4),
+    }
+
+
+def passes(report):
+    """Whether a parity report meets the current PARITY_LIMITS for its backend."""
+    limits = PARITY_LIMITS[report["backend"]]
+    return all(
+        report[metric] <= limit if metric == "max_score_diff" else report[metric] >= limit
+        for metric, limit in limits.items() if metric in report
+    )
+
+
+def parity_check(task, model, revision, backend, init_kwargs, candidate=None, texts=PARITY_TEXTS):
+    """
+    Runs the fixed sample through the PyTorch pipeline and the backend's (the
+    given 'candidate', or a freshly loaded one), compares the outputs and
+    timings, and stores the report next to the exported model. Returns it.
+    """
+    from inference_service import load_local_pipeline
+    params = PARITY_PARAMS[task]
+    pipelines = {
+        "pytorch": load_local_pipeline(task, model, revision, "cpu", backend="pytorch", **init_kwargs),
+        backend: candidate or load_onnx_pipeline(task, model, revision, backend, **init_kwargs),
+    }
+    outputs, seconds = {}, {}
+    for name, sample_pipeline in pipelines.items():
+        sample_pipeline(texts[:1], **params)  # warm-up, so one-off initialization is not timed
+        started = time.perf_counter()
+        outputs[name] = sample_pipeline(list(texts), **params)
+        seconds[name] = time.perf_counter() - started
+
+    report = {
+        "task": task, "model": model, "revision": revision, "backend": backend, "samples": len(texts),
+        **compare_outputs(task, outputs["pytorch"], outputs[backend]),
+        "pytorch_seconds": round(seconds["pytorch"], 3),
+        "backend_seconds": round(seconds[backend], 3),
+        "speedup": round(seconds["pytorch"] / seconds[backend], 2) if seconds[backend] else None,
+        "checked_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    report["passed"] = passes(report)
+    with open(os.path.join(model_dir(model, revision, backend), PARITY_FILE), "w", encoding="utf-8") as parity_file:
+        json.dump(report, parity_file, indent=2)
+    return report
+
+
+def load_verified_pipeline(task, model, revision, backend, **init_kwargs):
+    """
+    The model on 'backend' if it is installed and the model passes its parity
+    check (run on first load), else None so the caller falls back to PyTorch.
+    """
+    if ort is None:
+        print(f"The '{backend}' backend needs ONNX Runtime and Optimum (pip install optimum[onnxruntime]); using PyTorch.")
+        return None
+    try:
+        candidate = load_onnx_pipeline(task, model, revision, backend, **init_kwargs)
+        if CHECK_PARITY_ON_FIRST_LOAD:
+            parity_path = os.path.join(model_dir(model, revision, backend), PARITY_FILE)
+            if os.path.exists(parity_path):
+                with open(parity_path, encoding="utf-8") as parity_file:
+                    report = json.load(parity_file)
+            else:
+                print(f"Checking '{model}' on {backend} against PyTorch...")
+                report = parity_check(task, model, revision, backend, init_kwargs, candidate)
+            if not passes(report):
+                print(f"'{model}' on {backend} failed its parity check ({parity_path}); using PyTorch.")
+                return None
+        print(f"Running '{model}' on {backend} ({session_options().intra_op_num_threads} threads).")
+        return candidate
+    except Exception as e:
+        print(f"Could not run '{model}' on {backend} ({type(e).__name__}: {e}); using PyTorch.")
+        return None
+
+
+def print_parity(report):
+    metrics = ", ".join(f"{metric} {report[metric]}" for metric in
+                        ("label_agreement", "max_score_diff", "exact_match", "text_similarity") if metric in report)
+    print(f"[{'ok' if report['passed'] else 'FAIL'}] {report['model']} on {report['backend']}: {metrics}; "
+          f"{report['pytorch_seconds']:.2f}s PyTorch vs {report['backend_seconds']:.2f}s ({report['speedup']}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the analysis models to ONNX and check them against PyTorch.")
+    parser.add_argument("--backend", choices=BACKENDS, default="onnx-int8", help="Backend to export and check.")
+    args = parser.parse_args()
+
+    if ort is None:
+        print("ONNX export needs ONNX Runtime and Optimum (pip install optimum[onnxruntime]).")
+    else:
+        from inference_service import analysis_models
+        failures = 0
+        for task, model, revision, init_kwargs in analysis_models():
+            export_model(task, model, revision, args.backend)
+            parity = parity_check(task, model, revision, args.backend, init_kwargs)
+            print_parity(parity)
+            failures += not parity["passed"]
+        print(f"\n{failures} model(s) failed the parity check." if failures else "\nAll models passed the parity check.")
@@ -0,0 +1,222 @@
+import sqlite3
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import multiprocessing
+from multiprocessing.connection import wait
+# Only the standard library and the schema module: a spawned stage process
+# re-imports this file before run_stage caps its threads, so nothing here may
+# pull in numpy, spaCy or torch.
+from database_setup import (PENDING_TERMS_QUERY, PENDING_COMMENTS_FILTER, DIRTY_SECTIONS_QUERY, DIRTY_DRAFTS_QUERY,
+                            BUSY_TIMEOUT_SECONDS)
+
+# --- Configuration ---
+DATABASE_FILE = "econsultation.db"
+# Cores shared by all running stages. A stage only starts when its cores fit
+# in what the running stages leave free (or when nothing else is running).
+CPU_BUDGET = os.cpu_count() or 1
+
+
+class Stage:
+    """
+    One step of the pipeline: 'function' of 'module' run in its own process.
+    'pending_query' counts the work left (None: the stage checks its own work
+    and always runs); a stage with nothing pending is skipped. 'cpu_setting'
+    names a module constant set to the stage's core allotment.
+    """
+
+    def __init__(self, name, module, function, depends_on=(), cpus=1, pending_query=None, cpu_setting=None):
+        self.name = name
+        self.module = module
+        self.function = function
+        self.depends_on = list(depends_on)
+        self.cpus = cpus
+        self.pending_query = pending_query
+        self.cpu_setting = cpu_setting
+
+
+# Near-duplicate clustering decides which comments the models see. Sentiment,
+# per-comment summaries and the token index then run side by side; the
+# executive summaries read the per-comment summaries and the word clouds read
+# the token index.
+STAGES = [
+    Stage("setup", "database_setup", "setup_database",
+          pending_query="SELECT COUNT(*) = 0 FROM sqlite_master WHERE type = 'table' AND name = 'comments'"),
+    Stage("near_duplicates", "near_duplicates", "run_near_duplicates", ["setup"], cpus=2,
+          pending_query="SELECT COUNT(*) FROM comments WHERE cluster_id IS NULL AND comment_text IS NOT NULL AND comment_text != ''"),
+    Stage("sentiment", "analyze_sentiments", "analyze_and_update_sentiments_v2", ["near_duplicates"], cpus=2,
+          pending_query="SELECT COUNT(*) FROM comments WHERE sentiment_label IS NULL"),
+    Stage("comment_summaries", "individual_summaries", "generate_individual_summaries_bart_final", ["near_duplicates"], cpus=2,
+          pending_query=f"SELECT COUNT(*) {PENDING_COMMENTS_FILTER}"),
+    Stage("token_index", "token_index", "run_token_index", ["near_duplicates"], cpus=1,
+          pending_query=f"SELECT COUNT(*) FROM ({PENDING_TERMS_QUERY})"),
+    Stage("executive_summaries", "executive_summarization", "main", ["comment_summaries"], cpus=2,
+          pending_query=f"SELECT (SELECT COUNT(*) FROM ({DIRTY_SECTIONS_QUERY})) + (SELECT COUNT(*) FROM ({DIRTY_DRAFTS_QUERY}))"),
+    Stage("word_clouds", "word_clouds", "run_all_word_cloud_generation", ["token_index"], cpus=2,
+          cpu_setting="RENDER_WORKERS"),
+]
+
+
+def count_pending(stage, database_file):
+    """Work left for a stage, or None if the stage checks its own work."""
+    if stage.pending_query is None:
+        return None
+    if not os.path.exists(database_file):
+        return 1
+    conn = sqlite3.connect(database_file, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        return conn.execute(stage.pending_query).fetchone()[0]
+    except sqlite3.OperationalError:
+        # Tables that do not exist yet mean everything is still to do.
+        return 1
+    finally:
+        conn.close()
+
+
+def run_stage(stage, database_file, cpus, result_pipe):
+    """
+    Stage process entry point: caps the math libraries' threads at the stage's
+    allotment, runs the stage and sends back its CPU seconds (its own plus its
+    pool workers') and error, if any. Stages raise on failure; the process then
+    exits with status 1.
+    """
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(cpus)
+    import resource
+    error = None
+    try:
+        module = importlib.import_module(stage.module)
+        module.DATABASE_FILE = database_file
+        importlib.import_module("database_setup").DATABASE_FILE = database_file
+        if stage.cpu_setting:
+            setattr(module, stage.cpu_setting, cpus)
+        getattr(module, stage.function)()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    result_pipe.send((sum(u.ru_utime + u.ru_stime for u in usage), error))
+    result_pipe.close()
+    if error:
+        sys.exit(1)
+
+
+def enable_wal(database_file):
+    """Concurrent stages need WAL so one stage's commits don't block the others' reads."""
+    if os.path.exists(database_file):
+        conn = sqlite3.connect(database_file, timeout=BUSY_TIMEOUT_SECONDS)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+        finally:
+            conn.close()
+
+
+def run_pipeline(database_file=DATABASE_FILE, cpu_budget=CPU_BUDGET, stages=STAGES):
+    """
+    Runs the stages in dependency order, starting every stage whose
+    dependencies are done as soon as its cores fit in the budget. A stage is
+    skipped when it has no pending work, and its dependents are skipped when it
+    fails. Returns the per-stage report.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        unknown = [name for name in stage.depends_on if name not in by_name]
+        if unknown:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages {unknown}.")
+
+    enable_wal(database_file)
+    ctx = multiprocessing.get_context("spawn")
+    report = {}
+    waiting = list(stages)
+    running = {}  # sentinel -> (stage, process, pipe, cpus, started, pending_before)
+    started_at = time.perf_counter()
+
+    while waiting or running:
+        resolved = len(report)
+        # Stages whose dependencies failed or were not run can never start.
+        for stage in list(waiting):
+            blocked = [name for name in stage.depends_on if report.get(name, {}).get("status") in ("failed", "blocked")]
+            if blocked:
+                waiting.remove(stage)
+                report[stage.name] = {"status": "blocked", "reason": f"upstream failed: {', '.join(blocked)}"}
+                print(f"[{stage.name}] blocked: upstream failed ({', '.join(blocked)}).")
+
+        used = sum(entry[3] for entry in running.values())
+        for stage in list(waiting):
+            if not all(report.get(name, {}).get("status") in ("ok", "skipped") for name in stage.depends_on):
+                continue
+            cpus = min(stage.cpus, cpu_budget)
+            if running and used + cpus > cpu_budget:
+                continue
+            waiting.remove(stage)
+            pending = count_pending(stage, database_file)
+            if pending == 0:
+                report[stage.name] = {"status": "skipped", "reason": "no pending work"}
+                print(f"[{stage.name}] skipped: no pending work.")
+                continue
+            receiver, sender = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=run_stage, args=(stage, database_file, cpus, sender), name=stage.name)
+            process.start()
+            sender.close()
+            running[process.sentinel] = (stage, process, receiver, cpus, time.perf_counter(), pending)
+            used += cpus
+            print(f"[{stage.name}] started on {cpus} core(s)" + (f" with {pending} pending." if pending else "."))
+
+        if not running:
+            if len(report) == resolved:
+                raise ValueError(f"Stages {[stage.name for stage in waiting]} have circular dependencies.")
+            continue
+        for sentinel in wait(list(running)):
+            stage, process, receiver, cpus, started, pending_before = running.pop(sentinel)
+            process.join()
+            wall = time.perf_counter() - started
+            cpu_seconds, error = receiver.recv() if receiver.poll() else (None, None)
+            if error is None and process.exitcode != 0:
+                error = f"exit code {process.exitcode}"
+            receiver.close()
+            if stage.name == "setup":
+                # A freshly created database gets WAL before the other stages open it.
+                enable_wal(database_file)
+            pending_after = count_pending(stage, database_file)
+            rows = None if pending_before is None else max(pending_before - pending_after, 0)
+            report[stage.name] = {
+                "status": "failed" if error else "ok",
+                "wall_seconds": round(wall, 3),
+                "cpu_seconds": None if cpu_seconds is None else round(cpu_seconds, 3),
+                "cpus": cpus,
+                "rows_processed": rows,
+                "pending_after": pending_after,
+            }
+            if error:
+                report[stage.name]["reason"] = error
+            print(f"[{stage.name}] {'failed: ' + error if error else 'done'} in {wall:.1f}s.")
+
+    print_report(report, time.perf_counter() - started_at)
+    return report
+
+
+def print_report(report, total_wall):
+    print(f"\n{'stage':<22}{'status':<10}{'wall s':>10}{'cpu s':>10}{'rows':>10}")
+    for name, entry in report.items():
+        def show(key):
+            value = entry.get(key)
+            return "-" if value is None else (f"{value:.1f}" if isinstance(value, float) else str(value))
+        print(f"{name:<22}{entry['status']:<10}{show('wall_seconds'):>10}{show('cpu_seconds'):>10}{show('rows_processed'):>10}")
+    print(f"Pipeline finished in {total_wall:.1f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the analysis stages as a dependency graph.")
+    parser.add_argument("--db", default=DATABASE_FILE, help="Database file to process.")
+    parser.add_argument("--cpus", type=int, default=CPU_BUDGET, help="Cores shared by the concurrently running stages.")
+    parser.add_argument("--report", help="Also write the per-stage report to this JSON file.")
+    args = parser.parse_args()
+
+    stage_report = run_pipeline(args.db, args.cpus)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump(stage_report, report_file, indent=2)
+    if any(entry["status"] in ("failed", "blocked") for entry in stage_report.values()):
+        sys.exit(1)
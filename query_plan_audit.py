@@ -0,0 +1,198 @@
+import sqlite3
+import os
+import sys
+from database_setup import (
+    CREATE_DRAFTS_TABLE, CREATE_SECTIONS_TABLE, CREATE_USERS_TABLE,
+    CREATE_SUBMISSIONS_TABLE, CREATE_COMMENTS_TABLE, migrate_schema
+)
+
+# --- Configuration ---
+# By default the audit runs against a fresh in-memory database built from the
+# schema in database_setup.py; pass a database file to audit that instead.
+DATABASE_FILE = None
+
+# --- Registered Hot Queries ---
+# name -> (query, params, aliases allowed to be fully scanned)
+# Keep these in sync with the queries they mirror. A full table scan of any
+# alias not listed in the allowed set fails the audit.
+HOT_QUERIES = {
+    "api_comments_for_draft": ("""
+        SELECT c.*, sec.section_title, u.state, u.industry, u.is_organization
+        FROM comments c
+        JOIN submissions s ON c.submission_id = s.submission_id
+        JOIN sections sec ON c.section_id = sec.section_id
+        JOIN users u ON s.user_id = u.user_id
+        WHERE s.draft_id = ?
+    """, (1,), set()),
+    "api_sections_for_draft": (
+        "SELECT * FROM sections WHERE draft_id = ?", (1,), set()
+    ),
+    "api_draft_details_comments": ("""
+        SELECT c.*, u.first_name, u.last_name, u.organization_name FROM comments c
+        JOIN sections sec ON c.section_id = sec.section_id
+        JOIN submissions s ON c.submission_id = s.submission_id
+        JOIN users u ON s.user_id = u.user_id
+        WHERE sec.draft_id = ?
+        ORDER BY sec.section_id
+    """, (1,), set()),
+    "api_comments_page": ("""
+        SELECT c.comment_id, c.sentiment_label, sec.section_title
+        FROM comments c
+        JOIN submissions s ON c.submission_id = s.submission_id
+        JOIN sections sec ON c.section_id = sec.section_id
+        JOIN users u ON s.user_id = u.user_id
+        WHERE s.draft_id = ? AND c.sentiment_label IN (?) AND (c.section_id, c.comment_id) > (?, ?)
+        ORDER BY c.section_id, c.comment_id LIMIT ?
+    """, (1, 'Positive', 0, 0, 100), set()),
+    "api_aggregates": ("""
+        SELECT section_id, sentiment_label, SUM(comment_count) AS count
+        FROM comment_sentiment_cube
+        WHERE draft_id = ?
+        GROUP BY section_id, sentiment_label
+    """, (1,), set()),
+    "sentiment_worklist_page": ("""
+        SELECT comment_id, comment_text FROM comments
+        WHERE sentiment_label IS NULL AND comment_text IS NOT NULL AND comment_text != ''
+        AND comment_id > ? ORDER BY comment_id LIMIT ?
+    """, (0, 1000), set()),
+    "summary_worklist_page": ("""
+        SELECT c.comment_id, c.comment_text, s.section_title
+        FROM comments c
+        JOIN sections s ON c.section_id = s.section_id
+        WHERE
+            (c.ai_summary IS NULL OR c.ai_summary = 'Error generating summary.') AND
+            (c.comment_text IS NOT NULL AND LENGTH(c.comment_text) > 20)
+        AND c.comment_id > ? ORDER BY c.comment_id LIMIT ?
+    """, (0, 1000), set()),
+    "section_analysis_comments": ("""
+        SELECT comment_text, ai_summary FROM comments
+        WHERE section_id = ? AND comment_id <= ? AND comment_text IS NOT NULL AND LENGTH(comment_text) > 20
+        ORDER BY comment_id
+    """, (1, 1000), set()),
+    "section_term_counts": ("""
+        SELECT c.section_id, t.ngram, t.term, SUM(t.term_count)
+        FROM comment_terms t
+        JOIN comments c ON c.comment_id = t.comment_id
+        JOIN sections sec ON c.section_id = sec.section_id
+        LEFT JOIN submissions s ON c.submission_id = s.submission_id
+        WHERE c.section_id = ?
+        GROUP BY 1, 2, 3
+        ORDER BY 1
+    """, (1,), set()),
+    "api_terms": ("""
+        SELECT t.ngram, t.term, SUM(t.term_count) AS count
+        FROM comment_terms t
+        JOIN comments c ON c.comment_id = t.comment_id
+        JOIN submissions s ON c.submission_id = s.submission_id
+        JOIN sections sec ON c.section_id = sec.section_id
+        JOIN users u ON s.user_id = u.user_id
+        WHERE s.draft_id = ? AND c.sentiment_label IN (?)
+        GROUP BY t.ngram, t.term
+    """, (1, 'Negative'), set()),
+    "api_campaigns": ("""
+        SELECT c.cluster_id, COUNT(*) AS size
+        FROM comments c
+        JOIN submissions s ON c.submission_id = s.submission_id
+        WHERE s.draft_id = ? AND c.cluster_id IS NOT NULL
+        GROUP BY c.cluster_id
+    """, (1,), set()),
+    # Must be driven by the full-text index, with the filters applied per match.
+    "api_search": ("""
+        SELECT c.comment_id, sec.section_title, u.state, snippet(comment_search, -1, '[', ']', '…', 16)
+        FROM comment_search
+        JOIN comments c ON c.comment_id = comment_search.rowid
+        JOIN submissions s ON c.submission_id = s.submission_id
+        JOIN sections sec ON c.section_id = sec.section_id
+        JOIN users u ON s.user_id = u.user_id
+        WHERE comment_search MATCH ? AND s.draft_id = ? AND c.sentiment_label IN (?)
+        ORDER BY comment_search.rank
+        LIMIT ? OFFSET ?
+    """, ('"data"*', 1, 'Negative', 20, 0), set()),
+    # Run by the cluster triggers on every edit or delete of a comment.
+    "cluster_members": (
+        "SELECT comment_id FROM comments WHERE cluster_id = ?", (1,), set()
+    ),
+    "near_duplicate_worklist_page": ("""
+        SELECT comment_id, comment_text FROM comments
+        WHERE section_id = ? AND cluster_id IS NULL AND comment_text IS NOT NULL AND comment_text != ''
+        AND comment_id > ? ORDER BY comment_id LIMIT ?
+    """, (1, 0, 1000), set()),
+    # Walks every section by design; the per-section EXISTS probes must be index searches.
+    "dirty_sections": ("""
+        SELECT s.section_id FROM sections s
+        WHERE s.section_ai_key_points IS NULL
+           OR EXISTS (
+                SELECT 1 FROM comments c
+                WHERE c.section_id = s.section_id AND c.comment_id > COALESCE(s.section_summary_watermark, 0)
+           )
+           OR EXISTS (
+                SELECT 1 FROM comments c
+                WHERE c.section_id = s.section_id AND c.updated_at > s.section_ai_summary_updated_at
+           )
+    """, (), {"s"}),
+}
+
+
+def build_schema_database():
+    """Creates an empty in-memory database with the current schema and indexes."""
+    conn = sqlite3.connect(":memory:")
+    for statement in (CREATE_DRAFTS_TABLE, CREATE_SECTIONS_TABLE, CREATE_USERS_TABLE,
+                      CREATE_SUBMISSIONS_TABLE, CREATE_COMMENTS_TABLE):
+        conn.execute(statement)
+    migrate_schema(conn)
+    return conn
+
+
+def find_full_scans(conn, query, params, allowed_scans):
+    """
+    Returns the EXPLAIN QUERY PLAN lines that scan a whole table (or a whole
+    index) for an alias that is not allowed to be scanned.
+    """
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    violations = []
+    for row in plan:
+        detail = row[-1]
+        if not detail.startswith("SCAN ") or detail.startswith("SCAN CONSTANT ROW"):
+            continue
+        # FTS5 tables always report a SCAN; an 'M' in the index string
+        # ('VIRTUAL TABLE INDEX 32:M3') means a full-text MATCH drives it.
+        if " VIRTUAL TABLE INDEX " in detail and "M" in detail.rsplit(":", 1)[-1]:
+            continue
+        alias = detail.split()[1]
+        if alias not in allowed_scans:
+            violations.append(detail)
+    return plan, violations
+
+
+def run_audit(conn):
+    """Prints the plan of every hot query and returns the number of regressions."""
+    failures = 0
+    for name, (query, params, allowed_scans) in HOT_QUERIES.items():
+        plan, violations = find_full_scans(conn, query, params, allowed_scans)
+        status = "FAIL" if violations else "ok"
+        print(f"[{status}] {name}")
+        for row in plan:
+            print(f"        {row[-1]}")
+        for detail in violations:
+            print(f"    -> full scan: {detail}")
+        failures += bool(violations)
+    return failures
+
+
+if __name__ == '__main__':
+    database_file = sys.argv[1] if len(sys.argv) > 1 else DATABASE_FILE
+    if database_file:
+        if not os.path.exists(database_file):
+            print(f"Error: Database file '{database_file}' not found.")
+            sys.exit(2)
+        conn = sqlite3.connect(database_file)
+        migrate_schema(conn)
+    else:
+        conn = build_schema_database()
+
+    failures = run_audit(conn)
+    conn.close()
+    if failures:
+        print(f"\n{failures} hot queries fell back to a full table scan.")
+        sys.exit(1)
+    print("\nAll hot queries use indexes.")
@@ -0,0 +1,190 @@
+import sqlite3
+import os
+import json
+import time
+import random
+import argparse
+from collections import Counter
+from analyze_sentiments import (
+    RULES, CONFIDENCE_THRESHOLD, MODEL_NAME, CASCADE_MODEL_NAME, SentimentCascade, lexicon_label
+)
+
+# --- Configuration ---
+DATABASE_FILE = "econsultation.db"
+# Comments with text sampled for the report. Every sampled comment goes through
+# both models, so this bounds the report's cost.
+SAMPLE_SIZE = 500
+SEED = 42
+# Confidence thresholds the report compares.
+THRESHOLDS = [0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 0.99]
+REPORT_FOLDER = "calibration"
+LABELS = ["Positive", "Neutral", "Negative"]
+
+
+def sample_comments(conn, sample_size, seed):
+    """A seeded random sample of (comment_id, comment_text, action_type) rows with text."""
+    comment_ids = [row[0] for row in conn.execute(
+        "SELECT comment_id FROM comments WHERE comment_text IS NOT NULL AND comment_text != ''"
+    )]
+    sample = random.Random(seed).sample(comment_ids, min(sample_size, len(comment_ids)))
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS calibration_sample (comment_id INTEGER PRIMARY KEY);")
+    conn.execute("DELETE FROM calibration_sample;")
+    conn.executemany("INSERT INTO calibration_sample (comment_id) VALUES (?)", [(comment_id,) for comment_id in sample])
+    return conn.execute("""
+        SELECT c.comment_id, c.comment_text, c.action_type
+        FROM calibration_sample JOIN comments c USING (comment_id)
+        ORDER BY c.comment_id
+    """).fetchall()
+
+
+def rule_labels(conn):
+    """{comment_id: label} for the sampled comments a rule decides (first matching rule wins)."""
+    labels = {}
+    for label, condition in RULES:
+        for (comment_id,) in conn.execute(f"""
+            SELECT comment_id FROM calibration_sample JOIN comments USING (comment_id) WHERE {condition}
+        """):
+            labels.setdefault(comment_id, label)
+    return labels
+
+
+def timed_classify(cascade, tier, rows):
+    """Runs every row through the tier's model, bypassing the cache. Returns (results, seconds per comment)."""
+    started = time.perf_counter()
+    results = cascade.classify(tier, rows, use_cache=False)
+    return results, (time.perf_counter() - started) / max(len(rows), 1)
+
+
+def cascade_outcome(sample, rules, lexicon, distilled, full, threshold):
+    """
+    Replays the cascade at 'threshold' over the sample. Returns {comment_id:
+    (tier, label)} for every comment the full model could label.
+    """
+    outcome = {}
+    for comment_id, text, action_type in sample:
+        if full[comment_id][0] == 'Error':
+            continue
+        guess = lexicon[comment_id]
+        if comment_id in rules:
+            outcome[comment_id] = ("rule", rules[comment_id])
+        elif guess and guess[1] >= threshold:
+            outcome[comment_id] = ("lexicon", guess[0])
+        elif distilled[comment_id][0] != 'Error' and distilled[comment_id][1] >= threshold:
+            outcome[comment_id] = ("distilled", distilled[comment_id][0])
+        else:
+            outcome[comment_id] = ("full", full[comment_id][0])
+    return outcome
+
+
+def summarize(outcome, full, distilled_seconds, full_seconds):
+    """Coverage and agreement with the full model, per tier and overall, for one replay."""
+    tiers = {}
+    for tier in ("rule", "lexicon", "distilled", "full"):
+        decided = [comment_id for comment_id, (t, _) in outcome.items() if t == tier]
+        agreed = sum(outcome[comment_id][1] == full[comment_id][0] for comment_id in decided)
+        tiers[tier] = {
+            "comments": len(decided),
+            "share": round(len(decided) / max(len(outcome), 1), 4),
+            "agreement": round(agreed / len(decided), 4) if decided else None,
+        }
+    agreed = sum(label == full[comment_id][0] for comment_id, (_, label) in outcome.items())
+    # Model time per comment: every comment past the lexicon pays for the
+    # distilled model, and the escalated ones for the full model as well.
+    reaching_distilled = tiers["distilled"]["comments"] + tiers["full"]["comments"]
+    cascade_seconds = reaching_distilled * distilled_seconds + tiers["full"]["comments"] * full_seconds
+    full_only_seconds = (len(outcome) - tiers["rule"]["comments"]) * full_seconds
+    return {
+        "agreement": round(agreed / max(len(outcome), 1), 4),
+        "escalated_share": tiers["full"]["share"],
+        "speedup": round(full_only_seconds / cascade_seconds, 2) if cascade_seconds else None,
+        "tiers": tiers,
+    }
+
+
+def confusion_matrix(outcome, full):
+    """Counts of (cascade label, full-model label) pairs."""
+    counts = Counter((label, full[comment_id][0]) for comment_id, (_, label) in outcome.items())
+    return {cascade_label: {full_label: counts[(cascade_label, full_label)] for full_label in LABELS} for cascade_label in LABELS}
+
+
+def calibrate(database_file=DATABASE_FILE, sample_size=SAMPLE_SIZE, seed=SEED, thresholds=THRESHOLDS,
+              threshold=CONFIDENCE_THRESHOLD):
+    """
+    Labels a sample with every tier, replays the cascade at each threshold and
+    returns the report: per-tier coverage and agreement with the full model,
+    the estimated model-time speedup, and the confusion matrix at 'threshold'.
+    """
+    conn = sqlite3.connect(f"file:{database_file}?mode=ro", uri=True)
+    cascade = SentimentCascade(threshold, cascade=True)
+    try:
+        sample = sample_comments(conn, sample_size, seed)
+        if not sample:
+            print("No comments with text to sample.")
+            return None
+        print(f"Sampled {len(sample)} comments (seed {seed}).")
+        rules = rule_labels(conn)
+        lexicon = {comment_id: lexicon_label(action_type, text) for comment_id, text, action_type in sample}
+        rows = [(comment_id, text) for comment_id, text, _ in sample]
+        distilled, distilled_seconds = timed_classify(cascade, "distilled", rows)
+        full, full_seconds = timed_classify(cascade, "full", rows)
+    finally:
+        cascade.close()
+        conn.close()
+
+    sweep = {}
+    for t in sorted(set(thresholds) | {threshold}):
+        sweep[t] = summarize(cascade_outcome(sample, rules, lexicon, distilled, full, t), full, distilled_seconds, full_seconds)
+    return {
+        "meta": {
+            "database": database_file, "sample_size": len(sample), "seed": seed,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "full_model": MODEL_NAME, "distilled_model": CASCADE_MODEL_NAME,
+            "full_seconds_per_comment": round(full_seconds, 5),
+            "distilled_seconds_per_comment": round(distilled_seconds, 5),
+        },
+        "threshold": threshold,
+        "thresholds": {str(t): summary for t, summary in sweep.items()},
+        "confusion_matrix": confusion_matrix(cascade_outcome(sample, rules, lexicon, distilled, full, threshold), full),
+    }
+
+
+def print_report(report):
+    meta = report["meta"]
+    print(f"\nCascade agreement with '{meta['full_model']}' on {meta['sample_size']} comments "
+          f"(distilled {meta['distilled_seconds_per_comment'] * 1000:.1f} ms/comment, "
+          f"full {meta['full_seconds_per_comment'] * 1000:.1f} ms/comment):")
+    print(f"{'threshold':>10}{'agreement':>11}{'escalated':>11}{'speedup':>9}   per tier: share / agreement")
+    for t, summary in report["thresholds"].items():
+        tiers = "  ".join(
+            f"{tier} {entry['share']:.0%}/{'-' if entry['agreement'] is None else format(entry['agreement'], '.0%')}"
+            for tier, entry in summary["tiers"].items()
+        )
+        marker = " <- current" if float(t) == report["threshold"] else ""
+        speedup = "-" if summary["speedup"] is None else f"{summary['speedup']:.1f}x"
+        print(f"{t:>10}{summary['agreement']:>11.1%}{summary['escalated_share']:>11.1%}{speedup:>9}   {tiers}{marker}")
+    print(f"\nConfusion matrix at threshold {report['threshold']} (rows: cascade, columns: full model):")
+    print(" " * 10 + "".join(f"{label:>10}" for label in LABELS))
+    for cascade_label, row in report["confusion_matrix"].items():
+        print(f"{cascade_label:>10}" + "".join(f"{row[label]:>10}" for label in LABELS))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the sentiment cascade's agreement with the full model on a sample.")
+    parser.add_argument("--db", default=DATABASE_FILE, help="Database file to sample.")
+    parser.add_argument("--sample", type=int, default=SAMPLE_SIZE, help="Comments to sample.")
+    parser.add_argument("--seed", type=int, default=SEED, help="Sampling seed.")
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD, help="Threshold to report the confusion matrix at.")
+    parser.add_argument("--out", help="Report file (default: calibration/sentiment-<timestamp>.json).")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Error: Database file '{args.db}' not found.")
+    else:
+        calibration = calibrate(args.db, args.sample, args.seed, THRESHOLDS, args.threshold)
+        if calibration:
+            print_report(calibration)
+            os.makedirs(REPORT_FOLDER, exist_ok=True)
+            out = args.out or os.path.join(REPORT_FOLDER, f"sentiment-{time.strftime('%Y%m%dT%H%M%S')}.json")
+            with open(out, "w", encoding="utf-8") as report_file:
+                json.dump(calibration, report_file, indent=2)
+            print(f"\nReport written to '{out}'.")
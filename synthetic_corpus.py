@@ -0,0 +1,279 @@
+import sqlite3
+import os
+import random
+import time
+import argparse
+from datetime import datetime, timedelta
+from itertools import accumulate
+from database_setup import (
+    CREATE_DRAFTS_TABLE, CREATE_SECTIONS_TABLE, CREATE_USERS_TABLE,
+    CREATE_SUBMISSIONS_TABLE, CREATE_COMMENTS_TABLE, CREATE_INDEXES, CHANGE_TRACKED_TABLES,
+    migrate_schema, rebuild_sentiment_cube, rebuild_search_index, bump_draft_generations
+)
+from bulk_load_csv import BULK_LOAD_PRAGMAS, RESTORE_PRAGMAS, DEFERRED_TRIGGERS, TableSpec, index_names
+
+# --- Configuration ---
+SEED = 42
+DEFAULT_COMMENTS = 100_000
+CHUNK_ROWS = 50_000
+# Corpus shape, scaled from the comment count.
+COMMENTS_PER_USER = 4
+COMMENTS_PER_SUBMISSION = 2.5
+SECTIONS_PER_DRAFT = (8, 40)
+# Zipf exponents: how strongly comments pile onto the hot drafts, hot sections
+# and the most active users.
+DRAFT_SKEW = 1.0
+SECTION_SKEW = 1.2
+USER_SKEW = 0.8
+# Share of comments that are copies of a coordinated campaign text, with a
+# greeting or signature varied, and how many campaigns there are per draft.
+CAMPAIGN_SHARE = 0.2
+CAMPAIGNS_PER_DRAFT = 5
+ORGANIZATION_SHARE = 0.2
+# 'In Agreement' comments submitted without any text.
+EMPTY_AGREEMENT_SHARE = 0.3
+CONSULTATION_DAYS = 60
+START_DATE = datetime(2025, 1, 1)
+
+ACTION_WEIGHTS = {"In Agreement": 35, "Suggest modification": 35, "Suggest removal": 20, "Implicit Agreement": 10}
+STATE_WEIGHTS = {
+    "Maharashtra": 14, "Karnataka": 11, "Delhi": 10, "Tamil Nadu": 8, "Uttar Pradesh": 8, "Gujarat": 7,
+    "Telangana": 6, "West Bengal": 5, "Kerala": 4, "Rajasthan": 4, "Haryana": 4, "Punjab": 3,
+    "Madhya Pradesh": 3, "Bihar": 3, "Odisha": 2, "Assam": 2, "Goa": 1,
+}
+INDUSTRY_WEIGHTS = {"Technology": 30, "Finance": 20, "Healthcare": 10, "Education": 10, "Government": 8, "Non-Profit": 12, "Other": 10}
+# Sentiment given to pre-labelled comments, by action type.
+LABEL_WEIGHTS = {
+    "In Agreement": {"Positive": 75, "Neutral": 15, "Negative": 10},
+    "Implicit Agreement": {"Positive": 50, "Neutral": 40, "Negative": 10},
+    "Suggest modification": {"Positive": 15, "Neutral": 45, "Negative": 40},
+    "Suggest removal": {"Positive": 5, "Neutral": 15, "Negative": 80},
+}
+
+FIRST_NAMES = ["Priya", "Vikram", "Anjali", "Raj", "Kabir", "Rohan", "Sunita", "Arjun", "Amitabh", "Siddharth",
+               "Meera", "Aditya", "Kavya", "Nikhil", "Pooja", "Rahul", "Sneha", "Varun", "Divya", "Farhan"]
+LAST_NAMES = ["Sharma", "Singh", "Desai", "Patel", "Verma", "Gupta", "Krishnan", "Menon", "Chaudhary", "Jain",
+              "Iyer", "Reddy", "Nair", "Kapoor", "Mehta", "Bose", "Khan", "Rao", "Pillai", "Joshi"]
+SUBJECTS = ["Data Protection", "Corporate Governance", "Green Energy", "Telecommunications", "Consumer Protection",
+            "Digital Payments", "Public Health", "Higher Education", "Labour Codes", "Urban Mobility"]
+TOPICS = ["reporting obligations", "penalty provisions", "licensing requirements", "data localisation",
+          "independent oversight", "compliance timelines", "subsidy eligibility", "grievance redressal",
+          "tax incentives", "audit procedures", "disclosure norms", "appeal mechanisms", "exemptions for startups",
+          "cross-border transfers", "consent requirements", "enforcement powers"]
+CONCERNS = ["compliance costs for small businesses", "ambiguity in the definitions", "the lack of a transition period",
+            "the burden on state governments", "privacy of citizens", "transparency of the process",
+            "the impact on innovation", "enforcement capacity", "access for rural citizens", "investor confidence"]
+STANCE_SENTENCES = {
+    "In Agreement": ["I fully support the provisions on {topic}.", "The approach to {topic} is a welcome step.",
+                     "We commend the ministry for addressing {topic}."],
+    "Implicit Agreement": ["The section on {topic} seems reasonable overall.", "I have no major objection to {topic}."],
+    "Suggest modification": ["The provisions on {topic} need to be revised.", "We suggest clarifying {topic} before notification.",
+                             "A phased approach to {topic} would work better."],
+    "Suggest removal": ["The clause on {topic} should be dropped entirely.", "We strongly oppose the provisions on {topic}.",
+                        "This section on {topic} is unworkable and must be removed."],
+}
+BODY_SENTENCES = ["It does not adequately consider {concern}.", "Experience in other countries shows the importance of {concern}.",
+                  "The draft should explicitly address {concern}.", "Stakeholders have repeatedly raised {concern}.",
+                  "Any final rule must balance {topic} against {concern}.", "Clear guidance on {topic} would reduce {concern}."]
+GREETINGS = ["", "", "Dear Sir/Madam, ", "To the Ministry, ", "Respected Committee, "]
+
+
+def zipf_cum_weights(count, exponent):
+    """Cumulative Zipf weights over 'count' ranks, for random.choices(cum_weights=...)."""
+    return list(accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def check_allowed(conn):
+    """The generator's category values must satisfy the schema's CHECK constraints."""
+    for table, column, values in (("comments", "action_type", ACTION_WEIGHTS), ("users", "industry", INDUSTRY_WEIGHTS)):
+        unknown = set(values) - TableSpec(conn, table).allowed[column]
+        if unknown:
+            raise ValueError(f"{table}.{column} does not allow {sorted(unknown)}; update the generator's weights.")
+
+
+class CorpusGenerator:
+    """
+    Deterministic (for a given seed and size) generator of drafts, sections,
+    users, submissions and comments. Rows are produced lazily so any size can
+    be streamed into the database in bounded memory.
+    """
+
+    def __init__(self, comments, seed=SEED, labelled_share=0.0):
+        self.rng = random.Random(seed)
+        self.comments = comments
+        self.labelled_share = labelled_share
+        self.draft_count = max(3, round(comments ** (1 / 3) / 4))
+        self.user_count = max(10, comments // COMMENTS_PER_USER)
+        self.sections = {}   # draft_id -> [(section_id, topic)]
+        self.campaigns = {}  # draft_id -> [(section_id, action_type, text)]
+
+    def comment_text(self, action_type, topic):
+        rng = self.rng
+        sentences = [rng.choice(STANCE_SENTENCES[action_type]).format(topic=topic)]
+        # Mostly short comments with a long tail of essays.
+        for _ in range(min(int(rng.expovariate(0.5)) + 1, 12)):
+            sentences.append(rng.choice(BODY_SENTENCES).format(topic=topic, concern=rng.choice(CONCERNS)))
+        return " ".join(sentences)
+
+    def drafts(self):
+        rng = self.rng
+        section_id = 0
+        for draft_id in range(1, self.draft_count + 1):
+            subject = SUBJECTS[(draft_id - 1) % len(SUBJECTS)]
+            title = f"The {subject} Bill, {2025 + (draft_id - 1) // len(SUBJECTS)} (Draft {draft_id})"
+            yield "drafts", (draft_id, title, f"A framework for {subject.lower()}.", START_DATE.strftime("%Y-%m-%d %H:%M:%S"))
+            self.sections[draft_id] = []
+            for number in range(1, rng.randint(*SECTIONS_PER_DRAFT) + 1):
+                section_id += 1
+                topic = rng.choice(TOPICS)
+                self.sections[draft_id].append((section_id, topic))
+                yield "sections", (section_id, draft_id, f"Section {number}: {topic.capitalize()} (Draft {draft_id})",
+                                   f"Provisions of the {subject} Bill on {topic}.")
+            section_weights = zipf_cum_weights(len(self.sections[draft_id]), SECTION_SKEW)
+            self.campaigns[draft_id] = []
+            for _ in range(CAMPAIGNS_PER_DRAFT):
+                section, topic = rng.choices(self.sections[draft_id], cum_weights=section_weights)[0]
+                action_type = rng.choice(["Suggest removal", "Suggest modification", "In Agreement"])
+                self.campaigns[draft_id].append((section, action_type, self.comment_text(action_type, topic)))
+
+    def users(self):
+        rng = self.rng
+        states, state_weights = zip(*STATE_WEIGHTS.items())
+        industries, industry_weights = zip(*INDUSTRY_WEIGHTS.items())
+        for user_id in range(1, self.user_count + 1):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            is_organization = rng.random() < ORGANIZATION_SHARE
+            yield "users", (
+                user_id, first, last, f"{first}.{last}.{user_id}@example.org".lower(), f"9{user_id:09d}"[-10:],
+                None, "India", rng.choices(states, state_weights)[0], int(is_organization),
+                f"{last} {rng.choice(['Industries', 'Foundation', 'Associates', 'Technologies'])}" if is_organization else None,
+                rng.choices(industries, industry_weights)[0] if is_organization else None,
+            )
+
+    def submissions_and_comments(self):
+        rng = self.rng
+        draft_weights = zipf_cum_weights(self.draft_count, DRAFT_SKEW)
+        user_weights = zipf_cum_weights(self.user_count, USER_SKEW)
+        section_weights = {draft_id: zipf_cum_weights(len(sections), SECTION_SKEW) for draft_id, sections in self.sections.items()}
+        campaign_weights = zipf_cum_weights(CAMPAIGNS_PER_DRAFT, 1.0)
+        actions, action_weights = zip(*ACTION_WEIGHTS.items())
+        draft_ids = list(self.sections)
+        user_ids = range(1, self.user_count + 1)
+
+        submission_id, comment_id = 0, 0
+        while comment_id < self.comments:
+            submission_id += 1
+            draft_id = rng.choices(draft_ids, cum_weights=draft_weights)[0]
+            # Submissions bunch up towards the consultation deadline.
+            submitted = START_DATE + timedelta(days=CONSULTATION_DAYS * rng.betavariate(2, 0.8))
+            submitted_at = submitted.strftime("%Y-%m-%d %H:%M:%S")
+            yield "submissions", (submission_id, rng.choices(user_ids, cum_weights=user_weights)[0], draft_id,
+                                  int(rng.random() < 0.9), "completed", submitted_at)
+
+            for _ in range(min(1 + int(rng.expovariate(1 / (COMMENTS_PER_SUBMISSION - 1))), self.comments - comment_id)):
+                comment_id += 1
+                if rng.random() < CAMPAIGN_SHARE:
+                    section_id, action_type, text = rng.choices(self.campaigns[draft_id], cum_weights=campaign_weights)[0]
+                    text = f"{rng.choice(GREETINGS)}{text}" + (f" Regards, {rng.choice(FIRST_NAMES)}." if rng.random() < 0.5 else "")
+                else:
+                    section_id, topic = rng.choices(self.sections[draft_id], cum_weights=section_weights[draft_id])[0]
+                    action_type = rng.choices(actions, action_weights)[0]
+                    text = self.comment_text(action_type, topic)
+                if action_type == "In Agreement" and rng.random() < EMPTY_AGREEMENT_SHARE:
+                    text = None
+
+                label = score = summary = None
+                if rng.random() < self.labelled_share:
+                    labels, weights = zip(*LABEL_WEIGHTS[action_type].items())
+                    label = rng.choices(labels, weights)[0]
+                    score = round(rng.uniform(0.5, 1.0), 4)
+                    summary = text.split(".")[0].capitalize() if text else None
+                yield "comments", (comment_id, submission_id, section_id, action_type, text, submitted_at, label, score, summary)
+
+    def rows(self):
+        """Yields (table, row) in foreign-key order."""
+        yield from self.drafts()
+        yield from self.users()
+        yield from self.submissions_and_comments()
+
+
+INSERT_QUERIES = {
+    "drafts": "INSERT INTO drafts (draft_id, title, description, created_at) VALUES (?, ?, ?, ?)",
+    "sections": "INSERT INTO sections (section_id, draft_id, section_title, section_content) VALUES (?, ?, ?, ?)",
+    "users": """INSERT INTO users (user_id, first_name, last_name, email, phone, address, country, state,
+                is_organization, organization_name, industry) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    "submissions": """INSERT INTO submissions (submission_id, user_id, draft_id, otp_verified, submission_status, submitted_at)
+                      VALUES (?, ?, ?, ?, ?, ?)""",
+    "comments": """INSERT INTO comments (comment_id, submission_id, section_id, action_type, comment_text, created_at,
+                   sentiment_label, sentiment_score, ai_summary) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+}
+
+
+def generate_corpus(database_file, comments=DEFAULT_COMMENTS, seed=SEED, labelled_share=0.0, chunk_rows=CHUNK_ROWS):
+    """
+    Writes a synthetic corpus of 'comments' comments to a new database file.
+    Indexes and per-row triggers are dropped while writing and rebuilt once at
+    the end, like bulk_load_csv.py does. Returns the row count per table.
+    """
+    if os.path.exists(database_file):
+        raise FileExistsError(f"'{database_file}' already exists; the generator only writes new databases.")
+
+    conn = sqlite3.connect(database_file)
+    try:
+        for statement in (CREATE_DRAFTS_TABLE, CREATE_SECTIONS_TABLE, CREATE_USERS_TABLE,
+                          CREATE_SUBMISSIONS_TABLE, CREATE_COMMENTS_TABLE):
+            conn.execute(statement)
+        migrate_schema(conn)
+        check_allowed(conn)
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
+        # Generated rows are not changes anyone needs to export incrementally.
+        change_triggers = [f"trg_changes_{table}_{event}" for table in CHANGE_TRACKED_TABLES for event in ("insert", "update", "delete")]
+        for trigger in DEFERRED_TRIGGERS + change_triggers:
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+        for index_name in index_names(CREATE_INDEXES):
+            conn.execute(f"DROP INDEX IF EXISTS {index_name};")
+        conn.commit()
+
+        started = time.perf_counter()
+        counts = dict.fromkeys(INSERT_QUERIES, 0)
+        buffers = {table: [] for table in INSERT_QUERIES}
+
+        def flush(table):
+            with conn:
+                conn.executemany(INSERT_QUERIES[table], buffers[table])
+            counts[table] += len(buffers[table])
+            buffers[table].clear()
+
+        for table, row in CorpusGenerator(comments, seed, labelled_share).rows():
+            buffers[table].append(row)
+            if len(buffers[table]) >= chunk_rows:
+                # Parents go first so every committed chunk satisfies the foreign keys.
+                for parent in ("submissions", table) if table == "comments" else (table,):
+                    flush(parent)
+        for table in INSERT_QUERIES:
+            flush(table)
+
+        print("Rebuilding indexes, triggers, the sentiment cube and the search index...")
+        rebuild_sentiment_cube(conn)
+        rebuild_search_index(conn)
+        migrate_schema(conn)
+        for pragma in RESTORE_PRAGMAS:
+            conn.execute(pragma)
+        bump_draft_generations(conn)
+        elapsed = time.perf_counter() - started
+        print(f"Generated {', '.join(f'{count} {table}' for table, count in counts.items())} in {elapsed:.1f}s.")
+        return counts
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic consultation corpus.")
+    parser.add_argument("database_file", help="New database file to write.")
+    parser.add_argument("--comments", type=int, default=DEFAULT_COMMENTS, help="Number of comments to generate.")
+    parser.add_argument("--seed", type=int, default=SEED, help="Random seed; the same seed and size give the same corpus.")
+    parser.add_argument("--labelled", type=float, default=0.0,
+                        help="Share of comments pre-filled with a sentiment label and summary (0-1).")
+    args = parser.parse_args()
+    generate_corpus(args.database_file, args.comments, args.seed, args.labelled)
@@ -0,0 +1,41 @@
+import os
+import sys
+import sqlite3
+import pytest
+
+# The scripts are top-level modules in the repository root.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import database_setup
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    """A fresh database with the current schema and database_setup.py's seed data."""
+    database_file = str(tmp_path / "econsultation.db")
+    database_setup.setup_database(database_file)
+    return database_file
+
+
+@pytest.fixture
+def db(db_file):
+    conn = sqlite3.connect(db_file)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """Returns a function giving a test client of the dashboard backend serving a database file."""
+    monkeypatch.syspath_prepend(os.path.join(REPO_ROOT, "backend"))
+    backend = pytest.importorskip("app")
+    from response_cache import ResponseCache
+
+    def client_for(database_file):
+        monkeypatch.setattr(backend, "DATABASE_FILE", database_file)
+        monkeypatch.setattr(backend, "_pool", None)
+        monkeypatch.setattr(backend, "response_cache", ResponseCache())
+        return backend.app.test_client()
+
+    return client_for
@@ -0,0 +1,52 @@
+import os
+import shutil
+import sqlite3
+import pytest
+import database_setup
+from database_setup import migrate_schema
+
+# The database shipped with the backend predates the analysis tables.
+SHIPPED_DATABASE = os.path.join(os.path.dirname(os.path.abspath(database_setup.__file__)), "backend", "econsultation.db")
+
+NEEDS_MIGRATION = [
+    "/api/aggregates/1",
+    "/api/aggregates/1/sentiment-by-section",
+    "/api/map-data/1",
+    "/api/terms/1",
+    "/api/campaigns/1",
+    "/api/search?q=data",
+]
+
+
+@pytest.fixture
+def shipped_db(tmp_path):
+    database_file = str(tmp_path / "econsultation.db")
+    shutil.copy(SHIPPED_DATABASE, database_file)
+    conn = sqlite3.connect(database_file)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'comment_sentiment_cube'").fetchone():
+        pytest.skip("the shipped database is already migrated")
+    conn.close()
+    return database_file
+
+
+@pytest.mark.parametrize("url", NEEDS_MIGRATION)
+def test_unmigrated_database_answers_503_with_the_fix(serve, shipped_db, url):
+    response = serve(shipped_db).get(url)
+    assert response.status_code == 503
+    assert "database_setup.py --db" in response.get_json()["error"]
+
+
+def test_projection_only_offers_existing_columns(serve, shipped_db):
+    client = serve(shipped_db)
+    assert client.get("/api/comments/1?fields=comment_id,cluster_id").status_code == 400
+    response = client.get("/api/comments/1?fields=comment_id,sentiment_label")
+    assert response.status_code == 200
+    assert response.get_json() and set(response.get_json()[0]) == {"comment_id", "sentiment_label"}
+
+
+@pytest.mark.parametrize("url", NEEDS_MIGRATION + ["/api/comments/1?fields=comment_id,cluster_id"])
+def test_migrated_database_serves_every_endpoint(serve, shipped_db, url):
+    conn = sqlite3.connect(shipped_db)
+    migrate_schema(conn)
+    conn.close()
+    assert serve(shipped_db).get(url).status_code == 200
@@ -0,0 +1,107 @@
+import csv
+import pytest
+from bulk_load_csv import bulk_load, normalize_timestamp
+
+COMMENT_COLUMNS = ["comment_id", "submission_id", "section_id", "action_type", "comment_text",
+                   "created_at", "sentiment_label", "ai_summary"]
+
+
+def write_comments(csv_dir, rows):
+    with open(csv_dir / "comments.csv", "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(COMMENT_COLUMNS)
+        writer.writerows(rows)
+
+
+def exported_row(conn, comment_id, **changes):
+    """A comments.csv row holding the comment as it is stored, with 'changes' applied."""
+    values = dict(zip(COMMENT_COLUMNS, conn.execute(
+        f"SELECT {', '.join(COMMENT_COLUMNS)} FROM comments WHERE comment_id = ?", (comment_id,)
+    ).fetchone()))
+    values.update(changes)
+    return ["" if values[column] is None else values[column] for column in COMMENT_COLUMNS]
+
+
+def comment(conn, comment_id, *columns):
+    return conn.execute(f"SELECT {', '.join(columns)} FROM comments WHERE comment_id = ?", (comment_id,)).fetchone()
+
+
+@pytest.fixture
+def analysed(db):
+    """The seed database with comments 1 to 3 labelled and summarized."""
+    db.execute("UPDATE comments SET sentiment_label = 'Positive', sentiment_score = 0.9, ai_summary = 'Old summary.' "
+               "WHERE comment_id IN (1, 2, 3)")
+    db.commit()
+    return db
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2025-09-29 05:55:00", "2025-09-29 05:55:00"),
+    ("2025-09-29T05:55", "2025-09-29 05:55:00"),
+    ("2025-09-29 05:55:00.123456", "2025-09-29 05:55:00.123"),
+    ("2025-09-29T11:25:00+05:30", "2025-09-29 05:55:00"),
+    ("9/29/2025 5:55", "2025-09-29 05:55:00"),
+    ("9/29/2025 5:55:07", "2025-09-29 05:55:07"),
+    ("9/29/2025", "2025-09-29 00:00:00"),
+])
+def test_timestamps_are_stored_as_iso_8601(value, expected):
+    assert normalize_timestamp(value) == expected
+
+
+def test_unreadable_timestamps_are_rejected(db_file, db, tmp_path):
+    write_comments(tmp_path, [[1001, 101, 1, "In Agreement", "Agreed.", "next Tuesday", "", ""]])
+    bulk_load(str(tmp_path), db_file)
+    assert comment(db, 1001, "comment_id") is None
+    with open(tmp_path / "comments.csv.rejects.csv", encoding="utf-8") as rejects:
+        assert "created_at" in rejects.read()
+
+
+def test_insert_mode_skips_existing_keys(db_file, analysed, tmp_path):
+    write_comments(tmp_path, [
+        exported_row(analysed, 1, comment_text="Replaced text."),
+        [1001, 101, 1, "In Agreement", "Agreed.", "9/29/2025 5:55", "", ""],
+    ])
+    bulk_load(str(tmp_path), db_file)
+    assert comment(analysed, 1, "comment_text") != ("Replaced text.",)
+    assert comment(analysed, 1001, "comment_text", "created_at") == ("Agreed.", "2025-09-29 05:55:00")
+
+
+def test_upsert_leaves_redelivered_rows_alone(db_file, analysed, tmp_path):
+    # Empty derived fields in the file do not blank out the stored results.
+    write_comments(tmp_path, [exported_row(analysed, 1, sentiment_label="", ai_summary="")])
+    bulk_load(str(tmp_path), db_file, upsert=True)
+    assert comment(analysed, 1, "sentiment_label", "ai_summary", "updated_at") == ("Positive", "Old summary.", None)
+
+
+def test_upsert_updates_plain_columns_and_keeps_results(db_file, analysed, tmp_path):
+    write_comments(tmp_path, [exported_row(analysed, 1, action_type="Suggest removal")])
+    bulk_load(str(tmp_path), db_file, upsert=True)
+    assert comment(analysed, 1, "action_type", "sentiment_label", "ai_summary", "updated_at") == \
+        ("Suggest removal", "Positive", "Old summary.", None)
+
+
+def test_edited_text_resets_the_derived_columns(db_file, analysed, tmp_path):
+    # The file still carries the results for the old text; they are dropped too.
+    write_comments(tmp_path, [
+        exported_row(analysed, 2, comment_text="An entirely rewritten comment."),
+        exported_row(analysed, 3, comment_text="Another rewritten comment.", sentiment_label="", ai_summary=""),
+    ])
+    bulk_load(str(tmp_path), db_file, upsert=True)
+    for comment_id in (2, 3):
+        label, score, summary, updated_at = comment(analysed, comment_id, "sentiment_label", "sentiment_score",
+                                                    "ai_summary", "updated_at")
+        assert (label, score, summary) == (None, None, None)
+        assert updated_at is not None
+    assert comment(analysed, 1, "sentiment_label") == ("Positive",)
+
+
+def test_load_rebuilds_the_cube_and_search_index(db_file, analysed, tmp_path):
+    write_comments(tmp_path, [
+        exported_row(analysed, 2, comment_text="Photovoltaic rooftops deserve subsidies."),
+        [1001, 101, 1, "In Agreement", "Agreed.", "", "", ""],
+    ])
+    bulk_load(str(tmp_path), db_file, upsert=True)
+    total = analysed.execute("SELECT SUM(comment_count) FROM comment_sentiment_cube").fetchone()[0]
+    assert total == analysed.execute("SELECT COUNT(*) FROM comments").fetchone()[0]
+    hits = analysed.execute("SELECT rowid FROM comment_search WHERE comment_search MATCH 'photovoltaic'").fetchall()
+    assert hits == [(2,)]
@@ -0,0 +1,57 @@
+from database_setup import bump_draft_generations, bump_comment_drafts
+
+
+def generations(conn):
+    return dict(conn.execute("SELECT draft_id, generation FROM draft_generations").fetchall())
+
+
+def test_bump_counts_per_draft(db):
+    start = generations(db)
+    bump_draft_generations(db, [1])
+    bump_draft_generations(db, [1, 1, 3])
+    after = generations(db)
+    assert after[1] == start.get(1, 0) + 2
+    assert after[3] == start.get(3, 0) + 1
+    assert after.get(2, 0) == start.get(2, 0)
+
+
+def test_bump_without_drafts_bumps_them_all(db):
+    start = generations(db)
+    bump_draft_generations(db)
+    after = generations(db)
+    for draft_id, in db.execute("SELECT draft_id FROM drafts"):
+        assert after[draft_id] == start.get(draft_id, 0) + 1
+
+
+def test_comment_bump_covers_the_submission_and_section_drafts(db):
+    # Comment 1: submission 101 (draft 1), section 1 (draft 1).
+    db.execute("UPDATE comments SET submission_id = 103 WHERE comment_id = 1")  # submission 103: draft 2
+    db.commit()
+    start = generations(db)
+    bump_comment_drafts(db, [1])
+    after = generations(db)
+    assert after[1] == start.get(1, 0) + 1
+    assert after[2] == start.get(2, 0) + 1
+    assert after.get(3, 0) == start.get(3, 0)
+
+
+def test_comment_bump_of_no_comments_changes_nothing(db):
+    start = generations(db)
+    bump_comment_drafts(db, [])
+    assert generations(db) == start
+
+
+def test_etag_changes_only_with_its_drafts_generation(serve, db_file, db):
+    client = serve(db_file)
+    first = client.get("/api/sections/1")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert client.get("/api/sections/1", headers={"If-None-Match": etag}).status_code == 304
+
+    bump_draft_generations(db, [2])
+    assert client.get("/api/sections/1", headers={"If-None-Match": etag}).status_code == 304
+
+    bump_draft_generations(db, [1])
+    changed = client.get("/api/sections/1", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
@@ -0,0 +1,82 @@
+import json
+import hashlib
+import pytest
+from inference_cache import InferenceCache, normalize_text
+
+MODEL = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+PARAMS = {"truncation": True}
+
+
+class FakePipeline:
+    """Stands in for a loaded pipeline; only its backend marker matters to the cache."""
+
+    def __init__(self, inference_backend=None):
+        if inference_backend:
+            self.inference_backend = inference_backend
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "inference_cache.db")
+
+
+@pytest.fixture
+def open_cache(cache_path):
+    caches = []
+
+    def make(**kwargs):
+        cache = InferenceCache(MODEL, "sentiment-analysis", "main", path=cache_path, **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def test_pytorch_keys_keep_their_original_form(open_cache):
+    text_hash = hashlib.sha256(normalize_text("Good idea.").encode("utf-8")).hexdigest()
+    identity = json.dumps([MODEL, "main", "sentiment-analysis", PARAMS, text_hash], sort_keys=True, default=str)
+    assert open_cache(backend="pytorch").key_for("Good idea.", PARAMS) == hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def test_each_backend_has_its_own_keys(open_cache):
+    keys = {backend: open_cache(backend=backend).key_for("Good idea.", PARAMS)
+            for backend in ("pytorch", "onnx", "onnx-int8")}
+    assert len(set(keys.values())) == 3
+
+
+def test_results_are_not_shared_across_backends(open_cache):
+    open_cache(backend="onnx-int8").put("Good idea.", {"label": "positive"}, PARAMS)
+    assert open_cache(backend="pytorch").get("Good idea.", PARAMS) is None
+    assert open_cache(backend="onnx").get("Good idea.", PARAMS) is None
+    assert open_cache(backend="onnx-int8").get("Good idea.", PARAMS) == {"label": "positive"}
+
+
+def test_the_pipelines_backend_wins(open_cache):
+    # An ONNX model that fell back to PyTorch is keyed as PyTorch.
+    fallen_back = open_cache(backend="onnx", pipeline=FakePipeline())
+    assert fallen_back.key_for("Good idea.", PARAMS) == open_cache(backend="pytorch").key_for("Good idea.", PARAMS)
+    onnx = open_cache(backend="pytorch", pipeline=FakePipeline("onnx"))
+    assert onnx.key_for("Good idea.", PARAMS) == open_cache(backend="onnx").key_for("Good idea.", PARAMS)
+
+
+def test_key_covers_params_and_normalized_text(open_cache):
+    cache = open_cache(backend="pytorch")
+    assert cache.key_for("Good   idea.\n", PARAMS) == cache.key_for("Good idea.", PARAMS)
+    assert cache.key_for("Good idea.", PARAMS) != cache.key_for("Good idea.", {"truncation": False})
+    assert cache.key_for("Good idea.", PARAMS) != cache.key_for("Bad idea.", PARAMS)
+
+
+def test_get_or_compute_runs_the_model_once(open_cache):
+    cache = open_cache(backend="onnx")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"label": "neutral"}
+
+    assert cache.get_or_compute("Fine.", PARAMS, compute) == {"label": "neutral"}
+    assert cache.get_or_compute("Fine.", PARAMS, compute) == {"label": "neutral"}
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,107 @@
+import hashlib
+import numpy as np
+import pytest
+import near_duplicates
+from near_duplicates import cluster_comments, fan_out_to_members
+from database_setup import bump_comment_drafts
+
+# The sentiment fan-out of analyze_sentiments.py.
+SENTIMENT_COLUMNS = ["sentiment_label", "sentiment_score", "sentiment_tier"]
+MEMBER_UNLABELLED = "comments.sentiment_label IS NULL"
+CANONICAL_LABELLED = "canonical.sentiment_label IS NOT NULL AND canonical.sentiment_label != 'Error'"
+
+
+def fake_embed_texts(texts):
+    """
+    Stands in for the sentence model: texts that only differ in case, spacing
+    and punctuation get the same unit vector, other texts unrelated random ones.
+    """
+    vectors = []
+    for text in texts:
+        letters = "".join(ch for ch in text.lower() if ch.isalnum())
+        seed = int(hashlib.sha256(letters.encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(64)
+        vectors.append(vector / np.linalg.norm(vector))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+@pytest.fixture
+def embed(monkeypatch):
+    monkeypatch.setattr(near_duplicates, "embed_texts", fake_embed_texts)
+
+
+def add_comments(conn, rows):
+    """Adds (comment_id, submission_id, section_id, text) comments."""
+    conn.executemany("""INSERT INTO comments (comment_id, submission_id, section_id, action_type, comment_text)
+                        VALUES (?, ?, ?, 'Suggest removal', ?)""", rows)
+    conn.commit()
+
+
+def clusters(conn, comment_ids):
+    placeholders = ",".join("?" * len(comment_ids))
+    return dict(conn.execute(f"SELECT comment_id, cluster_id FROM comments WHERE comment_id IN ({placeholders})",
+                             comment_ids).fetchall())
+
+
+def test_copies_share_a_cluster_per_section(db, embed):
+    add_comments(db, [
+        (1001, 108, 7, "Scrap the solar subsidy!"),
+        (1002, 111, 7, "scrap the solar subsidy"),
+        (1003, 108, 7, "Scrap  the Solar Subsidy."),
+        (1004, 111, 7, "Double the solar subsidy."),
+        (1005, 108, 8, "Scrap the solar subsidy!"),  # same text, other section
+    ])
+    cluster_comments(db)
+    assert clusters(db, [1001, 1002, 1003, 1004, 1005]) == {
+        1001: 1001, 1002: 1001, 1003: 1001, 1004: 1004, 1005: 1005,
+    }
+    assert not db.execute("SELECT 1 FROM comments WHERE cluster_id IS NULL AND comment_text != ''").fetchone()
+    # Only canonicals keep an embedding.
+    stored = {row[0] for row in db.execute("SELECT comment_id FROM comment_embeddings")}
+    assert {1001, 1004, 1005} <= stored and not {1002, 1003} & stored
+
+
+def test_later_copies_join_the_stored_cluster(db, embed):
+    add_comments(db, [(1001, 108, 7, "Scrap the solar subsidy!")])
+    cluster_comments(db)
+    add_comments(db, [(1002, 111, 7, "SCRAP the solar subsidy")])
+    assert cluster_comments(db) == 1
+    assert clusters(db, [1002]) == {1002: 1001}
+
+
+def test_editing_a_canonical_requeues_its_cluster(db, embed):
+    add_comments(db, [(1001, 108, 7, "Scrap the solar subsidy!"), (1002, 111, 7, "scrap the solar subsidy")])
+    cluster_comments(db)
+    db.execute("UPDATE comments SET comment_text = 'Keep the solar subsidy.' WHERE comment_id = 1001")
+    db.commit()
+    assert clusters(db, [1001, 1002]) == {1001: None, 1002: None}
+    assert not db.execute("SELECT 1 FROM comment_embeddings WHERE comment_id = 1001").fetchone()
+
+
+def test_fan_out_copies_the_canonicals_results(db):
+    # Comment 1 is the canonical of 4 and 6; comment 8 is a canonical without a label yet, 18 its member.
+    db.executescript("""
+        UPDATE comments SET cluster_id = 1 WHERE comment_id IN (1, 4, 6);
+        UPDATE comments SET cluster_id = 8 WHERE comment_id IN (8, 18);
+        UPDATE comments SET sentiment_label = 'Negative', sentiment_score = 0.8, sentiment_tier = 'high' WHERE comment_id = 1;
+        UPDATE comments SET sentiment_label = 'Positive', sentiment_score = 0.7 WHERE comment_id = 6;
+    """)
+    copied = fan_out_to_members(db, SENTIMENT_COLUMNS, MEMBER_UNLABELLED, CANONICAL_LABELLED)
+    assert copied == [4]
+    labels = dict(db.execute("SELECT comment_id, sentiment_label FROM comments WHERE comment_id IN (1, 4, 6, 8, 18)"))
+    assert labels == {1: "Negative", 4: "Negative", 6: "Positive", 8: None, 18: None}
+    assert db.execute("SELECT sentiment_score, sentiment_tier FROM comments WHERE comment_id = 4").fetchone() == (0.8, "high")
+    assert fan_out_to_members(db, SENTIMENT_COLUMNS, MEMBER_UNLABELLED, CANONICAL_LABELLED) == []
+
+
+def test_fan_out_bumps_only_the_members_drafts(db):
+    # Submission 112 is in draft 2 and section 1 in draft 1; draft 3 gets no copies.
+    add_comments(db, [(1001, 112, 1, "Scrap the mandate.")])
+    db.executescript("""
+        UPDATE comments SET cluster_id = 1 WHERE comment_id IN (1, 1001);
+        UPDATE comments SET sentiment_label = 'Negative' WHERE comment_id = 1;
+    """)
+    before = dict(db.execute("SELECT draft_id, generation FROM draft_generations"))
+    bump_comment_drafts(db, fan_out_to_members(db, SENTIMENT_COLUMNS, MEMBER_UNLABELLED, CANONICAL_LABELLED))
+    after = dict(db.execute("SELECT draft_id, generation FROM draft_generations"))
+    assert {draft_id for draft_id in after if after[draft_id] != before.get(draft_id, 0)} == {1, 2}
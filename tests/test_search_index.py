@@ -0,0 +1,87 @@
+import sqlite3
+import pytest
+from database_setup import migrate_schema
+
+
+def search(conn, query):
+    return [row[0] for row in conn.execute(
+        "SELECT rowid FROM comment_search WHERE comment_search MATCH ? ORDER BY rowid", (query,)
+    )]
+
+
+def assert_in_sync(conn):
+    """FTS5's integrity check compares the index with comment_search_source."""
+    conn.execute("INSERT INTO comment_search (comment_search, rank) VALUES ('integrity-check', 1)")
+
+
+def test_existing_comments_are_indexed(db):
+    # Comment 4: "Oh, absolutely, data localisation is a fantastic idea! ..."
+    assert 4 in search(db, "localisation")
+    assert_in_sync(db)
+
+
+def test_insert_is_indexed_with_its_section_title(db):
+    db.execute("""INSERT INTO comments (comment_id, submission_id, section_id, action_type, comment_text)
+                  VALUES (1001, 101, 7, 'In Agreement', 'Photovoltaic rooftops are welcome.')""")
+    db.commit()
+    assert search(db, "photovoltaic") == [1001]
+    assert 1001 in search(db, 'section_title : "solar power"')
+    assert_in_sync(db)
+
+
+def test_text_edit_replaces_the_old_terms(db):
+    assert 1 in search(db, "sovereignty")
+    db.execute("UPDATE comments SET comment_text = 'Photovoltaic rooftops are welcome.' WHERE comment_id = 1")
+    db.commit()
+    assert search(db, "photovoltaic") == [1]
+    assert 1 not in search(db, "sovereignty")
+    assert_in_sync(db)
+
+
+def test_summary_is_searchable(db):
+    db.execute("UPDATE comments SET ai_summary = 'Favours geothermal incentives.' WHERE comment_id = 2")
+    db.commit()
+    assert search(db, "ai_summary : geothermal") == [2]
+    db.execute("UPDATE comments SET ai_summary = NULL WHERE comment_id = 2")
+    db.commit()
+    assert search(db, "geothermal") == []
+    assert_in_sync(db)
+
+
+def test_delete_forgets_the_comment(db):
+    db.execute("UPDATE comments SET comment_text = 'Photovoltaic rooftops are welcome.' WHERE comment_id = 1")
+    db.execute("DELETE FROM comments WHERE comment_id = 1")
+    db.commit()
+    assert search(db, "photovoltaic") == []
+    assert_in_sync(db)
+
+
+def test_section_retitle_reindexes_its_comments(db):
+    in_section = [row[0] for row in db.execute("SELECT comment_id FROM comments WHERE section_id = 7 ORDER BY comment_id")]
+    db.execute("UPDATE sections SET section_title = 'Section 4: Heliostat Subsidies' WHERE section_id = 7")
+    db.commit()
+    assert search(db, "heliostat") == in_section
+    assert not set(search(db, 'section_title : "solar power"')) & set(in_section)
+    assert_in_sync(db)
+
+
+def test_stemming_matches_word_forms(db):
+    db.execute("UPDATE comments SET comment_text = 'These regulations overreach.' WHERE comment_id = 1")
+    db.commit()
+    assert 1 in search(db, "regulation")
+
+
+def test_rank_weights_are_written_once(db):
+    config = db.execute("SELECT v FROM comment_search_config WHERE k = 'rank'").fetchone()
+    assert config == ("bm25(1.0, 0.5, 0.2)",)
+    changes = db.total_changes
+    migrate_schema(db)
+    assert db.total_changes == changes
+
+
+def test_integrity_check_catches_a_stale_index(db):
+    # Guards the helper above: a write that bypasses the triggers is detected.
+    db.execute("DROP TRIGGER trg_search_comment_update")
+    db.execute("UPDATE comments SET comment_text = 'Photovoltaic rooftops are welcome.' WHERE comment_id = 1")
+    with pytest.raises(sqlite3.DatabaseError):
+        assert_in_sync(db)
@@ -0,0 +1,82 @@
+from database_setup import rebuild_sentiment_cube
+
+
+def cube_counts(conn):
+    """The cube's non-empty cells, as {(draft, section, state, industry, action, sentiment): count}."""
+    rows = conn.execute("SELECT * FROM comment_sentiment_cube WHERE comment_count != 0").fetchall()
+    return {row[:6]: row[6] for row in rows}
+
+
+def assert_matches_rebuild(conn):
+    """The trigger-maintained cube equals one recomputed from the comments."""
+    maintained = cube_counts(conn)
+    rebuild_sentiment_cube(conn)
+    assert maintained == cube_counts(conn)
+
+
+def test_cube_counts_every_comment(db):
+    total = db.execute("SELECT SUM(comment_count) FROM comment_sentiment_cube").fetchone()[0]
+    assert total == db.execute("SELECT COUNT(*) FROM comments").fetchone()[0]
+    assert not db.execute("SELECT 1 FROM comment_sentiment_cube WHERE comment_count < 0").fetchone()
+
+
+def test_comments_count_for_their_submissions_draft(db):
+    # Submission 112 belongs to draft 2, section 1 to draft 1.
+    before = cube_counts(db)
+    db.execute("""INSERT INTO comments (comment_id, submission_id, section_id, action_type, comment_text)
+                  VALUES (1001, 112, 1, 'In Agreement', 'Agreed.')""")
+    db.commit()
+    after = cube_counts(db)
+    changed = [cell for cell in after if after[cell] != before.get(cell, 0)]
+    assert [cell[:2] for cell in changed] == [(2, 1)]
+    assert_matches_rebuild(db)
+
+
+def test_insert_adds_one_to_its_cell(db):
+    before = cube_counts(db)
+    db.execute("""INSERT INTO comments (comment_id, submission_id, section_id, action_type, comment_text, sentiment_label)
+                  VALUES (1001, 101, 1, 'In Agreement', 'Agreed.', 'Positive')""")
+    db.commit()
+    after = cube_counts(db)
+    cell = (1, 1, *db.execute("""
+        SELECT COALESCE(u.state, ''), CASE WHEN u.industry IS NULL OR u.industry = '' THEN 'Individual' ELSE u.industry END
+        FROM submissions s JOIN users u ON s.user_id = u.user_id WHERE s.submission_id = 101
+    """).fetchone(), "In Agreement", "Positive")
+    assert after[cell] == before.get(cell, 0) + 1
+    assert sum(after.values()) == sum(before.values()) + 1
+    assert_matches_rebuild(db)
+
+
+def test_label_update_moves_the_count(db):
+    before = cube_counts(db)
+    db.execute("UPDATE comments SET sentiment_label = 'Negative' WHERE comment_id = 1")
+    db.commit()
+    after = cube_counts(db)
+    unlabelled = [cell for cell in before if cell[5] == "Unlabelled" and after.get(cell, 0) == before[cell] - 1]
+    negative = [cell for cell in after if cell[5] == "Negative" and after[cell] == before.get(cell, 0) + 1]
+    assert len(unlabelled) == 1 and len(negative) == 1
+    assert unlabelled[0][:5] == negative[0][:5]
+    assert sum(after.values()) == sum(before.values())
+    assert_matches_rebuild(db)
+
+
+def test_moving_a_comment_to_another_submission_moves_its_draft(db):
+    # Comment 1 is on submission 101 (draft 1); submission 103 belongs to draft 2.
+    db.execute("UPDATE comments SET submission_id = 103 WHERE comment_id = 1")
+    db.commit()
+    assert_matches_rebuild(db)
+
+
+def test_unrelated_update_leaves_the_cube_alone(db):
+    before = cube_counts(db)
+    db.execute("UPDATE comments SET ai_summary = 'A summary.' WHERE comment_id = 1")
+    db.commit()
+    assert cube_counts(db) == before
+
+
+def test_delete_removes_the_comments_counts(db):
+    before = cube_counts(db)
+    db.execute("DELETE FROM comments WHERE comment_id IN (1, 2)")
+    db.commit()
+    assert sum(cube_counts(db).values()) == sum(before.values()) - 2
+    assert_matches_rebuild(db)
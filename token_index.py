@@ -0,0 +1,177 @@
+import sqlite3
+import time
+import itertools
+from collections import Counter
+import spacy
+from nltk.util import ngrams
+from database_setup import migrate_schema, bump_draft_generations, PENDING_TERMS_QUERY, BUSY_TIMEOUT_SECONDS
+from db_streaming import iter_keyset_chunks
+
+# --- Configuration ---
+DATABASE_FILE = "econsultation.db"
+# Texts per nlp.pipe batch.
+NLP_BATCH_SIZE = 256
+
+# --- NLP Model Setup ---
+# Only the components needed for lemmas and POS tags are kept.
+NLP_DISABLED_COMPONENTS = ["parser", "ner", "senter"]
+nlp = None
+
+def get_nlp():
+    """Loads the spaCy model on first use, so runs with nothing to index never load it."""
+    global nlp
+    if nlp is None:
+        try:
+            nlp = spacy.load("en_core_web_sm", disable=NLP_DISABLED_COMPONENTS)
+        except OSError as e:
+            raise RuntimeError(
+                "Spacy model 'en_core_web_sm' not found. Please run 'python -m spacy download en_core_web_sm'"
+            ) from e
+    return nlp
+
+CUSTOM_STOP_WORDS = [
+    'user', 'comment', 'suggestion', 'propose', 'draft', 'legislation', 'amendment', 'provision',
+    'section', 'act', 'rule', 'mca', 'stakeholder', 'company', 'government', 'clause',
+    'say', 'propose', 'recommend', 'proviso', 'submit', 'state'
+]
+
+# Near-duplicates (see near_duplicates.py) are not tokenized themselves; they
+# get a copy of their cluster's canonical counts.
+TOKENIZE_QUERY = f"{PENDING_TERMS_QUERY} AND (c.cluster_id IS NULL OR c.cluster_id = c.comment_id)"
+# Near-duplicates whose canonical is indexed but who are not ('m' is the member).
+_MEMBERS_TO_COPY = """
+    m.cluster_id != m.comment_id
+    AND EXISTS (SELECT 1 FROM comment_terms_indexed i WHERE i.comment_id = m.cluster_id)
+    AND NOT EXISTS (SELECT 1 FROM comment_terms_indexed i WHERE i.comment_id = m.comment_id)
+"""
+
+
+def extract_meaningful_words(doc):
+    """Lemmatized content words of a spaCy doc, minus stop words and our custom list."""
+    return [
+        token.lemma_.lower() for token in doc
+        if not token.is_stop and not token.is_punct and token.pos_ in ['NOUN', 'PROPN', 'VERB', 'ADJ']
+        and token.lemma_.lower() not in CUSTOM_STOP_WORDS
+    ]
+
+
+def count_terms(words):
+    """Returns (ngram, term, count) rows for a comment's lemmas and lemma bigrams."""
+    unigrams = Counter(words)
+    bigrams = Counter(" ".join(pair) for pair in ngrams(words, 2))
+    return [(1, term, count) for term, count in unigrams.items()] + \
+           [(2, term, count) for term, count in bigrams.items()]
+
+
+def copy_terms_to_members(conn):
+    """
+    Gives every unindexed near-duplicate its canonical's term counts and word
+    count. Commits and returns the number of comments indexed this way.
+    """
+    with conn:
+        conn.execute(f"""
+            INSERT OR REPLACE INTO comment_terms (comment_id, ngram, term, term_count)
+            SELECT m.comment_id, t.ngram, t.term, t.term_count
+            FROM comments m JOIN comment_terms t ON t.comment_id = m.cluster_id
+            WHERE {_MEMBERS_TO_COPY}
+        """)
+        copied = conn.execute(f"""
+            INSERT INTO comment_terms_indexed (comment_id, word_count)
+            SELECT m.comment_id, canonical.word_count
+            FROM comments m JOIN comment_terms_indexed canonical ON canonical.comment_id = m.cluster_id
+            WHERE {_MEMBERS_TO_COPY}
+        """).rowcount
+    return copied
+
+
+def build_token_index(conn):
+    """
+    Tokenizes every comment not yet in the index with one nlp.pipe pass and
+    stores its term counts; near-duplicates get a copy of their canonical's.
+    Commits per page, so an interrupted run resumes where it stopped, and
+    bumps the draft generations when done. Returns the number of comments
+    indexed.
+    """
+    migrate_schema(conn)
+    pending = conn.execute(f"SELECT COUNT(*) FROM ({TOKENIZE_QUERY})").fetchone()[0]
+    if not pending:
+        copied = copy_terms_to_members(conn)
+        if copied:
+            bump_draft_generations(conn)
+        return copied
+
+    print(f"Tokenizing {pending} comments for the token index...")
+    started = time.perf_counter()
+    indexed = 0
+    for chunk in iter_keyset_chunks(conn, TOKENIZE_QUERY):
+        docs = get_nlp().pipe((row[1] for row in chunk), batch_size=NLP_BATCH_SIZE)
+        term_rows, indexed_rows = [], []
+        for (comment_id, text), doc in zip(chunk, docs):
+            term_rows.extend((comment_id, *term) for term in count_terms(extract_meaningful_words(doc)))
+            indexed_rows.append((comment_id, len(text.split())))
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO comment_terms (comment_id, ngram, term, term_count) VALUES (?, ?, ?, ?)", term_rows)
+            conn.executemany("INSERT OR REPLACE INTO comment_terms_indexed (comment_id, word_count) VALUES (?, ?)", indexed_rows)
+        indexed += len(chunk)
+    indexed += copy_terms_to_members(conn)
+
+    # /api/terms answers from this index, so its cached responses are stale now.
+    bump_draft_generations(conn)
+    elapsed = time.perf_counter() - started
+    print(f"Indexed {indexed} comments in {elapsed:.1f}s ({indexed / max(elapsed, 1e-9):.1f} comments/sec).")
+    return indexed
+
+
+def iter_term_counts(conn, group_column, where="1", params=()):
+    """
+    Sums the indexed term counts per value of 'group_column' (e.g. 's.draft_id',
+    'c.section_id', 'c.comment_id') over the comments matching 'where'.
+    Yields (group value, unigram Counter, bigram Counter) in group order.
+    The query can refer to comments as c, sections as sec and submissions as s.
+    """
+    rows = conn.execute(f"""
+        SELECT {group_column}, t.ngram, t.term, SUM(t.term_count)
+        FROM comment_terms t
+        JOIN comments c ON c.comment_id = t.comment_id
+        JOIN sections sec ON c.section_id = sec.section_id
+        LEFT JOIN submissions s ON c.submission_id = s.submission_id
+        WHERE {where}
+        GROUP BY 1, 2, 3
+        ORDER BY 1
+    """, params)
+    for group_value, group_rows in itertools.groupby(rows, key=lambda row: row[0]):
+        unigrams, bigrams = Counter(), Counter()
+        for _, ngram, term, count in group_rows:
+            (unigrams if ngram == 1 else bigrams)[term] = count
+        yield group_value, unigrams, bigrams
+
+
+def word_totals(conn, group_column, where="1", params=()):
+    """Returns {group value: (indexed comments, total words)} over the comments matching 'where'."""
+    rows = conn.execute(f"""
+        SELECT {group_column}, COUNT(*), SUM(i.word_count)
+        FROM comment_terms_indexed i
+        JOIN comments c ON c.comment_id = i.comment_id
+        JOIN sections sec ON c.section_id = sec.section_id
+        LEFT JOIN submissions s ON c.submission_id = s.submission_id
+        WHERE {where}
+        GROUP BY 1
+    """, params)
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def run_token_index():
+    """Brings the token index of DATABASE_FILE up to date and reports its size."""
+    conn = sqlite3.connect(DATABASE_FILE, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        build_token_index(conn)
+        terms, comments = conn.execute(
+            "SELECT (SELECT COUNT(*) FROM comment_terms), (SELECT COUNT(*) FROM comment_terms_indexed)"
+        ).fetchone()
+        print(f"Token index holds {terms} term counts for {comments} comments.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    run_token_index()
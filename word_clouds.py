@@ -1,149 +1,246 @@
 import sqlite3
 import os
 import re
+import hashlib
 from collections import Counter
-import spacy
+from concurrent.futures import ProcessPoolExecutor
 from wordcloud import WordCloud
-from nltk.util import ngrams
 from tqdm import tqdm
+from database_setup import migrate_schema, bump_draft_generations, BUSY_TIMEOUT_SECONDS
+from db_streaming import iter_keyset_chunks
+from token_index import build_token_index, iter_term_counts, word_totals
 
 # --- Configuration ---
 DATABASE_FILE = "econsultation.db"
 # A single, organized folder for all our images
 OUTPUT_FOLDER = "static/wordclouds"
+# Processes used to render PNGs.
+RENDER_WORKERS = os.cpu_count() or 1
+# Rendering settings. They are part of every cloud's content hash, so changing
+# them re-renders everything on the next run.
+WORD_CLOUD_SETTINGS = dict(
+    width=1200, height=600, background_color='white',
+    colormap='magma', collocations=False, contour_width=1, contour_color='grey'
+)
+# Per-comment PNGs, which comments.word_cloud_image_path points at. /api/terms
+# serves term lists for any comment subset; turning this off leaves existing
+# paths pointing at clouds that are no longer refreshed.
+RENDER_COMMENT_CLOUDS = True
+# Key phrases added to multi-comment clouds.
+TOP_PHRASES = 30
+
+
+def content_hash(cloud_input):
+    """Hash of a cloud's inputs (see plan_word_cloud) plus the rendering settings."""
+    comment_total, word_total, unigrams, bigrams = cloud_input
+    digest = hashlib.sha256(repr((
+        sorted(WORD_CLOUD_SETTINGS.items()), comment_total, word_total,
+        sorted(unigrams.items()), sorted(bigrams.items())
+    )).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_frequencies(unigrams, bigrams, multi):
+    """
+    Word frequencies for one cloud. Multi-comment clouds also get their most
+    common repeated bigrams as key phrases.
+    """
+    word_counts = unigrams.copy()
+    if multi:
+        top_phrases = {phrase.replace(" ", "_"): count for phrase, count in bigrams.most_common(TOP_PHRASES) if count > 1}
+        word_counts.update(top_phrases)
+    return word_counts
 
-# --- NLP Model Setup ---
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    print("Spacy model 'en_core_web_sm' not found. Please run 'python -m spacy download en_core_web_sm'")
-    exit()
 
-CUSTOM_STOP_WORDS = [
-    'user', 'comment', 'suggestion', 'propose', 'draft', 'legislation', 'amendment', 'provision',
-    'section', 'act', 'rule', 'mca', 'stakeholder', 'company', 'government', 'clause',
-    'say', 'propose', 'recommend', 'proviso', 'submit', 'state'
-]
+def render_word_cloud(frequencies, image_path):
+    """
+    Renders and saves one word cloud. Runs in a worker process. The image is
+    written to a temporary file and renamed into place, so the Flask
+    /wordclouds route never serves a half-written PNG.
+    """
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    wc = WordCloud(**WORD_CLOUD_SETTINGS).generate_from_frequencies(frequencies)
+    folder, filename = os.path.split(image_path)
+    temp_path = os.path.join(folder, f".{os.getpid()}.{filename}")
+    wc.to_file(temp_path)
+    os.replace(temp_path, image_path)
+    return image_path
 
-def generate_word_cloud(text_list, identifier, subfolder):
+
+def plan_word_cloud(cloud_input, identifier, subfolder):
     """
-    A generic function to generate and save a word cloud image for a given list of texts.
+    Decides what to render for one cloud from its summed token index counts,
+    a (comment count, word count, unigrams, bigrams) tuple. Returns the
+    frequencies and target path, or None to skip.
     'identifier' can be a draft_id, section_id, or comment_id.
     'subfolder' will be 'drafts', 'sections', or 'comments'.
     """
-    if not text_list:
+    comment_total, word_total, unigrams, bigrams = cloud_input
+    if not comment_total:
         print(f"    - No text provided for {identifier}, skipping.")
         return None
 
-    full_text = " ".join(text_list)
-    if len(full_text.split()) < 5: # Don't generate for very short comments
+    if word_total < 5: # Don't generate for very short comments
         print(f"    - Not enough text for {identifier}, skipping.")
         return None
 
-    # 1. Clean and Lemmatize
-    doc = nlp(full_text)
-    meaningful_words = [
-        token.lemma_.lower() for token in doc
-        if not token.is_stop and not token.is_punct and token.pos_ in ['NOUN', 'PROPN', 'VERB', 'ADJ']
-        and token.lemma_.lower() not in CUSTOM_STOP_WORDS
-    ]
-    
-    # 2. Identify Key Phrases (only for multi-comment clouds)
-    if len(text_list) > 1:
-        bigram_counts = Counter(ngrams(meaningful_words, 2))
-        top_phrases = {"_".join(phrase): count for phrase, count in bigram_counts.most_common(30) if count > 1}
-    else:
-        top_phrases = {}
-        
-    # 3. Combine Counts
-    word_counts = Counter(meaningful_words)
-    word_counts.update(top_phrases)
-
+    word_counts = build_frequencies(unigrams, bigrams, multi=comment_total > 1)
     if not word_counts:
         print(f"    - No meaningful words for {identifier}, skipping.")
         return None
 
-    # 4. Generate Image
-    wc = WordCloud(
-        width=1200, height=600, background_color='white',
-        colormap='magma', collocations=False, contour_width=1, contour_color='grey'
-    ).generate_from_frequencies(word_counts)
+    return word_counts, os.path.join(OUTPUT_FOLDER, subfolder, f"{identifier}.png")
 
-    # 5. Save Image
-    final_output_folder = os.path.join(OUTPUT_FOLDER, subfolder)
-    if not os.path.exists(final_output_folder):
-        os.makedirs(final_output_folder)
 
-    image_path = os.path.join(final_output_folder, f"{identifier}.png")
-    wc.to_file(image_path)
-    
-    return image_path
+def collect_cloud_inputs(conn, entity_ids, group_column, where="1", params=()):
+    """Returns {entity id: (comment count, word count, unigrams, bigrams)} from the token index."""
+    totals = word_totals(conn, group_column, where, params)
+    counts = {key: (unigrams, bigrams) for key, unigrams, bigrams in iter_term_counts(conn, group_column, where, params)}
+    empty = (Counter(), Counter())
+    return {
+        entity_id: (*totals.get(entity_id, (0, 0)), *counts.get(entity_id, empty))
+        for entity_id in entity_ids
+    }
+
+
+def load_cloud_hashes(conn, cloud_keys):
+    """Returns {cloud_key: (content_hash, image_path)} for the given keys."""
+    found = {}
+    for i in range(0, len(cloud_keys), 500):
+        chunk = cloud_keys[i:i + 500]
+        rows = conn.execute(
+            f"SELECT cloud_key, content_hash, image_path FROM word_cloud_state WHERE cloud_key IN ({','.join('?' * len(chunk))})",
+            chunk
+        ).fetchall()
+        found.update({row[0]: (row[1], row[2]) for row in rows})
+    return found
+
+
+def render_changed_clouds(conn, pool, cloud_inputs, prefix, subfolder, progress=None):
+    """
+    Renders the clouds whose inputs changed since their last render.
+    'cloud_inputs' maps entity ids to collect_cloud_inputs tuples. Returns the
+    (image_path, entity_id) pairs that were (re)rendered.
+    """
+    keyed = [(entity_id, f"{prefix}_{entity_id}", cloud_input, content_hash(cloud_input))
+             for entity_id, cloud_input in cloud_inputs.items()]
+    previous = load_cloud_hashes(conn, [identifier for _, identifier, _, _ in keyed])
+
+    futures = []
+    for entity_id, identifier, cloud_input, new_hash in keyed:
+        old = previous.get(identifier)
+        if old and old[0] == new_hash and (old[1] is None or os.path.exists(old[1])):
+            continue
+        plan = plan_word_cloud(cloud_input, identifier, subfolder)
+        if plan is None:
+            # Remember the skip so unchanged short texts aren't re-examined every run.
+            conn.execute(
+                "INSERT OR REPLACE INTO word_cloud_state (cloud_key, content_hash, image_path) VALUES (?, ?, NULL)",
+                (identifier, new_hash)
+            )
+            continue
+        frequencies, image_path = plan
+        futures.append((entity_id, identifier, new_hash, pool.submit(render_word_cloud, frequencies, image_path)))
+
+    rendered = []
+    for entity_id, identifier, new_hash, future in futures:
+        try:
+            image_path = future.result()
+        except Exception as e:
+            print(f"    - Could not render {identifier}: {e}")
+            continue
+        conn.execute(
+            "INSERT OR REPLACE INTO word_cloud_state (cloud_key, content_hash, image_path) VALUES (?, ?, ?)",
+            (identifier, new_hash, image_path)
+        )
+        rendered.append((image_path, entity_id))
+        if progress:
+            progress.update(1)
+    conn.commit()
+    return rendered
+
+
+def render_comment_clouds(conn, pool):
+    """Renders the changed single-comment clouds one keyset page at a time."""
+    comment_updates = []
+    with tqdm(desc="Processing Comments") as progress:
+        for chunk in iter_keyset_chunks(conn, "SELECT comment_id FROM comment_terms_indexed WHERE 1"):
+            comment_ids = [row[0] for row in chunk]
+            comment_inputs = collect_cloud_inputs(
+                conn, comment_ids, "c.comment_id", "c.comment_id BETWEEN ? AND ?", (comment_ids[0], comment_ids[-1])
+            )
+            rendered = render_changed_clouds(conn, pool, comment_inputs, "comment", "comments", progress)
+            if rendered:
+                conn.executemany("UPDATE comments SET word_cloud_image_path = ? WHERE comment_id = ?", rendered)
+                conn.commit()
+            comment_updates.extend(rendered)
+    return comment_updates
 
 
 def run_all_word_cloud_generation():
     """
     Main orchestrator to generate word clouds for all levels:
-    Drafts, Sections, and Individual Comments.
+    Drafts, Sections, and Individual Comments. Comments are tokenized once
+    into the token index; every cloud is a sum of its comments' counts, and
+    only clouds whose counts changed since the last run are re-rendered, on a
+    pool of RENDER_WORKERS processes.
     """
     conn = None
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
+        conn = sqlite3.connect(DATABASE_FILE, timeout=BUSY_TIMEOUT_SECONDS)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         print("Successfully connected to the database.")
-
-        # --- Part 1: Generate Draft-Level Word Clouds ---
-        print("\n--- Starting Part 1: Draft-Level Word Clouds ---")
-        cursor.execute("SELECT draft_id FROM drafts")
-        draft_ids = [row['draft_id'] for row in cursor.fetchall()]
-        draft_updates = []
-        for draft_id in tqdm(draft_ids, desc="Processing Drafts"):
-            cursor.execute("SELECT c.comment_text FROM comments c JOIN submissions s ON c.submission_id = s.submission_id WHERE s.draft_id = ? AND c.comment_text IS NOT NULL", (draft_id,))
-            comments = [row['comment_text'] for row in cursor.fetchall()]
-            image_path = generate_word_cloud(comments, f"draft_{draft_id}", "drafts")
-            if image_path: draft_updates.append((image_path, draft_id))
-        
-        if draft_updates:
-            cursor.executemany("UPDATE drafts SET word_cloud_image_path = ? WHERE draft_id = ?", draft_updates)
+        migrate_schema(conn)
+        build_token_index(conn)
+
+        total_rendered = 0
+        with ProcessPoolExecutor(max_workers=RENDER_WORKERS) as pool:
+            # --- Part 1: Generate Draft-Level Word Clouds ---
+            print("\n--- Starting Part 1: Draft-Level Word Clouds ---")
+            cursor.execute("SELECT draft_id FROM drafts")
+            draft_ids = [row['draft_id'] for row in cursor.fetchall()]
+            # A draft's cloud covers its submissions' comments, as it always has.
+            draft_inputs = collect_cloud_inputs(conn, draft_ids, "s.draft_id")
+            draft_updates = render_changed_clouds(conn, pool, draft_inputs, "draft", "drafts")
+
+            if draft_updates:
+                cursor.executemany("UPDATE drafts SET word_cloud_image_path = ? WHERE draft_id = ?", draft_updates)
+                conn.commit()
             print(f"Successfully updated {len(draft_updates)} drafts.")
 
 
-        # --- Part 2: Generate Section-Level Word Clouds ---
-        print("\n--- Starting Part 2: Section-Level Word Clouds ---")
-        cursor.execute("SELECT section_id FROM sections")
-        section_ids = [row['section_id'] for row in cursor.fetchall()]
-        section_updates = []
-        for section_id in tqdm(section_ids, desc="Processing Sections"):
-            cursor.execute("SELECT comment_text FROM comments WHERE section_id = ? AND comment_text IS NOT NULL", (section_id,))
-            comments = [row['comment_text'] for row in cursor.fetchall()]
-            image_path = generate_word_cloud(comments, f"section_{section_id}", "sections")
-            if image_path: section_updates.append((image_path, section_id))
+            # --- Part 2: Generate Section-Level Word Clouds ---
+            print("\n--- Starting Part 2: Section-Level Word Clouds ---")
+            cursor.execute("SELECT section_id FROM sections")
+            section_ids = [row['section_id'] for row in cursor.fetchall()]
+            section_inputs = collect_cloud_inputs(conn, section_ids, "c.section_id")
+            section_updates = render_changed_clouds(conn, pool, section_inputs, "section", "sections")
 
-        if section_updates:
-            cursor.executemany("UPDATE sections SET word_cloud_image_path = ? WHERE section_id = ?", section_updates)
+            if section_updates:
+                cursor.executemany("UPDATE sections SET word_cloud_image_path = ? WHERE section_id = ?", section_updates)
+                conn.commit()
             print(f"Successfully updated {len(section_updates)} sections.")
 
-        
-        # --- Part 3: Generate Individual Comment-Level Word Clouds ---
-        print("\n--- Starting Part 3: Individual Comment-Level Word Clouds ---")
-        cursor.execute("SELECT comment_id, comment_text FROM comments WHERE comment_text IS NOT NULL")
-        all_comments = cursor.fetchall()
-        comment_updates = []
-        for comment in tqdm(all_comments, desc="Processing Comments"):
-            comment_id = comment['comment_id']
-            comment_text = comment['comment_text']
-            # Pass the text as a list with one item
-            image_path = generate_word_cloud([comment_text], f"comment_{comment_id}", "comments")
-            if image_path: comment_updates.append((image_path, comment_id))
-        
-        if comment_updates:
-             cursor.executemany("UPDATE comments SET word_cloud_image_path = ? WHERE comment_id = ?", comment_updates)
-             print(f"Successfully updated {len(comment_updates)} comments.")
-        
-        conn.commit()
+
+            # --- Part 3: Generate Individual Comment-Level Word Clouds ---
+            comment_updates = []
+            if not RENDER_COMMENT_CLOUDS:
+                print("\n--- Skipping Part 3: comment-level terms are served by /api/terms ---")
+            else:
+                print("\n--- Starting Part 3: Individual Comment-Level Word Clouds ---")
+                comment_updates = render_comment_clouds(conn, pool)
+            print(f"Successfully updated {len(comment_updates)} comments.")
+
+            total_rendered = len(draft_updates) + len(section_updates) + len(comment_updates)
+
+        if total_rendered:
+            # New image paths change the API responses, so invalidate their cached copies.
+            bump_draft_generations(conn)
 
     except Exception as e:
         print(f"An error occurred: {e}")
+        raise
     finally:
         if conn:
             conn.close()
@@ -151,4 +248,4 @@ def run_all_word_cloud_generation():
 
 
 if __name__ == '__main__':
-    run_all_word_cloud_generation()
\ No newline at end of file
+    run_all_word_cloud_generation()